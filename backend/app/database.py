@@ -1,8 +1,12 @@
 import os
+import socket
 import logging
-from pymongo import MongoClient
+from typing import Optional
+from pymongo import MongoClient, UpdateOne
 from pymongo.database import Database
 from dotenv import load_dotenv
+from app.utils.mongo import try_acquire_lease
+from app.utils.text import normalize_destination
 
 # Load environment variables
 load_dotenv()
@@ -15,44 +19,218 @@ if not MONGODB_URI:
     logging.warning("MONGODB_URI not found in environment variables. Using default connection string.")
     MONGODB_URI = "mongodb://localhost:27017"
     
-logging.info(f"Connecting to database: {DB_NAME}")
+# Connection pool sizing, per worker process. The total number of
+# connections a deployment opens is roughly workers * MONGO_MAX_POOL_SIZE.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
 
-try:
-    # Create MongoDB client with a timeout to avoid hanging
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    
-    # Test connection
-    client.admin.command('ping')
-    logging.info("Successfully connected to MongoDB Atlas")
-    
-    # Get or create database
-    db = client[DB_NAME]
-    
-    # Create collections if they don't exist
-    if "users" not in db.list_collection_names():
-        db.create_collection("users")
-        db.users.create_index("email", unique=True)
-        db.users.create_index("username", unique=True)
-        logging.info("Created users collection with indexes")
+# MongoClient is not fork-safe, so it is created lazily in the process that
+# uses it (each worker, after fork) rather than at import time.
+client: Optional[MongoClient] = None
+db: Optional[Database] = None
+_client_pid: Optional[int] = None
+
+
+# Startup migrations run in one worker at a time, under this lease
+MIGRATION_LEASE_SECONDS = float(os.environ.get("MIGRATION_LEASE_SECONDS", "600"))
+MIGRATION_BATCH_SIZE = 1000
+
+
+def backfill_destination_keys(database: Database):
+    """
+    Set destination_key on intents (live and archived) created before it
+    existed. Listings and group suggestions filter on it; a no-op once done.
+
+    Every worker calls this at startup; the first one to take the lease does
+    the work in batches while the others carry on booting.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not try_acquire_lease(database, "backfill-destination-keys", owner, MIGRATION_LEASE_SECONDS):
+        return
+    for name in ("travel_intents", "travel_intents_archive"):
+        missing = database[name].find({"destination_key": {"$exists": False}}, {"destination": 1})
+        operations = []
+        total = 0
+        for intent in missing:
+            operations.append(UpdateOne(
+                {"_id": intent["_id"]},
+                {"$set": {"destination_key": normalize_destination(intent.get("destination", ""))}}
+            ))
+            if len(operations) == MIGRATION_BATCH_SIZE:
+                database[name].bulk_write(operations, ordered=False)
+                total += len(operations)
+                operations = []
+        if operations:
+            database[name].bulk_write(operations, ordered=False)
+            total += len(operations)
+        if total:
+            logging.info(f"Backfilled destination_key on {total} documents in {name}")
+
+
+def ensure_collections(database: Database):
+    """Create collections and indexes the API relies on"""
+    existing = database.list_collection_names()
+
+    if "users" not in existing:
+        database.create_collection("users")
+        logging.info("Created users collection")
+    # Registration relies on these to reject duplicates, so make sure they
+    # exist even on databases created before they were added (no-op if present)
+    database.users.create_index("email", unique=True)
+    database.users.create_index("username", unique=True)
+    # Per-worker availability filters catch up on new users in (created_at, _id) pages
+    database.users.create_index([("created_at", 1), ("_id", 1)])
     
-    if "groups" not in db.list_collection_names():
-        db.create_collection("groups")
+    if "groups" not in existing:
+        database.create_collection("groups")
         logging.info("Created groups collection")
     
-    if "messages" not in db.list_collection_names():
-        db.create_collection("messages")
+    if "messages" not in existing:
+        database.create_collection("messages")
         logging.info("Created messages collection")
         
-    if "travel_intents" not in db.list_collection_names():
-        db.create_collection("travel_intents")
-        db.travel_intents.create_index([("destination", 1)])
-        db.travel_intents.create_index([("user_id", 1)])
-        db.travel_intents.create_index([("created_at", -1)])
-        logging.info("Created travel_intents collection with indexes")
+    if "travel_intents" not in existing:
+        database.create_collection("travel_intents")
+        logging.info("Created travel_intents collection")
+    # Like the users indexes, every index below is ensured on each start, so
+    # collections created before an index was added get it too
+    database.travel_intents.create_index([("destination", 1)])
+    database.travel_intents.create_index([("user_id", 1)])
+    database.travel_intents.create_index([("created_at", -1)])
+    # Used by the archival job to find expired intents
+    database.travel_intents.create_index([("end_date", 1)])
+    database.travel_intents.create_index([("start_date", 1)])
+
+    if "travel_intents_archive" not in existing:
+        database.create_collection("travel_intents_archive")
+        logging.info("Created travel_intents_archive collection")
+    database.travel_intents_archive.create_index([("user_id", 1)])
+    database.travel_intents_archive.create_index([("created_at", -1)])
+    # Rollup recounts read archived intents by destination and month, and the
+    # rollup backfill looks for intents archived while it ran
+    database.travel_intents_archive.create_index([("destination_key", 1), ("start_date", 1)])
+    database.travel_intents_archive.create_index([("archived_at", 1)])
+
+    if "intent_feeds" not in existing:
+        database.create_collection("intent_feeds")
+        logging.info("Created intent_feeds collection")
+    database.intent_feeds.create_index([("user_id", 1), ("score", -1), ("intent_id", -1)])
+    database.intent_feeds.create_index([("user_id", 1), ("intent_id", 1)], unique=True)
+    database.intent_feeds.create_index([("intent_id", 1)])
+
+    if "intent_interests" not in existing:
+        database.create_collection("intent_interests")
+        logging.info("Created intent_interests collection")
+    # One interest per user and intent; the counter on the intent relies on it
+    database.intent_interests.create_index([("intent_id", 1), ("user_id", 1)], unique=True)
+    database.intent_interests.create_index([("intent_id", 1), ("_id", -1)])
+    database.intent_interests.create_index([("user_id", 1), ("_id", -1)])
+
+    if "chat_sessions" not in existing:
+        database.create_collection("chat_sessions")
+        logging.info("Created chat_sessions collection")
+    if "chat_turns" not in existing:
+        database.create_collection("chat_turns")
+        logging.info("Created chat_turns collection")
+    database.chat_sessions.create_index([("user_id", 1), ("updated_at", -1)])
+    database.chat_turns.create_index([("session_id", 1), ("seq", -1)], unique=True)
+
+    if "group_suggestions" not in existing:
+        database.create_collection("group_suggestions")
+        logging.info("Created group_suggestions collection")
+    database.group_suggestions.create_index([("bucket", 1)])
+    database.group_suggestions.create_index([("intent_ids", 1)])
+    database.group_suggestions.create_index([("user_ids", 1), ("score", -1)])
+    database.group_suggestions.create_index([("destination_key", 1), ("score", -1)])
+
+    if "intent_rollups" not in existing:
+        database.create_collection("intent_rollups")
+        logging.info("Created intent_rollups collection")
+    # Rollups are keyed by "destination|month"; trending reads a range of months
+    database.intent_rollups.create_index([("month", 1), ("intent_count", -1)])
+    # The backfill finds rollups updated while it ran
+    database.intent_rollups.create_index([("updated_at", 1)])
+    # Group suggestion buckets are read by normalized destination and start date
+    database.travel_intents.create_index([("destination_key", 1), ("start_date", 1)])
+    # Intent listings filter by destination or author and sort newest first
+    database.travel_intents.create_index([("destination_key", 1), ("created_at", -1), ("_id", -1)])
+    backfill_destination_keys(database)
+    database.travel_intents.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    database.travel_intents.create_index([("created_at", -1), ("_id", -1)])
+
+    if "geocode_cache" not in existing:
+        # Keyed by normalized location name; filled offline from a gazetteer
+        database.create_collection("geocode_cache")
+        logging.info("Created geocode_cache collection")
+
+    if "media" not in existing:
+        database.create_collection("media")
+        logging.info("Created media collection")
+    database.media.create_index([("owner_id", 1), ("created_at", -1)])
+    database.media.create_index([("sha256", 1)])
+
+    if "feed_profiles" not in existing:
+        database.create_collection("feed_profiles")
+        logging.info("Created feed_profiles collection")
+    database.feed_profiles.create_index([("destinations", 1)])
+    database.feed_profiles.create_index([("activities", 1)])
+    database.feed_profiles.create_index([("travel_styles", 1)])
+
+
+def init_db() -> Database:
+    """Connect to MongoDB from the current process"""
+    global client, db, _client_pid
+
+    if db is not None and _client_pid == os.getpid():
+        return db
+
+    logging.info(f"Connecting to database: {DB_NAME} (pid {os.getpid()})")
+
+    try:
+        # Create MongoDB client with a timeout to avoid hanging
+        client = MongoClient(
+            MONGODB_URI,
+            serverSelectionTimeoutMS=5000,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+        )
+        
+        # Test connection
+        client.admin.command('ping')
+        logging.info("Successfully connected to MongoDB Atlas")
         
-except Exception as e:
-    logging.error(f"Failed to connect to MongoDB: {e}")
-    raise
+        # Get or create database
+        db = client[DB_NAME]
+        _client_pid = os.getpid()
+        ensure_collections(db)
+    except Exception as e:
+        logging.error(f"Failed to connect to MongoDB: {e}")
+        raise
+
+    return db
+
+
+def close_db():
+    """Close this process's MongoDB client, letting in-flight operations finish"""
+    global client, db, _client_pid
+
+    if client is not None and _client_pid == os.getpid():
+        client.close()
+        logging.info("Closed MongoDB connection")
+    client = None
+    db = None
+    _client_pid = None
+
+
+def _reset_after_fork():
+    # The parent's client must not be used (or closed) in the child
+    global client, db, _client_pid
+    client = None
+    db = None
+    _client_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 # Dependency to get database
 def get_db() -> Database:
@@ -60,13 +238,15 @@ def get_db() -> Database:
     Dependency function to get the MongoDB database connection.
     Returns an instance of the database.
     """
-    return db
+    if db is not None and _client_pid == os.getpid():
+        return db
+    return init_db()
 
 async def test_connection():
     """Test the MongoDB connection."""
     try:
         # The ping command is lightweight and doesn't require auth
-        client.admin.command('ping')
+        get_db().client.admin.command('ping')
         logging.info("MongoDB connection is healthy")
         return True
     except Exception as e:
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import os
@@ -12,49 +13,114 @@ logging.basicConfig(
 logger = logging.getLogger("backpacker-api")
 
 # Import routers directly from the routers package
-from app.database import test_connection
+from app.database import test_connection, get_db, init_db, close_db
 from app.routers.auth import router as auth_router
 from app.routers.users import router as users_router
 from app.routers.travel_intents import router as travel_intents_router
 from app.routers import chat  # Import our chat router
+from app.routers.media import router as media_router
+from app.routers.itineraries import router as itineraries_router
+from app.routers.group_suggestions import router as group_suggestions_router
+from app.routers.stats import router as stats_router
+from app.utils.llm import get_llm_client, reset_llm_clients, CHAT_POOL, BACKGROUND_POOL
+from app.utils.rate_limit import RateLimitMiddleware, MongoBucketStore, InFlightLoad
+from app.services.search import start_search_index, stop_search_index
+from app.services.archival import start_archival, stop_archival
+from app.services.group_suggestions import start_group_suggestions, stop_group_suggestions
+from app.services.availability import start_availability_index, stop_availability_index
+from app.services.counters import start_counters, stop_counters
+from app.utils.process_pool import shutdown_process_pool
 
 # Load environment variables
 load_dotenv()
 
-# Create FastAPI app
-app = FastAPI(
-    title="Backpacker Connect API",
-    description="API for connecting backpackers and travelers",
-    version="0.1.0"
-)
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker process after it has been started, so every
+    # worker owns its own MongoDB connection pool and LLM clients
+    logger.info(f"Worker {os.getpid()} starting")
+    db = init_db()
+    get_llm_client(CHAT_POOL)
+    get_llm_client(BACKGROUND_POOL)
+    await start_search_index(db)
+    await start_availability_index(db)
+    await start_counters(db)
+    await start_archival(db, app.state.load.fraction)
+    await start_group_suggestions(db)
+    yield
+    # The server has stopped accepting connections and drained in-flight
+    # requests by now; release per-worker resources
+    await stop_group_suggestions()
+    await stop_archival()
+    await stop_counters()
+    await stop_search_index()
+    await stop_availability_index()
+    reset_llm_clients()
+    shutdown_process_pool()
+    close_db()
+    logger.info(f"Worker {os.getpid()} stopped")
+
+
+def create_app() -> FastAPI:
+    """Build the API application. Called once per worker process."""
+    app = FastAPI(
+        title="Backpacker Connect API",
+        description="API for connecting backpackers and travelers",
+        version="0.1.0",
+        lifespan=lifespan
+    )
+
+    # Rate limiting and load shedding. Added before CORS so that CORS stays the
+    # outermost layer and rejections still carry CORS headers.
+    # RATE_LIMIT_STORE=mongo shares bucket state across worker processes.
+    rate_limit_store = None
+    if os.environ.get("RATE_LIMIT_STORE", "memory").lower() == "mongo":
+        rate_limit_store = MongoBucketStore(lambda: get_db().rate_limits)
+    # In-flight request count, read by background jobs to back off under load
+    app.state.load = InFlightLoad()
+    app.add_middleware(RateLimitMiddleware, store=rate_limit_store, load=app.state.load)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # Frontend URL
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Pagination cursor of GET /api/travel-intents
+        expose_headers=["X-Next-Cursor"],
+    )
+
+    # Include routers
+    app.include_router(auth_router)
+    app.include_router(users_router)
+    app.include_router(travel_intents_router)
+    app.include_router(chat.router)  # Add our chat router
+    app.include_router(media_router)
+    app.include_router(itineraries_router)
+    app.include_router(group_suggestions_router)
+    app.include_router(stats_router)
+
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to Backpacker Connect API"}
+
+    @app.get("/health")
+    async def health_check():
+        db_connected = await test_connection()
+        return {
+            "status": "healthy" if db_connected else "unhealthy",
+            "database_connected": db_connected
+        }
 
-# Include routers
-app.include_router(auth_router)
-app.include_router(users_router)
-app.include_router(travel_intents_router)
-app.include_router(chat.router)  # Add our chat router
+    return app
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to Backpacker Connect API"}
 
-@app.get("/health")
-async def health_check():
-    db_connected = await test_connection()
-    return {
-        "status": "healthy" if db_connected else "unhealthy",
-        "database_connected": db_connected
-    }
+# Module-level app for `uvicorn app.main:app --reload` during development.
+# Production runs use the factory through `python -m app.server`.
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("app.main:create_app", factory=True, host="0.0.0.0", port=8000, reload=True)
@@ -1,6 +1,6 @@
 from app.models.user import (
     UserBase, UserCreate, UserLogin, UserProfile, UserInDB, 
-    UserResponse, UserUpdate, Token, TokenData, 
+    UserResponse, UserSummary, UserUpdate, Token, TokenData, 
     TravelStyle, TravelExperience
 )
 from app.models.travel_intent import (
@@ -18,5 +18,6 @@ from app.models.message import (
 from app.models.itinerary import (
     ItineraryBase, ItineraryCreate, ItineraryInDB, 
     ItineraryResponse, ItineraryUpdate, ItineraryDay, 
-    ItineraryActivity, AIItineraryRequest
+    ItineraryActivity, AIItineraryRequest, ItineraryOptimizeRequest,
+    OptimizedItineraryDay, ItineraryOptimizeResponse
 ) 
\ No newline at end of file
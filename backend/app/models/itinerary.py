@@ -75,4 +75,20 @@ class AIItineraryRequest(BaseModel):
     interests: List[str] = []
     budget_level: Optional[str] = None
     travel_style: Optional[str] = None
-    special_requirements: Optional[str] = None 
\ No newline at end of file
+    special_requirements: Optional[str] = None 
+
+class ItineraryOptimizeRequest(BaseModel):
+    days: List[ItineraryDay]
+
+
+class OptimizedItineraryDay(ItineraryDay):
+    # Path length through the stops with known coordinates, before and after
+    original_distance_km: float = 0.0
+    optimized_distance_km: float = 0.0
+    # Locations that could not be resolved; those stops keep their slot
+    # relative to timed stops and otherwise move to the end of the day
+    unresolved_locations: List[str] = []
+
+
+class ItineraryOptimizeResponse(BaseModel):
+    days: List[OptimizedItineraryDay]
@@ -38,7 +38,8 @@ class TravelIntentInDB(TravelIntentBase):
     created_at: datetime
     updated_at: datetime
     is_active: bool = True
-    interested_users: List[str] = []
+    # Who is interested lives in the intent_interests collection
+    interested_users_count: int = 0
     group_id: Optional[str] = None
 
 
@@ -4,6 +4,7 @@ from datetime import datetime
 from enum import Enum
 from bson import ObjectId
 from typing import ClassVar, Annotated, Any
+from app.utils.mongo import normalize_doc, construct
 
 
 class TravelStyle(str, Enum):
@@ -65,6 +66,14 @@ class UserResponse(UserBase):
     }
 
 
+class UserSummary(BaseModel):
+    """Compact author card embedded in listings"""
+    id: str
+    name: str = ""
+    username: str = ""
+    profile_image_url: str = ""
+
+
 class UserUpdate(BaseModel):
     username: Optional[str] = Field(None, min_length=3, max_length=50)
     full_name: Optional[str] = Field(None, min_length=2, max_length=100)
@@ -144,20 +153,20 @@ class User(BaseModel):
     
     @classmethod
     def from_mongo(cls, data: Dict[str, Any]):
-        """Convert MongoDB document to User model"""
+        """Convert MongoDB document to a validated User model"""
+        if not data:
+            return None
+        return cls(**normalize_doc(data))
+
+    @classmethod
+    def from_mongo_trusted(cls, data: Dict[str, Any]):
+        """
+        Build a User from a document read from our own database without
+        re-validating it. Use on read paths only; input must go through `cls(...)`.
+        """
         if not data:
             return None
-            
-        # Convert _id to id string
-        if "_id" in data:
-            data["id"] = str(data.pop("_id"))
-            
-        # Convert any other ObjectId fields
-        for k, v in data.items():
-            if isinstance(v, ObjectId):
-                data[k] = str(v)
-                
-        return cls(**data)
+        return construct(cls, normalize_doc(data))
         
     def to_mongo(self) -> Dict[str, Any]:
         """Convert User model to MongoDB document"""
@@ -8,7 +8,10 @@ from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from app.models.user import User, UserResponse
 from app.database import get_db
+from app.utils.mongo import utcnow, get_adapter
+from app.services.availability import is_available, record_user
 from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import json
 
@@ -40,6 +43,10 @@ class TokenResponse(BaseModel):
     token: str
     user: Dict[str, Any]
 
+class AvailabilityResponse(BaseModel):
+    username: Optional[bool] = None
+    email: Optional[bool] = None
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -74,24 +81,11 @@ def serialize_mongo_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
 
 @router.post("/register", response_model=TokenResponse)
 async def register_user(user_data: UserRegister, db: Database = Depends(get_db)):
-    # Check if email already exists
-    if db.users.find_one({"email": user_data.email}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Check if username already exists
-    if db.users.find_one({"username": user_data.username}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already taken"
-        )
-    
     # Hash the password
     hashed_password = get_password_hash(user_data.password)
     
     # Create user document
+    now = utcnow()
     new_user = {
         "name": user_data.name,
         "username": user_data.username,
@@ -99,21 +93,35 @@ async def register_user(user_data: UserRegister, db: Database = Depends(get_db))
         "password": hashed_password,
         "bio": "",
         "profile_image_url": "",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "version": 1,
+        "created_at": now,
+        "updated_at": now
     }
     
-    # Insert into database
-    result = db.users.insert_one(new_user)
+    # Insert into database; the unique indexes on email and username
+    # reject duplicates without separate lookups
+    try:
+        db.users.insert_one(new_user)
+    except DuplicateKeyError as e:
+        # keyPattern names the violated index; older servers only say it in the message
+        key_pattern = (e.details or {}).get("keyPattern") or str(e)
+        if "username" in key_pattern:
+            detail = "Username already taken"
+        else:
+            detail = "Email already registered"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
     
-    # Create JWT token
-    token = create_jwt_token(str(result.inserted_id))
+    # Live availability checks in this worker see the new user immediately
+    record_user(new_user)
     
-    # Retrieve the created user
-    created_user = db.users.find_one({"_id": result.inserted_id})
+    # Create JWT token (insert_one added the generated _id to new_user)
+    token = create_jwt_token(str(new_user["_id"]))
     
-    # Convert MongoDB document to serializable dict
-    user_dict = serialize_mongo_doc(created_user)
+    # Convert the document we just wrote to a serializable dict
+    user_dict = serialize_mongo_doc(new_user)
     
     # Remove password from response
     if "password" in user_dict:
@@ -124,6 +132,37 @@ async def register_user(user_data: UserRegister, db: Database = Depends(get_db))
         "user": user_dict
     }
 
+@router.get("/availability", response_model=AvailabilityResponse)
+async def check_availability(
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """
+    Check whether a username and/or email is still free, for live signup
+    form feedback. Most checks are answered from memory.
+    """
+    if username is None and email is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide a username or an email"
+        )
+    
+    result = {}
+    if username is not None:
+        result["username"] = is_available(db, "username", username)
+    if email is not None:
+        try:
+            # Registration stores emails as normalized by EmailStr
+            email = get_adapter(EmailStr).validate_python(email)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid email address"
+            )
+        result["email"] = is_available(db, "email", email)
+    return result
+
 @router.post("/login", response_model=TokenResponse)
 async def login_user(user_data: UserLogin, db: Database = Depends(get_db)):
     # Find user by email
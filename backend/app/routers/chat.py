@@ -1,29 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage
+from pymongo.database import Database
+from app.database import get_db
+from app.services.chat_sessions import (
+    SessionNotFound, CachedSession, create_session, get_session_doc, load_session,
+    append_turn, get_turns, save_summary, delete_session
+)
+from app.utils.llm import (
+    get_llm_client, CHAT_POOL, BACKGROUND_POOL,
+    LLMQueueTimeout, LLMTimeout, LLMCircuitOpen
+)
+from app.utils.rate_limit import get_user_id
+from app.utils.singleflight import FlightGroup
 
 router = APIRouter(
     prefix="/api/chat",
     tags=["chat"]
 )
 
-# Environment variable for Gemini API key
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# Context management settings
+# Token budget for the conversation history forwarded to the model on each turn
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+# Summarize turns that fall out of the window instead of dropping them
+CHAT_SUMMARIZE_CONTEXT = os.environ.get("CHAT_SUMMARIZE_CONTEXT", "false").lower() == "true"
+# Number of dropped messages to accumulate before refreshing a summary
+CHAT_SUMMARY_REFRESH_MESSAGES = int(os.environ.get("CHAT_SUMMARY_REFRESH_MESSAGES", "6"))
+CHAT_SUMMARY_CACHE_SIZE = int(os.environ.get("CHAT_SUMMARY_CACHE_SIZE", "1000"))
 
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables.")
-
-# Initialize Langchain Gemini chat model
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=GEMINI_API_KEY,
-    temperature=0.7,
-    max_output_tokens=2048,
-)
+# Rough token estimate used for budgeting (Gemini averages ~4 characters per token)
+CHARS_PER_TOKEN = 4
+MESSAGE_TOKEN_OVERHEAD = 4
 
 # Models
 class MessagePayload(BaseModel):
@@ -32,10 +45,27 @@ class MessagePayload(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Client-held history. Not needed (and ignored) when session_id is set.
     context: Optional[List[MessagePayload]] = None
+    conversation_id: Optional[str] = None
+    # Server-side session created with POST /api/chat/sessions
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+
+class ChatSessionResponse(BaseModel):
+    session_id: str
+
+class ChatTurn(BaseModel):
+    seq: int
+    user: str
+    assistant: str
+
+class ChatTurnsResponse(BaseModel):
+    items: List[ChatTurn]
+    next_cursor: Optional[int] = None
 
 # Format messages for Langchain
 def format_messages(messages: List[MessagePayload]):
@@ -47,6 +77,144 @@ def format_messages(messages: List[MessagePayload]):
             formatted.append(AIMessage(content=msg.content))
     return formatted
 
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens a message costs, including per-message overhead"""
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_TOKEN_OVERHEAD
+
+def trim_context(
+    context: List[MessagePayload],
+    budget: int = CHAT_CONTEXT_TOKEN_BUDGET
+) -> int:
+    """
+    Return the index of the first message that fits in the token budget.
+    Walks backwards from the newest message so the cost only depends on
+    the size of the window, not the length of the conversation.
+    """
+    used = 0
+    start = len(context)
+    while start > 0:
+        cost = count_tokens(context[start - 1].content)
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+# Rolling summaries of trimmed turns, keyed by conversation id.
+# Each entry is (number of leading messages covered, summary text).
+_summary_cache: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+_summaries_in_progress: set = set()
+
+SUMMARY_PROMPT = """
+Summarize the following conversation between a traveler and a travel assistant.
+Keep destinations, dates, budgets, preferences and any open questions. Be brief.
+"""
+
+def get_cached_summary(conversation_id: str, dropped: int) -> Optional[str]:
+    """Return the cached summary for a conversation if it is still consistent with its history"""
+    cached = _summary_cache.get(conversation_id)
+    if cached is None:
+        return None
+    covered, summary = cached
+    if covered > dropped:
+        # The client rewound or edited its history; the summary no longer applies
+        del _summary_cache[conversation_id]
+        return None
+    _summary_cache.move_to_end(conversation_id)
+    return summary
+
+async def summarize(summary: str, messages: List[MessagePayload]) -> str:
+    """Fold messages into an existing summary on the background LLM pool"""
+    transcript = "\n".join(
+        f"{'Traveler' if msg.role == 'user' else 'Assistant'}: {msg.content}"
+        for msg in messages
+    )
+    if summary:
+        transcript = f"Earlier summary: {summary}\n{transcript}"
+    response = await get_llm_client(BACKGROUND_POOL).ainvoke([
+        HumanMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content=transcript),
+    ])
+    return response.content
+
+async def refresh_summary(conversation_id: str, context: List[MessagePayload], dropped: int):
+    """Fold newly trimmed messages into the rolling summary for a conversation"""
+    try:
+        covered, summary = _summary_cache.get(conversation_id, (0, ""))
+        _summary_cache[conversation_id] = (dropped, await summarize(summary, context[covered:dropped]))
+        _summary_cache.move_to_end(conversation_id)
+        while len(_summary_cache) > CHAT_SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    except Exception as e:
+        print(f"Error summarizing conversation {conversation_id}: {str(e)}")
+    finally:
+        _summaries_in_progress.discard(conversation_id)
+
+def build_context_messages(request: "ChatRequest", user_id: Optional[str] = None) -> list:
+    """
+    Format the part of the client context that fits in the token budget.
+    When summarization is enabled, turns that fall out of the window are
+    replaced with a cached rolling summary that is refreshed in the
+    background so it never adds latency to the current turn. Summaries are
+    cached per authenticated user, so anonymous callers only get the window.
+    """
+    context = request.context or []
+    start = trim_context(context)
+    messages = []
+
+    if CHAT_SUMMARIZE_CONTEXT and request.conversation_id and user_id and start > 0:
+        # conversation_id is client-chosen; scope it to the caller so ids can't be replayed
+        cache_key = f"{user_id}:{request.conversation_id}"
+        summary = get_cached_summary(cache_key, start)
+        if summary:
+            messages.append(AIMessage(content=f"Summary of the earlier conversation: {summary}"))
+
+        covered = _summary_cache.get(cache_key, (0, ""))[0]
+        if (
+            start - covered >= CHAT_SUMMARY_REFRESH_MESSAGES
+            and cache_key not in _summaries_in_progress
+        ):
+            _summaries_in_progress.add(cache_key)
+            asyncio.create_task(refresh_summary(cache_key, list(context), start))
+
+    messages.extend(format_messages(context[start:]))
+    return messages
+
+async def refresh_session_summary(db: Database, session_id: str, summary: str, start: int, end: int):
+    """Fold a session's turns [start, end) into its stored rolling summary"""
+    try:
+        turns = await asyncio.to_thread(get_turns, db, session_id, start, end)
+        messages = []
+        for turn in turns:
+            messages.append(MessagePayload(role="user", content=turn["user"]))
+            messages.append(MessagePayload(role="assistant", content=turn["assistant"]))
+        summary = await summarize(summary, messages)
+        await asyncio.to_thread(save_summary, db, session_id, summary, end)
+    except Exception as e:
+        print(f"Error summarizing chat session {session_id}: {str(e)}")
+    finally:
+        _summaries_in_progress.discard(session_id)
+
+def build_session_messages(db: Database, session_id: str, session: CachedSession) -> list:
+    """
+    The cached, already formatted window of a session, preceded by its
+    rolling summary when summarization is enabled. Schedules a summary
+    refresh once enough turns have fallen out of the window.
+    """
+    messages = []
+    if CHAT_SUMMARIZE_CONTEXT:
+        if session.summary:
+            messages.append(AIMessage(content=f"Summary of the earlier conversation: {session.summary}"))
+        dropped = session.dropped_turns
+        if (
+            2 * (dropped - session.summary_turns) >= CHAT_SUMMARY_REFRESH_MESSAGES
+            and session_id not in _summaries_in_progress
+        ):
+            _summaries_in_progress.add(session_id)
+            asyncio.create_task(refresh_session_summary(db, session_id, session.summary, session.summary_turns, dropped))
+    messages.extend(session.messages())
+    return messages
+
 # Travel assistant system prompt
 TRAVEL_ASSISTANT_PROMPT = """
 You are a helpful travel assistant for BackpackerConnect, a platform that helps travelers find groups to travel with.
@@ -54,31 +222,201 @@ You can answer questions about destinations, travel tips, packing suggestions, l
 Keep responses concise and focused on travel topics. Be friendly, supportive, and encouraging about group travel experiences.
 """
 
-@router.post("", response_model=ChatResponse)
-async def process_chat(request: ChatRequest):
-    try:
-        # Create system prompt
-        system_prompt = AIMessage(content=TRAVEL_ASSISTANT_PROMPT)
-        
-        # Initialize message list with system prompt
-        messages = [system_prompt]
-        
-        # Add context if provided
+# Identical first-turn questions that arrive together share one generation
+_chat_flights = FlightGroup("chat")
+
+def coalesce_key(request: ChatRequest) -> Optional[str]:
+    """
+    Key under which concurrent identical requests share one upstream call.
+    Only stateless first turns (no history, no session) are coalesced, and
+    prompts only differing in case or whitespace count as identical.
+    """
+    if request.session_id or request.context:
+        return None
+    prompt = " ".join(request.message.split()).casefold()
+    if not prompt:
+        return None
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+
+def build_chat_messages(
+    request: ChatRequest,
+    http_request: Request,
+    db: Database
+) -> Tuple[list, Optional[CachedSession]]:
+    """The messages to send for a chat request, and its loaded session if it has one"""
+    # Create system prompt
+    system_prompt = AIMessage(content=TRAVEL_ASSISTANT_PROMPT)
+    
+    # Initialize message list with system prompt
+    messages = [system_prompt]
+    session = None
+    
+    if request.session_id:
+        # History comes from the server-side session
+        session_doc = get_session_doc(db, request.session_id, get_user_id(http_request.scope))
+        session = load_session(db, request.session_id, session_doc, count_tokens, CHAT_CONTEXT_TOKEN_BUDGET)
+        messages.extend(build_session_messages(db, request.session_id, session))
+        messages.append(HumanMessage(content=request.message))
+    else:
+        # Add context if provided, trimmed to the token budget
         if request.context and len(request.context) > 0:
-            messages.extend(format_messages(request.context))
+            messages.extend(build_context_messages(request, get_user_id(http_request.scope)))
         
         # Add the current message if it's not already the last message in context
         if not request.context or request.context[-1].content != request.message:
             messages.append(HumanMessage(content=request.message))
+    return messages, session
+
+def chat_http_error(e: Exception) -> HTTPException:
+    """Map a chat failure to the HTTP error returned to the client"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, SessionNotFound):
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found"
+        )
+    if isinstance(e, (LLMQueueTimeout, LLMCircuitOpen)):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The travel assistant is busy, please try again shortly",
+            headers={"Retry-After": "5"}
+        )
+    if isinstance(e, LLMTimeout):
+        return HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="The travel assistant took too long to respond"
+        )
+    print(f"Error processing chat: {str(e)}")
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error processing your request: {str(e)}"
+    )
+
+def record_turn(db: Database, request: ChatRequest, session: Optional[CachedSession], reply: str):
+    if session is not None:
+        tokens = count_tokens(request.message) + count_tokens(reply)
+        append_turn(
+            db, request.session_id, session, request.message, reply,
+            tokens, CHAT_CONTEXT_TOKEN_BUDGET
+        )
+
+@router.post("", response_model=ChatResponse)
+async def process_chat(request: ChatRequest, http_request: Request, db: Database = Depends(get_db)):
+    try:
+        messages, session = build_chat_messages(request, http_request, db)
+        client = get_llm_client(CHAT_POOL)
         
-        # Call Gemini via Langchain
-        response = model.invoke(messages)
+        key = coalesce_key(request)
+        if key is not None:
+            # Join (or start) the shared generation for this prompt
+            reply = await _chat_flights.join(key, lambda: client.astream(messages)).result()
+        else:
+            # Call Gemini via the resilient client
+            reply = (await client.ainvoke(messages)).content
         
-        return {"response": response.content}
+        record_turn(db, request, session, reply)
+        return {"response": reply, "session_id": request.session_id}
+    except Exception as e:
+        raise chat_http_error(e)
+
+@router.post("/stream")
+async def stream_chat(request: ChatRequest, http_request: Request, db: Database = Depends(get_db)):
+    """
+    Same as POST /api/chat, but the reply is streamed as plain text while it
+    is generated. Concurrent identical first turns receive the same stream.
+    Errors before the first chunk are returned as HTTP errors; a failure
+    mid-stream ends the response early.
+    """
+    try:
+        messages, session = build_chat_messages(request, http_request, db)
+        client = get_llm_client(CHAT_POOL)
+        
+        key = coalesce_key(request)
+        if key is not None:
+            chunks = _chat_flights.join(key, lambda: client.astream(messages)).subscribe()
+        else:
+            chunks = client.astream(messages)
+        
+        # Wait for the first chunk so queueing and provider errors still get a status code
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = ""
+    except Exception as e:
+        raise chat_http_error(e)
     
+    async def body():
+        parts = [first]
+        if first:
+            yield first
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            print(f"Error streaming chat: {str(e)}")
+            return
+        finally:
+            # On a client disconnect this stops the provider stream (or our
+            # subscription to a shared one) instead of leaving it to the GC
+            await chunks.aclose()
+        record_turn(db, request, session, "".join(parts))
+    
+    return StreamingResponse(body(), media_type="text/plain; charset=utf-8")
+
+@router.post("/sessions", response_model=ChatSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_chat_session(http_request: Request, db: Database = Depends(get_db)):
+    """Start a server-side chat session. Sessions created with a bearer token are private to that user."""
+    try:
+        return {"session_id": create_session(db, get_user_id(http_request.scope))}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error creating chat session: {str(e)}"
+        )
+
+@router.get("/sessions/{session_id}/turns", response_model=ChatTurnsResponse)
+async def get_chat_session_turns(
+    session_id: str,
+    http_request: Request,
+    cursor: Optional[int] = None,
+    limit: int = 20,
+    db: Database = Depends(get_db)
+):
+    """Get a session's history, newest turn first, with cursor pagination"""
+    try:
+        session_doc = get_session_doc(db, session_id, get_user_id(http_request.scope))
+        end = session_doc["turn_count"] if cursor is None else cursor
+        limit = min(limit, 100)
+        items = list(reversed(get_turns(db, session_id, max(end - limit, 0), end)))
+        next_cursor = items[-1]["seq"] if items and items[-1]["seq"] > 0 else None
+        return {"items": items, "next_cursor": next_cursor}
+    except SessionNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving chat session: {str(e)}"
+        )
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_chat_session(session_id: str, http_request: Request, db: Database = Depends(get_db)):
+    """Delete a session and its history"""
+    try:
+        get_session_doc(db, session_id, get_user_id(http_request.scope))
+        delete_session(db, session_id)
+        return None
+    except SessionNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found"
+        )
     except Exception as e:
-        print(f"Error processing chat: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing your request: {str(e)}"
-        ) 
\ No newline at end of file
+            detail=f"Error deleting chat session: {str(e)}"
+        )
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+from app.database import get_db
+from pymongo.database import Database
+from app.models.user import UserSummary
+from app.services.users import fetch_user_summaries
+from app.utils.mongo import normalize_doc, trusted_json_response
+from app.utils.text import normalize_destination
+
+router = APIRouter(
+    prefix="/api/group-suggestions",
+    tags=["group suggestions"]
+)
+
+# Models
+class GroupSuggestionResponse(BaseModel):
+    id: str
+    destination: str
+    window_start: datetime
+    window_end: datetime
+    # Dates every member is travelling
+    start_date: datetime
+    end_date: datetime
+    intent_ids: List[str]
+    user_ids: List[str]
+    shared_activities: List[str] = []
+    capacity: int
+    score: float
+    updated_at: datetime
+    # Member summaries, only present with expand=users
+    users: Optional[List[UserSummary]] = None
+
+@router.get("", response_model=List[GroupSuggestionResponse])
+async def get_group_suggestions(
+    intent_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    destination: Optional[str] = None,
+    limit: int = 20,
+    expand: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """
+    Get precomputed group suggestions for an intent, a user or a destination,
+    best first. Use expand=users to embed member summaries.
+    """
+    filter_query = {}
+    if intent_id:
+        filter_query["intent_ids"] = intent_id
+    if user_id:
+        filter_query["user_ids"] = user_id
+    if destination:
+        filter_query["destination_key"] = normalize_destination(destination)
+    if not filter_query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide intent_id, user_id or destination"
+        )
+
+    try:
+        suggestions = [
+            normalize_doc(suggestion)
+            for suggestion in db.group_suggestions.find(filter_query).sort("score", -1).limit(min(limit, 100))
+        ]
+        
+        if expand == "users":
+            summaries = fetch_user_summaries(db, (uid for s in suggestions for uid in s["user_ids"]))
+            for suggestion in suggestions:
+                suggestion["users"] = [summaries[uid] for uid in suggestion["user_ids"] if uid in summaries]
+        
+        return trusted_json_response(GroupSuggestionResponse, suggestions)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving group suggestions: {str(e)}"
+        )
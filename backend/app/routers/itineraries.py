@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from app.database import get_db
+from pymongo.database import Database
+from app.models.itinerary import ItineraryOptimizeRequest, ItineraryOptimizeResponse
+from app.services.itineraries import optimize_itinerary
+
+router = APIRouter(
+    prefix="/api/itineraries",
+    tags=["itineraries"]
+)
+
+# Upper bound on the stops optimized in one request
+MAX_OPTIMIZE_STOPS = 2000
+
+@router.post("/optimize", response_model=ItineraryOptimizeResponse)
+async def optimize_itinerary_route(request: ItineraryOptimizeRequest, db: Database = Depends(get_db)):
+    """
+    Reorder each day's activities to shorten the route between them.
+    Timed activities keep their chronological order. Locations must be
+    "lat,lng" pairs or names known to the geocode cache.
+    """
+    if sum(len(day.activities) for day in request.days) > MAX_OPTIMIZE_STOPS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_OPTIMIZE_STOPS} activities can be optimized at once"
+        )
+
+    try:
+        return {"days": await optimize_itinerary(db, request.days)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error optimizing itinerary: {str(e)}"
+        )
@@ -0,0 +1,247 @@
+from fastapi import APIRouter, HTTPException, Depends, status, Request, BackgroundTasks, Header
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel
+from typing import Dict, Optional
+from urllib.parse import quote
+from app.database import get_db
+from pymongo.database import Database
+from bson import ObjectId
+from app.services.storage import get_object_store
+from app.services.media import (
+    MEDIA_MAX_BYTES, MEDIA_THUMBNAIL_SIZES, UploadTooLarge, RangeNotSatisfiable,
+    INLINE_CONTENT_TYPES, ATTACHMENT_CONTENT_TYPES, store_stream, sniff_content_type, record_blob,
+    is_allowed_content_type, served_content_type, wants_thumbnails, generate_thumbnails, parse_range, iter_blob
+)
+from app.utils.images import THUMBNAIL_CONTENT_TYPE
+from app.utils.mongo import utcnow
+from app.utils.rate_limit import get_user_id
+
+router = APIRouter(
+    prefix="/api/media",
+    tags=["media"]
+)
+
+# Uploads never change, so their URLs can be cached indefinitely
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# Models
+class MediaResponse(BaseModel):
+    id: str
+    url: str
+    content_type: str
+    size: int
+    filename: Optional[str] = None
+    sha256: str
+    # Thumbnail size -> URL (images only)
+    thumbnails: Dict[str, str] = {}
+
+def media_url(media_id: str) -> str:
+    return f"{router.prefix}/{media_id}"
+
+def to_response(media: dict) -> MediaResponse:
+    media_id = str(media["_id"])
+    thumbnails = {}
+    if wants_thumbnails(media["content_type"]):
+        thumbnails = {str(size): f"{media_url(media_id)}/thumbnails/{size}" for size in MEDIA_THUMBNAIL_SIZES}
+    return MediaResponse(
+        id=media_id,
+        url=media_url(media_id),
+        content_type=media["content_type"],
+        size=media["size"],
+        filename=media.get("filename"),
+        sha256=media["sha256"],
+        thumbnails=thumbnails
+    )
+
+def content_disposition(content_type: str, filename: Optional[str]) -> str:
+    disposition = "inline" if content_type in INLINE_CONTENT_TYPES else "attachment"
+    if filename:
+        disposition += f"; filename*=UTF-8''{quote(filename)}"
+    return disposition
+
+def blob_response(
+    key: str,
+    size: int,
+    content_type: str,
+    range_header: Optional[str],
+    if_range: Optional[str],
+    if_none_match: Optional[str],
+    cache_control: str
+) -> Response:
+    """Stream a blob, honouring conditional and single-range requests"""
+    # Blobs are content-addressed, so the hash is a strong validator
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        # Never let browsers reinterpret an upload as HTML or script
+        "X-Content-Type-Options": "nosniff",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # A stale If-Range means the client's partial copy is outdated: send everything
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"}
+        )
+
+    store = get_object_store()
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_blob(store, key, 0, size - 1), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_blob(store, key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=content_type,
+        headers=headers
+    )
+
+def find_media(db: Database, media_id: str) -> dict:
+    media = db.media.find_one({"_id": ObjectId(media_id)}) if ObjectId.is_valid(media_id) else None
+    if not media:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Media not found"
+        )
+    return media
+
+# Routes
+@router.post("", response_model=MediaResponse, status_code=status.HTTP_201_CREATED)
+async def upload_media(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    filename: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """
+    Upload a chat attachment or profile image. The request body is the raw file
+    content and Content-Type its media type; the body is streamed to storage.
+    """
+    owner_id = get_user_id(request.scope)
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MEDIA_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Uploads are limited to {MEDIA_MAX_BYTES} bytes"
+        )
+    content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip().lower()
+    if not is_allowed_content_type(content_type):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported media type. Allowed: " + ", ".join(
+                sorted(INLINE_CONTENT_TYPES | ATTACHMENT_CONTENT_TYPES)
+            )
+        )
+
+    store = get_object_store()
+    try:
+        key, size, head = await store_stream(store, request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    if size == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty upload"
+        )
+
+    try:
+        blob_content_type = sniff_content_type(head)
+        record_blob(db, key, size, blob_content_type)
+        media = {
+            "sha256": key,
+            "size": size,
+            "content_type": content_type,
+            "filename": filename,
+            "owner_id": owner_id,
+            "created_at": utcnow(),
+        }
+        db.media.insert_one(media)
+
+        # Thumbnails are produced once per blob, after the response is sent
+        if wants_thumbnails(blob_content_type):
+            background_tasks.add_task(generate_thumbnails, db, store, key)
+
+        return to_response(media)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error storing media: {str(e)}"
+        )
+
+@router.get("/{media_id}")
+async def download_media(
+    media_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_db)
+):
+    """Download an upload. Supports single byte ranges and ETag revalidation."""
+    media = find_media(db, media_id)
+    content_type = served_content_type(media["content_type"])
+    response = blob_response(
+        media["sha256"], media["size"], content_type,
+        range, if_range, if_none_match, IMMUTABLE_CACHE
+    )
+    response.headers["Content-Disposition"] = content_disposition(content_type, media.get("filename"))
+    return response
+
+@router.get("/{media_id}/info", response_model=MediaResponse)
+async def get_media_info(media_id: str, db: Database = Depends(get_db)):
+    """Get metadata for an upload"""
+    return to_response(find_media(db, media_id))
+
+@router.get("/{media_id}/thumbnails/{size}")
+async def download_thumbnail(
+    media_id: str,
+    size: int,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_db)
+):
+    """Download a thumbnail. Serves the original until the thumbnail has been generated."""
+    if size not in MEDIA_THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown thumbnail size"
+        )
+    media = find_media(db, media_id)
+    blob = db.media_blobs.find_one({"_id": media["sha256"]}, {"thumbnails": 1}) or {}
+    thumbnail_key = (blob.get("thumbnails") or {}).get(str(size))
+    if thumbnail_key is None:
+        # Not ready (or not an image): don't let caches keep the fallback
+        content_type = served_content_type(media["content_type"])
+        response = blob_response(
+            media["sha256"], media["size"], content_type,
+            range, if_range, if_none_match, "no-cache"
+        )
+        response.headers["Content-Disposition"] = content_disposition(content_type, media.get("filename"))
+        return response
+
+    thumbnail_size = get_object_store().size(thumbnail_key)
+    return blob_response(
+        thumbnail_key, thumbnail_size, THUMBNAIL_CONTENT_TYPE,
+        range, if_range, if_none_match, IMMUTABLE_CACHE
+    )
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+import re
+from app.database import get_db
+from pymongo.database import Database
+from app.services.rollups import (
+    month_key, month_range, trending_destinations, destination_months
+)
+from app.utils.mongo import trusted_json_response
+from app.utils.text import normalize_destination
+
+router = APIRouter(
+    prefix="/api/stats",
+    tags=["stats"]
+)
+
+# Largest month range accepted by the stats endpoints
+MAX_STATS_MONTHS = 24
+
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+# Models
+class TrendingDestinationResponse(BaseModel):
+    destination: str
+    destination_key: str
+    intent_count: int
+    traveler_count: int
+
+class MonthStatsResponse(BaseModel):
+    month: str
+    intent_count: int
+    traveler_count: int
+
+class DestinationStatsResponse(BaseModel):
+    destination: str
+    destination_key: str
+    months: List[MonthStatsResponse]
+
+def resolve_months(from_month: Optional[str], months: int) -> List[str]:
+    if from_month is not None and not MONTH_PATTERN.match(from_month):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from_month must be formatted as YYYY-MM"
+        )
+    if not 1 <= months <= MAX_STATS_MONTHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"months must be between 1 and {MAX_STATS_MONTHS}"
+        )
+    return month_range(from_month or month_key(datetime.utcnow()), months)
+
+@router.get("/destinations/trending", response_model=List[TrendingDestinationResponse])
+async def get_trending_destinations(
+    from_month: Optional[str] = None,
+    months: int = 3,
+    limit: int = 10,
+    db: Database = Depends(get_db)
+):
+    """
+    Destinations with the most travel intents starting in the given months
+    (default: this month and the next two).
+    """
+    month_list = resolve_months(from_month, months)
+    try:
+        return trusted_json_response(
+            TrendingDestinationResponse,
+            trending_destinations(db, month_list, min(max(limit, 1), 100))
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving trending destinations: {str(e)}"
+        )
+
+@router.get("/destinations/{destination}", response_model=DestinationStatsResponse)
+async def get_destination_stats(
+    destination: str,
+    from_month: Optional[str] = None,
+    months: int = 12,
+    db: Database = Depends(get_db)
+):
+    """Intents and travelers heading to a destination, per start month"""
+    month_list = resolve_months(from_month, months)
+    key = normalize_destination(destination)
+    try:
+        return trusted_json_response(DestinationStatsResponse, {
+            "destination": destination,
+            "destination_key": key,
+            "months": destination_months(db, key, month_list),
+        })
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving destination stats: {str(e)}"
+        )
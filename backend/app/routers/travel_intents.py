@@ -1,16 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
+import re
 from typing import List, Optional
 from app.database import get_db
 from pymongo.database import Database
 from bson import ObjectId
+from app.services.feed import (
+    encode_cursor, decode_cursor,
+    get_feed_page, refresh_feed_if_stale,
+    add_intent_to_feeds, remove_intent_from_feeds
+)
+from app.services.search import get_search_index, index_intent, unindex_intent
+from app.services.users import attach_authors, fetch_user_summaries
+from app.services.interests import (
+    INTENT_PROJECTION, IntentNotFound, express_interest, withdraw_interest,
+    get_interested_user_ids, remove_interests
+)
+from app.services.archival import ARCHIVE_COLLECTION
+from app.services.group_suggestions import recluster_for_intent
+from app.services.counters import increment, with_pending
+from app.services.rollups import ROLLUP_FIELDS, update_rollups
+from app.models.user import UserSummary
+from app.utils.mongo import normalize_doc, trusted_json_response, utcnow
+from app.utils.rate_limit import get_user_id
+from app.utils.text import normalize_destination
+from app.utils.etag import (
+    VERSION_PROJECTION, document_etag, collection_etag, last_modified,
+    validator_headers, is_not_modified, not_modified_response
+)
 
 router = APIRouter(
     prefix="/api/travel-intents",
     tags=["travel intents"]
 )
 
+# List cursors carry created_at as milliseconds since this epoch
+LIST_CURSOR_EPOCH = datetime(1970, 1, 1)
+
 # Models
 class TravelIntentBase(BaseModel):
     user_id: str
@@ -29,17 +57,40 @@ class TravelIntentCreate(TravelIntentBase):
 class TravelIntentResponse(TravelIntentBase):
     id: str
     created_at: datetime
+    interested_users_count: int = 0
+    view_count: int = 0
+    # Author summary, only present with expand=user
+    user: Optional[UserSummary] = None
+    # Set on intents served from the archive (include_archived=true)
+    archived_at: Optional[datetime] = None
+
+class TravelIntentFeedResponse(BaseModel):
+    items: List[TravelIntentResponse]
+    next_cursor: Optional[str] = None
+
+class InterestResponse(BaseModel):
+    intent_id: str
+    interested: bool
+    interested_users_count: int
+
+class InterestedUsersResponse(BaseModel):
+    items: List[UserSummary]
+    next_cursor: Optional[str] = None
 
 @router.post("", response_model=TravelIntentResponse)
 async def create_travel_intent(
     intent: TravelIntentCreate,
+    background_tasks: BackgroundTasks,
     db: Database = Depends(get_db)
 ):
     """Create a new travel intent (looking for travel companions)"""
     try:
         # Create new travel intent document
         travel_intent_data = intent.dict()
-        travel_intent_data["created_at"] = datetime.utcnow()
+        travel_intent_data["created_at"] = utcnow()
+        travel_intent_data["version"] = 1
+        travel_intent_data["interested_users_count"] = 0
+        travel_intent_data["destination_key"] = normalize_destination(intent.destination)
         
         # Convert user_id string to ObjectId if needed
         try:
@@ -48,17 +99,24 @@ async def create_travel_intent(
             # If conversion fails, keep as string
             pass
         
-        # Insert into database
-        result = db.travel_intents.insert_one(travel_intent_data)
+        # Insert into database; insert_one adds the generated _id to the
+        # document, so it doubles as the created intent without a read-back
+        db.travel_intents.insert_one(travel_intent_data)
+        created_intent = travel_intent_data
         
-        # Get the created document
-        created_intent = db.travel_intents.find_one({"_id": result.inserted_id})
+        # Make the intent searchable in this worker right away
+        index_intent(created_intent)
         
-        # Convert IDs to strings for the response
-        created_intent["id"] = str(created_intent["_id"])
-        created_intent["user_id"] = str(created_intent["user_id"])
+        # Fan the new intent out to matching feeds; the author's own profile catches up when stale
+        background_tasks.add_task(add_intent_to_feeds, db, dict(created_intent))
+        background_tasks.add_task(update_rollups, db, None, dict(created_intent))
         
-        return created_intent
+        # Convert IDs to strings for the response
+        return trusted_json_response(
+            TravelIntentResponse,
+            normalize_doc(created_intent),
+            headers=validator_headers(document_etag(created_intent), last_modified(created_intent))
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -72,16 +130,39 @@ async def get_travel_intents(
     user_id: Optional[str] = None,
     skip: int = 0, 
     limit: int = 20,
+    cursor: Optional[str] = None,
+    expand: Optional[str] = None,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
     db: Database = Depends(get_db)
 ):
-    """Get travel intents with optional filtering"""
+    """
+    Get travel intents with optional filtering, newest first. `destination`
+    matches anywhere in the destination name, ignoring case and accents. Pass the
+    X-Next-Cursor header of a page back as `cursor` to read the next one
+    (cheaper than `skip` for deep pages). Use expand=user to embed author
+    summaries and include_archived=true to also search intents whose dates have passed.
+    """
+    # Keyset position: (created_at in ms, id) of the last intent on the previous page
+    after = None
+    if cursor:
+        try:
+            created_ms, last_id = decode_cursor(cursor)
+            after = (LIST_CURSOR_EPOCH + timedelta(milliseconds=created_ms), ObjectId(last_id))
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+
     try:
         # Build filter
         filter_query = {}
         
         if destination:
-            # Case-insensitive partial match for destination
-            filter_query["destination"] = {"$regex": destination, "$options": "i"}
+            # Substring match on the normalized destination: case- and accent-insensitive
+            # ("paulo" finds "São Paulo") and checked against index keys, not documents
+            filter_query["destination_key"] = {"$regex": re.escape(normalize_destination(destination))}
             
         if start_date_after:
             filter_query["start_date"] = {"$gte": start_date_after}
@@ -92,35 +173,185 @@ async def get_travel_intents(
             except Exception:
                 filter_query["user_id"] = user_id
         
+        if after is not None:
+            filter_query["$or"] = [
+                {"created_at": {"$lt": after[0]}},
+                {"created_at": after[0], "_id": {"$lt": after[1]}},
+            ]
+        
         # Query with filter and pagination
-        travel_intents = list(
-            db.travel_intents.find(filter_query)
-            .sort("created_at", -1)  # Most recent first
-            .skip(skip)
-            .limit(limit)
-        )
+        if include_archived:
+            # Take the newest skip+limit matches from each collection, then merge
+            window = [
+                {"$match": filter_query},
+                {"$sort": {"created_at": -1, "_id": -1}},
+                {"$limit": skip + limit},
+                {"$project": INTENT_PROJECTION},
+            ]
+            travel_intents = list(db.travel_intents.aggregate(window + [
+                {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": window}},
+                {"$sort": {"created_at": -1, "_id": -1}},
+                {"$skip": skip},
+                {"$limit": limit},
+            ]))
+        else:
+            travel_intents = list(
+                db.travel_intents.find(filter_query, INTENT_PROJECTION)
+                .sort([("created_at", -1), ("_id", -1)])  # Most recent first
+                .skip(skip)
+                .limit(limit)
+            )
+        
+        next_cursor = None
+        if len(travel_intents) == limit and isinstance(travel_intents[-1].get("created_at"), datetime):
+            last = travel_intents[-1]
+            created_ms = (last["created_at"] - LIST_CURSOR_EPOCH) // timedelta(milliseconds=1)
+            next_cursor = encode_cursor(created_ms, str(last["_id"]))
         
         # Convert IDs to strings for response
-        for intent in travel_intents:
-            intent["id"] = str(intent["_id"])
-            intent["user_id"] = str(intent["user_id"])
+        travel_intents = [normalize_doc(intent) for intent in travel_intents]
         
-        return travel_intents
+        if expand == "user":
+            attach_authors(db, travel_intents)
+        
+        # Unchanged page: skip serialization entirely. Author cards are part
+        # of the representation when expanded, so their versions count too.
+        members = travel_intents + [intent["user"] for intent in travel_intents if intent.get("user")]
+        etag = collection_etag(members, seed=f"{expand or ''}:{include_archived}")
+        if is_not_modified(etag, if_none_match):
+            return not_modified_response(etag)
+        
+        headers = validator_headers(etag)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return trusted_json_response(TravelIntentResponse, travel_intents, headers=headers)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving travel intents: {str(e)}"
         )
 
+def require_user_id(request: Request) -> str:
+    user_id = get_user_id(request.scope)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user_id
+
+@router.get("/feed", response_model=TravelIntentFeedResponse)
+async def get_travel_intent_feed(
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(require_user_id),
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    expand: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """Get the current user's personalized travel intent feed with cursor pagination"""
+    try:
+        items, next_cursor = get_feed_page(db, user_id, cursor, min(limit, 100))
+        if expand == "user":
+            attach_authors(db, items)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving feed: {str(e)}"
+        )
+
+    # Materialize or refresh the feed off the request path
+    if cursor is None:
+        background_tasks.add_task(refresh_feed_if_stale, db, user_id)
+
+    return trusted_json_response(TravelIntentFeedResponse, {"items": items, "next_cursor": next_cursor})
+
+@router.get("/search", response_model=List[TravelIntentResponse])
+async def search_travel_intents(
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    expand: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """Keyword search over destination, activities and description, ranked by relevance"""
+    index = get_search_index()
+    if index is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Search index is warming up, please try again shortly",
+            headers={"Retry-After": "5"}
+        )
+
+    try:
+        # Scoring is CPU-bound; keep it off the event loop
+        hits = await run_in_threadpool(index.search, q, limit=min(limit, 100), skip=skip)
+        if not hits:
+            return []
+
+        # Hydrate the hits in one query and keep the ranking order
+        object_ids = [ObjectId(intent_id) for intent_id, _ in hits if ObjectId.is_valid(intent_id)]
+        found = {
+            str(intent["_id"]): intent
+            for intent in db.travel_intents.find({"_id": {"$in": object_ids}}, INTENT_PROJECTION)
+        }
+
+        travel_intents = []
+        for intent_id, _ in hits:
+            intent = found.get(intent_id)
+            if intent is None:
+                # Deleted by another worker since it was indexed
+                index.remove(intent_id)
+                continue
+            travel_intents.append(normalize_doc(intent))
+        
+        if expand == "user":
+            attach_authors(db, travel_intents)
+        
+        return trusted_json_response(TravelIntentResponse, travel_intents)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching travel intents: {str(e)}"
+        )
+
 @router.get("/{intent_id}", response_model=TravelIntentResponse)
 async def get_travel_intent(
     intent_id: str,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
     db: Database = Depends(get_db)
 ):
-    """Get a specific travel intent by ID"""
+    """
+    Get a specific travel intent by ID, optionally falling back to the archive.
+    Supports conditional requests via ETag / Last-Modified.
+    """
+    def find_intent(projection=INTENT_PROJECTION):
+        query = {"_id": ObjectId(intent_id)}
+        intent = db.travel_intents.find_one(query, projection)
+        if intent is None and include_archived:
+            intent = db[ARCHIVE_COLLECTION].find_one(query, projection)
+        return intent
+
     try:
+        # Answer revalidations from a version-only projection
+        if if_none_match or if_modified_since:
+            validators = find_intent(VERSION_PROJECTION)
+            if validators:
+                etag, modified = document_etag(validators), last_modified(validators)
+                if is_not_modified(etag, if_none_match, modified, if_modified_since):
+                    increment("travel_intents", validators["_id"])
+                    return not_modified_response(etag, modified)
+        
         # Convert ID string to ObjectId
-        intent = db.travel_intents.find_one({"_id": ObjectId(intent_id)})
+        intent = find_intent()
         
         if not intent:
             raise HTTPException(
@@ -128,11 +359,12 @@ async def get_travel_intent(
                 detail="Travel intent not found"
             )
         
-        # Convert IDs to strings for response
-        intent["id"] = str(intent["_id"])
-        intent["user_id"] = str(intent["user_id"])
+        increment("travel_intents", intent["_id"])
+        with_pending("travel_intents", intent)
         
-        return intent
+        # Convert IDs to strings for response
+        headers = validator_headers(document_etag(intent), last_modified(intent))
+        return trusted_json_response(TravelIntentResponse, normalize_doc(intent), headers=headers)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -142,22 +374,100 @@ async def get_travel_intent(
 @router.delete("/{intent_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_travel_intent(
     intent_id: str,
+    background_tasks: BackgroundTasks,
     db: Database = Depends(get_db)
 ):
     """Delete a travel intent"""
     try:
-        # Delete the travel intent
-        result = db.travel_intents.delete_one({"_id": ObjectId(intent_id)})
+        # Delete the travel intent, keeping what is needed to find its group buckets and rollup
+        deleted = db.travel_intents.find_one_and_delete(
+            {"_id": ObjectId(intent_id)},
+            projection={"user_id": 1, **ROLLUP_FIELDS}
+        )
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Travel intent not found"
             )
         
+        unindex_intent(intent_id)
+        background_tasks.add_task(remove_intent_from_feeds, db, intent_id)
+        background_tasks.add_task(remove_interests, db, intent_id)
+        background_tasks.add_task(recluster_for_intent, db, deleted)
+        background_tasks.add_task(update_rollups, db, deleted, None)
+        
         return None
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting travel intent: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.put("/{intent_id}/interest", response_model=InterestResponse)
+async def express_interest_in_intent(
+    intent_id: str,
+    user_id: str = Depends(require_user_id),
+    db: Database = Depends(get_db)
+):
+    """Mark the current user as interested in a travel intent (idempotent)"""
+    try:
+        _, count = express_interest(db, intent_id, user_id)
+        return InterestResponse(intent_id=intent_id, interested=True, interested_users_count=count)
+    except IntentNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Travel intent not found"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error recording interest: {str(e)}"
+        )
+
+@router.delete("/{intent_id}/interest", response_model=InterestResponse)
+async def withdraw_interest_in_intent(
+    intent_id: str,
+    user_id: str = Depends(require_user_id),
+    db: Database = Depends(get_db)
+):
+    """Withdraw the current user's interest in a travel intent (idempotent)"""
+    try:
+        _, count = withdraw_interest(db, intent_id, user_id)
+        return InterestResponse(intent_id=intent_id, interested=False, interested_users_count=count)
+    except IntentNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Travel intent not found"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error withdrawing interest: {str(e)}"
+        )
+
+@router.get("/{intent_id}/interested-users", response_model=InterestedUsersResponse)
+async def get_interested_users(
+    intent_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Database = Depends(get_db)
+):
+    """Get the users interested in a travel intent, most recent first, with cursor pagination"""
+    if not ObjectId.is_valid(intent_id) or (cursor and not ObjectId.is_valid(cursor)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid intent id or cursor"
+        )
+
+    try:
+        user_ids, next_cursor = get_interested_user_ids(db, intent_id, cursor, min(limit, 100))
+        summaries = fetch_user_summaries(db, user_ids)
+        # Keep the interest order; users deleted since are skipped
+        items = [summaries[user_id] for user_id in user_ids if user_id in summaries]
+        return trusted_json_response(InterestedUsersResponse, {"items": items, "next_cursor": next_cursor})
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving interested users: {str(e)}"
+        )
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Header
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from app.database import get_db
 from pymongo.database import Database
+from pymongo import ReturnDocument
 from bson import ObjectId
 from app.models.user import User, UserUpdate, UserProfile
+from app.services.users import to_object_ids
+from app.services.counters import increment, with_pending
+from app.utils.mongo import normalize_doc, trusted_json_response, utcnow
+from app.utils.etag import (
+    VERSION_PROJECTION, document_etag, collection_etag, last_modified,
+    validator_headers, is_not_modified, not_modified_response
+)
 
 router = APIRouter(
     prefix="/api/users",
@@ -20,6 +28,7 @@ class UserResponse(BaseModel):
     email: str
     bio: str = ""
     profile_image_url: str = ""
+    view_count: int = 0
     
 class ProfileUpdateRequest(BaseModel):
     bio: Optional[str] = None
@@ -27,20 +36,69 @@ class ProfileUpdateRequest(BaseModel):
     phone_number: Optional[str] = None
     gender: Optional[str] = None
 
+# Maximum number of ids accepted by the batch endpoint
+MAX_BATCH_IDS = 100
+
+@router.get("/batch", response_model=List[UserResponse])
+async def get_users_batch(
+    ids: str = Query(..., description="Comma-separated user ids"),
+    db: Database = Depends(get_db)
+):
+    """Get many users by ID in a single query"""
+    requested = [user_id.strip() for user_id in ids.split(",") if user_id.strip()]
+    if len(requested) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids can be requested at once"
+        )
+
+    try:
+        found = {
+            user["id"]: user
+            for user in map(normalize_doc, db.users.find({"_id": {"$in": to_object_ids(requested)}}, {"password": 0}))
+        }
+        
+        # Keep the requested order; unknown ids are skipped
+        users = [found[user_id] for user_id in dict.fromkeys(requested) if user_id in found]
+        
+        return trusted_json_response(UserResponse, users)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving users: {str(e)}"
+        )
+
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, db: Database = Depends(get_db)):
-    """Get user details by ID"""
+async def get_user(
+    user_id: str,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: Database = Depends(get_db)
+):
+    """Get user details by ID. Supports conditional requests via ETag / Last-Modified."""
     try:
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        # Answer revalidations from a version-only projection
+        if if_none_match or if_modified_since:
+            validators = db.users.find_one({"_id": ObjectId(user_id)}, VERSION_PROJECTION)
+            if validators:
+                etag, modified = document_etag(validators), last_modified(validators)
+                if is_not_modified(etag, if_none_match, modified, if_modified_since):
+                    increment("users", validators["_id"])
+                    return not_modified_response(etag, modified)
+        
+        user = db.users.find_one({"_id": ObjectId(user_id)}, {"password": 0})
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
+        increment("users", user["_id"])
+        with_pending("users", user)
+        
         # Convert ObjectId to string for response
-        user["id"] = str(user["_id"])
-        return user
+        headers = validator_headers(document_etag(user), last_modified(user))
+        return trusted_json_response(UserResponse, normalize_doc(user), headers=headers)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -55,35 +113,31 @@ async def update_profile(
 ):
     """Update user profile information"""
     try:
-        # Check if user exists
-        user = db.users.find_one({"_id": ObjectId(user_id)})
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-        
         # Build update dictionary with only provided fields
         update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
         
         if update_dict:
-            # Update the user document
-            result = db.users.update_one(
+            # Update and read back the user document in one round trip
+            update_dict["updated_at"] = utcnow()
+            updated_user = db.users.find_one_and_update(
                 {"_id": ObjectId(user_id)},
-                {"$set": update_dict}
+                {"$set": update_dict, "$inc": {"version": 1}},
+                projection={"password": 0},
+                return_document=ReturnDocument.AFTER
             )
-            
-            if result.modified_count == 0:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Profile update failed"
-                )
+        else:
+            updated_user = db.users.find_one({"_id": ObjectId(user_id)}, {"password": 0})
         
-        # Get updated user
-        updated_user = db.users.find_one({"_id": ObjectId(user_id)})
-        updated_user["id"] = str(updated_user["_id"])
+        if not updated_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
         
-        return updated_user
+        headers = validator_headers(document_etag(updated_user), last_modified(updated_user))
+        return trusted_json_response(UserResponse, normalize_doc(updated_user), headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -91,16 +145,27 @@ async def update_profile(
         )
 
 @router.get("", response_model=List[UserResponse])
-async def get_users(skip: int = 0, limit: int = 10, db: Database = Depends(get_db)):
+async def get_users(
+    skip: int = 0,
+    limit: int = 10,
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_db)
+):
     """Get a list of users with pagination"""
     try:
-        users = list(db.users.find().skip(skip).limit(limit))
+        users = list(db.users.find({}, {"password": 0}).skip(skip).limit(limit))
         
-        # Convert ObjectIds to strings
-        for user in users:
-            user["id"] = str(user["_id"])
+        # Unchanged page: skip serialization entirely
+        etag = collection_etag(users)
+        if is_not_modified(etag, if_none_match):
+            return not_modified_response(etag)
         
-        return users
+        # Convert ObjectIds to strings
+        return trusted_json_response(
+            UserResponse,
+            [normalize_doc(user) for user in users],
+            headers=validator_headers(etag)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
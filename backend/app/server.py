@@ -0,0 +1,102 @@
+"""
+Production entry point.
+
+Runs WEB_CONCURRENCY worker processes (one per CPU core by default). Each
+worker builds its own app through `create_app()` and connects to MongoDB and
+the LLM provider from its lifespan handler, so no client is shared across
+processes. On SIGTERM workers stop accepting connections and get
+GRACEFUL_SHUTDOWN_TIMEOUT seconds to finish in-flight requests.
+
+Usage:
+    python -m app.server
+    python -m app.server benchmark [PATH]   # requests/s per worker count
+"""
+import os
+import sys
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+KEEPALIVE_TIMEOUT = int(os.environ.get("KEEPALIVE_TIMEOUT", "5"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info")
+
+
+def main():
+    uvicorn.run(
+        "app.main:create_app",
+        factory=True,
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        proxy_headers=True,
+        access_log=False,
+        log_level=LOG_LEVEL,
+    )
+
+
+def benchmark(path: str = "/api/travel-intents?limit=20", workers=None, requests: int = 5000, concurrency: int = 64):
+    """
+    Start the server with 1, 2, 4, ... workers (up to the core count) on a
+    spare port and report requests per second against `path`. Needs the
+    same MongoDB configuration as a normal run.
+    """
+    import time
+    import asyncio
+    import subprocess
+    import httpx
+
+    cores = os.cpu_count() or 1
+    if workers is None:
+        workers = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    port = PORT + 1
+    url = f"http://127.0.0.1:{port}{path}"
+
+    async def load() -> float:
+        async with httpx.AsyncClient(timeout=30) as client:
+            remaining = requests
+
+            async def user():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    (await client.get(url)).raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+            return requests / (time.perf_counter() - started)
+
+    baseline = None
+    for count in workers:
+        env = {**os.environ, "WEB_CONCURRENCY": str(count), "PORT": str(port), "LOG_LEVEL": "warning", "RATE_LIMIT_ENABLED": "false"}
+        server = subprocess.Popen([sys.executable, "-m", "app.server"], env=env)
+        try:
+            for _ in range(300):
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.1)
+            # Warm up every worker's caches and connection pool before measuring
+            httpx.get(url).raise_for_status()
+            asyncio.run(load())
+            rate = asyncio.run(load())
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or rate
+        print(f"{count} workers: {rate:.0f} requests/s ({rate / baseline:.2f}x, {cores} cores)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark(*sys.argv[2:3])
+    else:
+        main()
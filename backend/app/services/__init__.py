@@ -0,0 +1 @@
+# Background-maintained views over the core collections (feeds, indexes, rollups)
@@ -0,0 +1,118 @@
+"""
+Archival of expired travel intents.
+
+Intents whose end_date (or start_date, when there is no end date) has passed
+are moved from `travel_intents` to `travel_intents_archive` in bounded
+batches. One worker at a time runs the job (guarded by a lease), it pauses
+between batches, and it backs off entirely while foreground traffic is heavy.
+"""
+import os
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from app.services.feed import remove_intents_from_feeds
+from app.services.search import unindex_intent
+from app.utils.mongo import try_acquire_lease
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger("backpacker-api.archival")
+
+ARCHIVE_COLLECTION = "travel_intents_archive"
+
+ARCHIVE_ENABLED = os.environ.get("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_MAX_BATCHES_PER_RUN = int(os.environ.get("ARCHIVE_MAX_BATCHES_PER_RUN", "200"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.environ.get("ARCHIVE_BATCH_PAUSE_SECONDS", "1"))
+# Intents stay in the hot collection this long after their dates pass
+ARCHIVE_GRACE_DAYS = int(os.environ.get("ARCHIVE_GRACE_DAYS", "1"))
+# Skip batches while this worker is busier than this fraction of MAX_IN_FLIGHT
+ARCHIVE_MAX_FOREGROUND_LOAD = float(os.environ.get("ARCHIVE_MAX_FOREGROUND_LOAD", "0.25"))
+
+LEASE_NAME = "archive-travel-intents"
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def expired_filter(now: Optional[datetime] = None) -> Dict[str, Any]:
+    cutoff = (now or datetime.utcnow()) - timedelta(days=ARCHIVE_GRACE_DAYS)
+    return {"$or": [
+        {"end_date": {"$lt": cutoff}},
+        {"end_date": None, "start_date": {"$lt": cutoff}},
+    ]}
+
+
+def archive_batch(db: Database, batch_size: int = ARCHIVE_BATCH_SIZE) -> List[str]:
+    """Move one batch of expired intents to the archive. Returns the ids moved."""
+    intents = list(db.travel_intents.find(expired_filter()).limit(batch_size))
+    if not intents:
+        return []
+
+    archived_at = datetime.utcnow()
+    for intent in intents:
+        intent["archived_at"] = archived_at
+
+    try:
+        db[ARCHIVE_COLLECTION].insert_many(intents, ordered=False)
+    except BulkWriteError as e:
+        # Copies left behind by an interrupted run are fine; anything else is not
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+    intent_ids = [intent["_id"] for intent in intents]
+    db.travel_intents.delete_many({"_id": {"$in": intent_ids}})
+    archived = [str(intent_id) for intent_id in intent_ids]
+    remove_intents_from_feeds(db, archived)
+    db.group_suggestions.delete_many({"intent_ids": {"$in": archived}})
+    return archived
+
+
+async def run_archival(db: Database, foreground_load: Callable[[], float]):
+    """
+    Archive expired intents in throttled batches. `foreground_load` returns
+    the fraction of this worker's request capacity in use.
+    """
+    if not await asyncio.to_thread(
+        try_acquire_lease, db, LEASE_NAME, LEASE_OWNER, ARCHIVE_INTERVAL_SECONDS
+    ):
+        return
+
+    total = 0
+    for _ in range(ARCHIVE_MAX_BATCHES_PER_RUN):
+        while foreground_load() > ARCHIVE_MAX_FOREGROUND_LOAD:
+            await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+
+        archived = await asyncio.to_thread(archive_batch, db)
+        # Stop this worker's searches returning archived intents
+        for intent_id in archived:
+            unindex_intent(intent_id)
+        total += len(archived)
+        if len(archived) < ARCHIVE_BATCH_SIZE:
+            break
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+
+    if total:
+        logger.info(f"Archived {total} expired travel intents")
+
+
+_archival_task: Optional[PeriodicTask] = None
+
+
+async def start_archival(db: Database, foreground_load: Callable[[], float] = lambda: 0.0):
+    global _archival_task
+    if not ARCHIVE_ENABLED:
+        return
+    _archival_task = PeriodicTask("archive-travel-intents", ARCHIVE_INTERVAL_SECONDS, lambda: run_archival(db, foreground_load))
+    _archival_task.start()
+
+
+async def stop_archival():
+    global _archival_task
+    if _archival_task is not None:
+        await _archival_task.stop()
+        _archival_task = None
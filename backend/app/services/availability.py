@@ -0,0 +1,147 @@
+"""
+Username and email availability checks for the signup form.
+
+Each worker keeps a Bloom filter of taken usernames and one of taken
+emails. A miss means the value is free and is answered without touching
+MongoDB; only possible hits are confirmed with an indexed lookup.
+
+The filters are built at startup from covered scans of the unique
+username/email indexes. Registrations handled by this worker are added
+right away, and a periodic sync adds users created by other workers
+(by created_at, re-reading an overlap window in pages of (created_at, _id)
+so inserts from other workers that land out of order are not skipped). Until that sync runs, a
+value just registered on another worker can briefly show as available;
+registration itself is still guarded by the unique indexes. Bloom filters
+can't forget, so a freed value costs one lookup instead of none.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from pymongo.database import Database
+
+from app.utils.bloom import BloomFilter
+from app.utils.mongo import SYNC_PAGE_SIZE, sync_page
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger("backpacker-api.availability")
+
+AVAILABILITY_SYNC_SECONDS = float(os.environ.get("AVAILABILITY_SYNC_SECONDS", "5"))
+AVAILABILITY_ERROR_RATE = float(os.environ.get("AVAILABILITY_ERROR_RATE", "0.001"))
+# Filters are sized for the current user count times this, and rebuilt when full
+AVAILABILITY_HEADROOM = 2
+
+FIELDS = ("username", "email")
+
+
+class AvailabilityIndex:
+    def __init__(self, capacity: int):
+        self.filters = {field: BloomFilter(capacity, AVAILABILITY_ERROR_RATE) for field in FIELDS}
+        # Newest created_at read from MongoDB by a build or sync pass
+        self.synced_at: Optional[datetime] = None
+
+    def add_user(self, user: dict):
+        for field in FIELDS:
+            value = user.get(field)
+            # Users re-read from the sync overlap are usually in already; don't count them twice
+            if value and value not in self.filters[field]:
+                self.filters[field].add(value)
+
+    def mark_synced(self, user: dict):
+        created_at = user.get("created_at")
+        if isinstance(created_at, datetime) and (self.synced_at is None or created_at > self.synced_at):
+            self.synced_at = created_at
+
+    def might_exist(self, field: str, value: str) -> bool:
+        return value in self.filters[field]
+
+    @property
+    def is_full(self) -> bool:
+        return any(bloom.is_full for bloom in self.filters.values())
+
+
+def build_availability_index(db: Database) -> AvailabilityIndex:
+    # Anything inserted after this point is picked up by the next sync
+    newest = db.users.find_one({}, {"created_at": 1}, sort=[("created_at", -1)])
+    total = db.users.estimated_document_count()
+    index = AvailabilityIndex(max(total * AVAILABILITY_HEADROOM, 10000))
+
+    for field in FIELDS:
+        bloom = index.filters[field]
+        # Covered by the unique index: keys are read without fetching documents
+        for user in db.users.find({}, {field: 1, "_id": 0}).hint([(field, 1)]):
+            if user.get(field):
+                bloom.add(user[field])
+
+    if newest:
+        index.mark_synced(newest)
+    logger.info(f"Built availability filters for {total} users")
+    return index
+
+
+_index: Optional[AvailabilityIndex] = None
+_sync_task: Optional[PeriodicTask] = None
+_rebuilding = False
+
+
+def record_user(user: dict):
+    """Add a newly registered user to this worker's filters"""
+    if _index is not None:
+        _index.add_user(user)
+
+
+async def rebuild_availability_index(db: Database):
+    global _index, _rebuilding
+    if _rebuilding:
+        return
+    _rebuilding = True
+    try:
+        _index = await asyncio.to_thread(build_availability_index, db)
+    finally:
+        _rebuilding = False
+
+
+async def sync_availability_index(db: Database):
+    """Add users created by other workers; rebuild larger once a filter fills up"""
+    if _index is None or _rebuilding:
+        return
+    if _index.is_full:
+        await rebuild_availability_index(db)
+        return
+
+    index = _index
+    watermark = index.synced_at
+    last = None
+    while True:
+        users = await asyncio.to_thread(
+            sync_page, db.users, watermark, {"username": 1, "email": 1, "created_at": 1}, last
+        )
+        for user in users:
+            index.add_user(user)
+            index.mark_synced(user)
+        if len(users) < SYNC_PAGE_SIZE:
+            break
+        last = users[-1]
+
+
+def is_available(db: Database, field: str, value: str) -> bool:
+    """Whether no user has this username/email. Only possible matches reach MongoDB."""
+    if _index is not None and not _index.might_exist(field, value):
+        return True
+    return db.users.find_one({field: value}, {field: 1, "_id": 0}) is None
+
+
+async def start_availability_index(db: Database):
+    global _sync_task
+    asyncio.create_task(rebuild_availability_index(db))
+    _sync_task = PeriodicTask("availability-sync", AVAILABILITY_SYNC_SECONDS, lambda: sync_availability_index(db))
+    _sync_task.start()
+
+
+async def stop_availability_index():
+    global _sync_task
+    if _sync_task is not None:
+        await _sync_task.stop()
+        _sync_task = None
@@ -0,0 +1,224 @@
+"""
+Server-side chat sessions.
+
+A session stores its history in MongoDB as one small document per turn
+(`chat_turns`: session_id, seq, user, assistant), so clients only send the
+new message. Each worker keeps an LRU cache of recent sessions holding the
+formatted LangChain messages of the turns that fit in the context budget,
+so a turn costs a constant number of point reads and writes and no longer
+re-parses the whole conversation. A cached session is reloaded when another
+worker has appended turns to it since it was cached.
+
+Sessions created with a bearer token have an ObjectId and are private to
+their user. Anonymous sessions can be read by whoever holds their id, so
+they get a random token instead, which can't be guessed from another
+session's id the way an ObjectId (timestamp + counter) can.
+"""
+import os
+import secrets
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pymongo import ReturnDocument
+from pymongo.database import Database
+
+CHAT_SESSION_CACHE_SIZE = int(os.environ.get("CHAT_SESSION_CACHE_SIZE", "1000"))
+# Turns read per query when loading a session's window from MongoDB
+LOAD_BATCH_TURNS = 50
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class CachedSession:
+    """The formatted tail of a session that fits in the token budget"""
+
+    def __init__(self, turn_count: int, summary: str = "", summary_turns: int = 0):
+        self.turn_count = turn_count
+        # (tokens, HumanMessage, AIMessage), oldest first
+        self.window: Deque[Tuple[int, HumanMessage, AIMessage]] = deque()
+        self.window_tokens = 0
+        self.summary = summary
+        self.summary_turns = summary_turns
+
+    @property
+    def dropped_turns(self) -> int:
+        """Turns that have fallen out of the window"""
+        return self.turn_count - len(self.window)
+
+    def append(self, tokens: int, user: str, assistant: str, budget: int):
+        self.window.append((tokens, HumanMessage(content=user), AIMessage(content=assistant)))
+        self.window_tokens += tokens
+        self.trim(budget)
+
+    def trim(self, budget: int):
+        # Always keep the newest turn, even if it alone exceeds the budget
+        while self.window_tokens > budget and len(self.window) > 1:
+            tokens, _, _ = self.window.popleft()
+            self.window_tokens -= tokens
+
+    def messages(self) -> List[BaseMessage]:
+        formatted: List[BaseMessage] = []
+        for _, user, assistant in self.window:
+            formatted.append(user)
+            formatted.append(assistant)
+        return formatted
+
+
+_sessions: "OrderedDict[str, CachedSession]" = OrderedDict()
+
+
+def _remember(session_id: str, session: CachedSession):
+    _sessions[session_id] = session
+    _sessions.move_to_end(session_id)
+    while len(_sessions) > CHAT_SESSION_CACHE_SIZE:
+        _sessions.popitem(last=False)
+
+
+def forget_session(session_id: str):
+    _sessions.pop(session_id, None)
+
+
+def session_filter(session_id: str) -> Dict[str, Any]:
+    return {"_id": ObjectId(session_id) if ObjectId.is_valid(session_id) else session_id}
+
+
+def create_session(db: Database, user_id: Optional[str]) -> str:
+    now = datetime.utcnow()
+    session = {} if user_id else {"_id": secrets.token_urlsafe(24)}
+    result = db.chat_sessions.insert_one({
+        **session,
+        "user_id": user_id,
+        "turn_count": 0,
+        "summary": "",
+        "summary_turns": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    return str(result.inserted_id)
+
+
+def get_session_doc(db: Database, session_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+    """Load a session's metadata, hiding sessions that belong to someone else"""
+    doc = db.chat_sessions.find_one(
+        session_filter(session_id),
+        {"user_id": 1, "turn_count": 1, "summary": 1, "summary_turns": 1}
+    )
+    if doc is None:
+        raise SessionNotFound(session_id)
+    if doc.get("user_id"):
+        if doc["user_id"] != user_id:
+            raise SessionNotFound(session_id)
+    elif isinstance(doc["_id"], ObjectId):
+        # Anonymous session from before tokens; its id may have been guessed
+        raise SessionNotFound(session_id)
+    return doc
+
+
+def load_session(
+    db: Database,
+    session_id: str,
+    doc: Dict[str, Any],
+    count_tokens: Callable[[str], int],
+    budget: int
+) -> CachedSession:
+    """The cached window for a session, reloading the newest turns if it is stale"""
+    session = _sessions.get(session_id)
+    if session is not None and session.turn_count == doc["turn_count"]:
+        _sessions.move_to_end(session_id)
+        return session
+
+    session = CachedSession(doc["turn_count"], doc.get("summary", ""), doc.get("summary_turns", 0))
+    newest_first = []
+    used = 0
+    before = doc["turn_count"]
+    while before > 0 and used <= budget:
+        turns = list(
+            db.chat_turns.find({"session_id": session_id, "seq": {"$lt": before}}, {"user": 1, "assistant": 1, "seq": 1})
+            .sort("seq", -1)
+            .limit(LOAD_BATCH_TURNS)
+        )
+        if not turns:
+            break
+        for turn in turns:
+            tokens = count_tokens(turn["user"]) + count_tokens(turn["assistant"])
+            if used + tokens > budget and newest_first:
+                before = 0
+                break
+            used += tokens
+            newest_first.append((tokens, turn))
+            before = turn["seq"]
+
+    for tokens, turn in reversed(newest_first):
+        session.window.append((tokens, HumanMessage(content=turn["user"]), AIMessage(content=turn["assistant"])))
+        session.window_tokens += tokens
+    _remember(session_id, session)
+    return session
+
+
+def append_turn(
+    db: Database,
+    session_id: str,
+    session: CachedSession,
+    user: str,
+    assistant: str,
+    tokens: int,
+    budget: int
+):
+    """Persist a completed turn and add it to the cached window"""
+    before = db.chat_sessions.find_one_and_update(
+        session_filter(session_id),
+        {"$inc": {"turn_count": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"turn_count": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        # Deleted while the model was answering
+        forget_session(session_id)
+        raise SessionNotFound(session_id)
+
+    seq = before["turn_count"]
+    db.chat_turns.insert_one({
+        "session_id": session_id,
+        "seq": seq,
+        "user": user,
+        "assistant": assistant,
+        "created_at": datetime.utcnow(),
+    })
+
+    if seq == session.turn_count:
+        session.turn_count += 1
+        session.append(tokens, user, assistant, budget)
+    else:
+        # Another worker appended turns meanwhile; reload on the next turn
+        forget_session(session_id)
+
+
+def get_turns(db: Database, session_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Turns with start <= seq < end, oldest first"""
+    return list(
+        db.chat_turns.find({"session_id": session_id, "seq": {"$gte": start, "$lt": end}}, {"_id": 0, "user": 1, "assistant": 1, "seq": 1})
+        .sort("seq", 1)
+    )
+
+
+def save_summary(db: Database, session_id: str, summary: str, summary_turns: int):
+    """Store a rolling summary unless a newer one has been saved meanwhile"""
+    db.chat_sessions.update_one(
+        {**session_filter(session_id), "summary_turns": {"$lt": summary_turns}},
+        {"$set": {"summary": summary, "summary_turns": summary_turns}}
+    )
+    session = _sessions.get(session_id)
+    if session is not None and session.summary_turns < summary_turns:
+        session.summary = summary
+        session.summary_turns = summary_turns
+
+
+def delete_session(db: Database, session_id: str):
+    db.chat_sessions.delete_one(session_filter(session_id))
+    db.chat_turns.delete_many({"session_id": session_id})
+    forget_session(session_id)
@@ -0,0 +1,89 @@
+"""
+Write-behind engagement counters (view counts on intents and profiles).
+
+Increments are aggregated in memory per (collection, document, field) and
+flushed every COUNTER_FLUSH_SECONDS as one unordered bulk_write of `$inc`
+updates, plus a final flush on shutdown. A crashed worker loses at most one
+interval of increments. A failed flush puts its increments back so the
+next run retries them.
+
+Counters live on the documents themselves, so reads pick them up with the
+rest of the document; `with_pending` adds this worker's unflushed
+increments on top. They don't bump the document version, so a cached
+(ETag) response can show an older count.
+"""
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger("backpacker-api.counters")
+
+COUNTER_FLUSH_SECONDS = float(os.environ.get("COUNTER_FLUSH_SECONDS", "5"))
+
+VIEW_COUNT = "view_count"
+
+CounterKey = Tuple[str, ObjectId]
+
+_pending: Dict[CounterKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_task: Optional[PeriodicTask] = None
+
+
+def increment(collection: str, doc_id: Any, field: str = VIEW_COUNT, amount: int = 1):
+    """Buffer an increment; call from the event loop"""
+    if not isinstance(doc_id, ObjectId):
+        doc_id = ObjectId(doc_id)
+    _pending[(collection, doc_id)][field] += amount
+
+
+def with_pending(collection: str, doc: Dict[str, Any], field: str = VIEW_COUNT) -> Dict[str, Any]:
+    """Add this worker's unflushed increments to a document's counter"""
+    pending = _pending.get((collection, doc["_id"]), {}).get(field, 0)
+    doc[field] = doc.get(field, 0) + pending
+    return doc
+
+
+def _write(db: Database, batch: Dict[CounterKey, Dict[str, int]]):
+    by_collection = defaultdict(list)
+    for (collection, doc_id), fields in batch.items():
+        by_collection[collection].append(UpdateOne({"_id": doc_id}, {"$inc": dict(fields)}))
+    for collection, operations in by_collection.items():
+        db[collection].bulk_write(operations, ordered=False)
+
+
+async def flush_counters(db: Database):
+    global _pending
+    if not _pending:
+        return
+    # Swap the buffer so requests keep counting while the batch is written
+    batch, _pending = _pending, defaultdict(lambda: defaultdict(int))
+    try:
+        await asyncio.to_thread(_write, db, batch)
+    except Exception:
+        # $inc isn't idempotent, so a partly applied batch may double count on retry
+        for key, fields in batch.items():
+            for field, amount in fields.items():
+                _pending[key][field] += amount
+        raise
+    logger.debug(f"Flushed counters for {len(batch)} documents")
+
+
+async def start_counters(db: Database):
+    global _task
+    _task = PeriodicTask("counter-flush", COUNTER_FLUSH_SECONDS, lambda: flush_counters(db))
+    _task.start()
+
+
+async def stop_counters():
+    global _task
+    if _task is not None:
+        # Write out whatever is still buffered
+        await _task.stop(run_once=True)
+        _task = None
@@ -0,0 +1,262 @@
+"""
+Materialized per-user travel intent feeds.
+
+Each user gets a profile of normalized destinations, activities and travel
+styles built from their own intents, their `travel_preferences`, their trips
+and the intents they showed interest in. Feed entries embed a snapshot of the
+intent with a precomputed score, so a feed page is a single read on the
+(user_id, score, intent_id) index. New intents are fanned out only to the
+profiles they match, and each feed that receives one is trimmed back to
+FEED_MAX_SIZE entries; full rebuilds happen in the background when a
+profile goes stale.
+"""
+import os
+import json
+import base64
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.database import Database
+
+from app.services.interests import INTENT_PROJECTION, get_interested_intent_ids
+from app.utils.text import normalize_destination, normalize_key, normalize_keys
+
+logger = logging.getLogger("backpacker-api.feed")
+
+FEED_MAX_SIZE = int(os.environ.get("FEED_MAX_SIZE", "500"))
+FEED_CANDIDATE_LIMIT = int(os.environ.get("FEED_CANDIDATE_LIMIT", "5000"))
+FEED_REFRESH_SECONDS = int(os.environ.get("FEED_REFRESH_SECONDS", "3600"))
+
+# Relevance weights
+DESTINATION_WEIGHT = 5.0
+ACTIVITY_WEIGHT = 2.0
+MAX_ACTIVITY_MATCHES = 3
+STYLE_WEIGHT = 2.0
+# One point of relevance is worth this much recency
+RECENCY_PERIOD = timedelta(days=30).total_seconds()
+
+_rebuilds_in_progress: set = set()
+
+
+def user_id_variants(user_id: str) -> List[Any]:
+    """Intents store user_id as an ObjectId when possible, else as a string"""
+    variants: List[Any] = [user_id]
+    if ObjectId.is_valid(user_id):
+        variants.append(ObjectId(user_id))
+    return variants
+
+
+def serialize_intent(intent: Dict[str, Any]) -> Dict[str, Any]:
+    """Snapshot of an intent as returned by the API"""
+    snapshot = {k: v for k, v in intent.items() if k not in ("_id", "interested_users")}
+    snapshot["id"] = str(intent["_id"])
+    snapshot["user_id"] = str(intent["user_id"])
+    return snapshot
+
+
+def build_profile(db: Database, user_id: str) -> Dict[str, Any]:
+    """Collect the signals a user's feed is ranked on"""
+    destinations: List[str] = []
+    activities: List[str] = []
+    travel_styles: List[str] = []
+
+    projection = {"destination": 1, "activities": 1, "travel_style": 1}
+
+    # The user's own intents
+    own = db.travel_intents.find({"user_id": {"$in": user_id_variants(user_id)}}, projection)
+    # Past interactions: intents the user showed interest in
+    interested = db.travel_intents.find({"_id": {"$in": get_interested_intent_ids(db, user_id)}}, projection)
+
+    for intent in list(own) + list(interested):
+        destinations.append(intent.get("destination", ""))
+        activities.extend(intent.get("activities") or [])
+        if intent.get("travel_style"):
+            travel_styles.append(intent["travel_style"])
+
+    if ObjectId.is_valid(user_id):
+        user = db.users.find_one(
+            {"_id": ObjectId(user_id)},
+            {"travel_preferences": 1, "upcoming_trips": 1, "past_trips": 1}
+        )
+        if user:
+            preferences = user.get("travel_preferences") or {}
+            travel_styles.extend(preferences.get("travel_styles") or [])
+            for trip in (user.get("upcoming_trips") or []) + (user.get("past_trips") or []):
+                destinations.append(trip.get("destination", ""))
+
+    return {
+        "_id": user_id,
+        "destinations": normalize_keys(destinations),
+        "activities": normalize_keys(activities),
+        "travel_styles": normalize_keys(travel_styles),
+        "built_at": datetime.utcnow(),
+    }
+
+
+def score_intent(profile: Dict[str, Any], intent: Dict[str, Any]) -> float:
+    """Relevance plus a recency term, fixed at materialization time"""
+    relevance = 0.0
+    if normalize_destination(intent.get("destination", "")) in profile["destinations"]:
+        relevance += DESTINATION_WEIGHT
+    overlap = len(set(normalize_keys(intent.get("activities") or [])) & set(profile["activities"]))
+    relevance += ACTIVITY_WEIGHT * min(overlap, MAX_ACTIVITY_MATCHES)
+    if normalize_key(intent.get("travel_style") or "") in profile["travel_styles"]:
+        relevance += STYLE_WEIGHT
+
+    created_at = intent.get("created_at") or datetime.utcnow()
+    return relevance + created_at.timestamp() / RECENCY_PERIOD
+
+
+def feed_entry(user_id: str, intent: Dict[str, Any], score: float) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "intent_id": str(intent["_id"]),
+        "score": score,
+        "intent": serialize_intent(intent),
+    }
+
+
+def rebuild_feed(db: Database, user_id: str):
+    """Rebuild a user's profile and feed from scratch"""
+    if user_id in _rebuilds_in_progress:
+        return
+    _rebuilds_in_progress.add(user_id)
+    try:
+        profile = build_profile(db, user_id)
+        db.feed_profiles.replace_one({"_id": user_id}, profile, upsert=True)
+
+        candidates = (
+            db.travel_intents.find({"user_id": {"$nin": user_id_variants(user_id)}}, INTENT_PROJECTION)
+            .sort("created_at", -1)
+            .limit(FEED_CANDIDATE_LIMIT)
+        )
+        scored = sorted(
+            ((score_intent(profile, intent), intent) for intent in candidates),
+            key=lambda pair: pair[0],
+            reverse=True
+        )[:FEED_MAX_SIZE]
+
+        if scored:
+            db.intent_feeds.bulk_write([
+                ReplaceOne(
+                    {"user_id": user_id, "intent_id": str(intent["_id"])},
+                    feed_entry(user_id, intent, score),
+                    upsert=True
+                )
+                for score, intent in scored
+            ], ordered=False)
+        db.intent_feeds.delete_many({
+            "user_id": user_id,
+            "intent_id": {"$nin": [str(intent["_id"]) for _, intent in scored]}
+        })
+        logger.info(f"Rebuilt feed for user {user_id} with {len(scored)} entries")
+    except Exception as e:
+        logger.error(f"Failed to rebuild feed for user {user_id}: {e}")
+    finally:
+        _rebuilds_in_progress.discard(user_id)
+
+
+def refresh_feed_if_stale(db: Database, user_id: str):
+    profile = db.feed_profiles.find_one({"_id": user_id}, {"built_at": 1})
+    if profile is None:
+        # Only materialize feeds for users that still exist
+        if not ObjectId.is_valid(user_id) or db.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}) is None:
+            return
+    elif profile["built_at"] >= datetime.utcnow() - timedelta(seconds=FEED_REFRESH_SECONDS):
+        return
+    rebuild_feed(db, user_id)
+
+
+def add_intent_to_feeds(db: Database, intent: Dict[str, Any]):
+    """Insert a new intent into the feeds of the profiles it matches"""
+    try:
+        destination = normalize_destination(intent.get("destination", ""))
+        activities = normalize_keys(intent.get("activities") or [])
+        style = normalize_key(intent.get("travel_style") or "")
+
+        match = [{"destinations": destination}]
+        if activities:
+            match.append({"activities": {"$in": activities}})
+        if style:
+            match.append({"travel_styles": style})
+
+        author = str(intent["user_id"])
+        operations = []
+        user_ids = []
+        for profile in db.feed_profiles.find({"$or": match}):
+            if profile["_id"] == author:
+                continue
+            user_ids.append(profile["_id"])
+            operations.append(ReplaceOne(
+                {"user_id": profile["_id"], "intent_id": str(intent["_id"])},
+                feed_entry(profile["_id"], intent, score_intent(profile, intent)),
+                upsert=True
+            ))
+        if operations:
+            db.intent_feeds.bulk_write(operations, ordered=False)
+            trim_feeds(db, user_ids)
+    except Exception as e:
+        logger.error(f"Failed to fan out intent {intent.get('_id')}: {e}")
+
+
+def trim_feeds(db: Database, user_ids: List[str]):
+    """Drop the lowest-scored entries of feeds grown past FEED_MAX_SIZE"""
+    overflow = []
+    for user_id in user_ids:
+        # Read along the feed page index; usually only the entry the fan-out pushed out
+        overflow.extend(
+            entry["_id"] for entry in
+            db.intent_feeds.find({"user_id": user_id}, {"_id": 1})
+            .sort([("score", -1), ("intent_id", -1)])
+            .skip(FEED_MAX_SIZE)
+        )
+    if overflow:
+        db.intent_feeds.delete_many({"_id": {"$in": overflow}})
+
+
+def remove_intent_from_feeds(db: Database, intent_id: str):
+    db.intent_feeds.delete_many({"intent_id": intent_id})
+
+
+def remove_intents_from_feeds(db: Database, intent_ids: List[str]):
+    if intent_ids:
+        db.intent_feeds.delete_many({"intent_id": {"$in": intent_ids}})
+
+
+def encode_cursor(score: float, intent_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, intent_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    score, intent_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return float(score), str(intent_id)
+
+
+def get_feed_page(
+    db: Database,
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Read one page of a user's feed, newest-best first"""
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor:
+        score, intent_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"score": {"$lt": score}},
+            {"score": score, "intent_id": {"$lt": intent_id}},
+        ]
+
+    entries = list(
+        db.intent_feeds.find(query, {"_id": 0, "score": 1, "intent_id": 1, "intent": 1})
+        .sort([("score", -1), ("intent_id", -1)])
+        .limit(limit)
+    )
+
+    next_cursor = None
+    if len(entries) == limit:
+        next_cursor = encode_cursor(entries[-1]["score"], entries[-1]["intent_id"])
+    return [entry["intent"] for entry in entries], next_cursor
@@ -0,0 +1,335 @@
+"""
+Suggested travel groups.
+
+Open intents (not yet in a group) are bucketed by normalized destination
+and a sliding date window: windows are GROUP_WINDOW_DAYS long and start
+every GROUP_WINDOW_STEP_DAYS, so an intent belongs to every window its
+start date falls in. Within a bucket, groups are formed greedily from
+pairwise-compatible intents: different users, enough overlapping days, a
+shared activity when both list some, and no more members than any member's
+`max_travelers` (or `group_size`) allows.
+
+Suggestions are precomputed into `group_suggestions`, one set per bucket.
+A periodic job re-clusters only the buckets touched by intents created
+since its last run, paging on (created_at, _id). It leaves intents from the
+last SYNC_OVERLAP_SECONDS for the next run, since ones created just before
+them may still be committing. Deleting an intent re-clusters its buckets
+right away. Each re-cluster of a bucket takes the bucket's next version
+before reading its intents, and suggestions carry the version that wrote
+them: a re-cluster never overwrites a newer version's suggestions, and
+removes its own if a newer one started meanwhile, so racing re-clusters
+leave exactly the newest one's groups. Buckets overlap, so the same intent
+can appear in suggestions for two adjacent windows.
+"""
+import os
+import socket
+import hashlib
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+from app.utils.mongo import SYNC_OVERLAP_SECONDS, after_cursor, try_acquire_lease, utcnow
+from app.utils.periodic import PeriodicTask
+from app.utils.text import normalize_destination, normalize_keys, normalize_key
+
+logger = logging.getLogger("backpacker-api.group-suggestions")
+
+GROUP_SUGGESTIONS_ENABLED = os.environ.get("GROUP_SUGGESTIONS_ENABLED", "true").lower() == "true"
+GROUP_SUGGESTIONS_INTERVAL_SECONDS = float(os.environ.get("GROUP_SUGGESTIONS_INTERVAL_SECONDS", "60"))
+GROUP_WINDOW_DAYS = int(os.environ.get("GROUP_WINDOW_DAYS", "14"))
+GROUP_WINDOW_STEP_DAYS = int(os.environ.get("GROUP_WINDOW_STEP_DAYS", "7"))
+GROUP_MIN_OVERLAP_DAYS = int(os.environ.get("GROUP_MIN_OVERLAP_DAYS", "2"))
+GROUP_DEFAULT_MAX_TRAVELERS = int(os.environ.get("GROUP_DEFAULT_MAX_TRAVELERS", "6"))
+# Largest number of intents clustered per bucket (pairwise scoring is quadratic)
+GROUP_BUCKET_LIMIT = int(os.environ.get("GROUP_BUCKET_LIMIT", "500"))
+# New intents processed per job run
+GROUP_SYNC_BATCH = int(os.environ.get("GROUP_SYNC_BATCH", "1000"))
+
+# Compatibility weights
+ACTIVITY_WEIGHT = 1.0
+STYLE_WEIGHT = 0.5
+BUDGET_WEIGHT = 0.5
+
+# Windows are aligned to a Monday
+WINDOW_EPOCH = datetime(1970, 1, 5)
+
+LEASE_NAME = "group-suggestions"
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+INTENT_FIELDS = {
+    "user_id": 1, "destination": 1, "destination_key": 1, "start_date": 1, "end_date": 1,
+    "activities": 1, "travel_style": 1, "budget_range": 1, "group_size": 1, "max_travelers": 1,
+    "created_at": 1,
+}
+
+
+def window_indexes(start_date: datetime) -> List[int]:
+    """Indexes of the sliding windows a start date falls in"""
+    days = (start_date - WINDOW_EPOCH).days
+    last = days // GROUP_WINDOW_STEP_DAYS
+    first = (days - GROUP_WINDOW_DAYS) // GROUP_WINDOW_STEP_DAYS + 1
+    return list(range(first, last + 1))
+
+
+def window_bounds(index: int) -> Tuple[datetime, datetime]:
+    start = WINDOW_EPOCH + timedelta(days=index * GROUP_WINDOW_STEP_DAYS)
+    return start, start + timedelta(days=GROUP_WINDOW_DAYS)
+
+
+def intent_buckets(intent: Dict[str, Any]) -> List[Tuple[str, int]]:
+    key = intent.get("destination_key") or normalize_destination(intent.get("destination", ""))
+    if not key or not isinstance(intent.get("start_date"), datetime):
+        return []
+    return [(key, index) for index in window_indexes(intent["start_date"])]
+
+
+def _span(intent: Dict[str, Any]) -> Tuple[datetime, datetime]:
+    start = intent["start_date"]
+    end = intent.get("end_date") or start
+    return start, max(start, end)
+
+
+def _capacity(intent: Dict[str, Any]) -> int:
+    return intent.get("max_travelers") or intent.get("group_size") or GROUP_DEFAULT_MAX_TRAVELERS
+
+
+def compatibility(a: Dict[str, Any], b: Dict[str, Any]) -> Optional[float]:
+    """Score how well two intents fit in one group, or None if they don't"""
+    if str(a["user_id"]) == str(b["user_id"]):
+        return None
+    (a_start, a_end), (b_start, b_end) = _span(a), _span(b)
+    overlap = (min(a_end, b_end) - max(a_start, b_start)).days + 1
+    if overlap < GROUP_MIN_OVERLAP_DAYS:
+        return None
+    shortest = min((a_end - a_start).days, (b_end - b_start).days) + 1
+
+    a_activities, b_activities = a["_activities"], b["_activities"]
+    shared = len(a_activities & b_activities)
+    if a_activities and b_activities and not shared:
+        return None
+    jaccard = shared / len(a_activities | b_activities) if shared else 0.0
+
+    score = min(overlap / shortest, 1.0) + ACTIVITY_WEIGHT * jaccard
+    if a["_style"] and a["_style"] == b["_style"]:
+        score += STYLE_WEIGHT
+    if a.get("budget_range") and a.get("budget_range") == b.get("budget_range"):
+        score += BUDGET_WEIGHT
+    return score
+
+
+def form_groups(intents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Greedily partition a bucket's intents into compatible groups of two or more"""
+    for intent in intents:
+        intent["_activities"] = set(normalize_keys(intent.get("activities") or []))
+        intent["_style"] = normalize_key(intent.get("travel_style") or "")
+
+    n = len(intents)
+    scores: List[Dict[int, float]] = [{} for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            score = compatibility(intents[i], intents[j])
+            if score is not None:
+                scores[i][j] = scores[j][i] = score
+
+    unassigned = set(range(n))
+    groups = []
+    # Seed with the most connected intents first; ties go to the earliest start
+    for seed in sorted(range(n), key=lambda i: -len(scores[i])):
+        if seed not in unassigned or not scores[seed]:
+            continue
+        members = [seed]
+        capacity = _capacity(intents[seed])
+        candidates = {j for j in scores[seed] if j in unassigned}
+        while candidates and len(members) < capacity:
+            best, best_score = None, 0.0
+            for j in candidates:
+                if len(members) + 1 > _capacity(intents[j]):
+                    continue
+                total = 0.0
+                for m in members:
+                    if j not in scores[m]:
+                        break
+                    total += scores[m][j]
+                else:
+                    if best is None or total / len(members) > best_score:
+                        best, best_score = j, total / len(members)
+            if best is None:
+                break
+            members.append(best)
+            capacity = min(capacity, _capacity(intents[best]))
+            candidates.discard(best)
+
+        if len(members) < 2:
+            continue
+        unassigned.difference_update(members)
+        group = [intents[m] for m in members]
+        pair_scores = [scores[a][b] for x, a in enumerate(members) for b in members[x + 1:]]
+        groups.append({
+            "intent_ids": [str(intent["_id"]) for intent in group],
+            "user_ids": [str(intent["user_id"]) for intent in group],
+            "start_date": max(_span(intent)[0] for intent in group),
+            "end_date": min(_span(intent)[1] for intent in group),
+            "shared_activities": sorted(set.intersection(*(intent["_activities"] for intent in group))),
+            "capacity": capacity,
+            "score": round(sum(pair_scores) / len(pair_scores), 4),
+        })
+    return groups
+
+
+def bucket_id(key: str, index: int) -> str:
+    return f"{key}|{index}"
+
+
+def suggestion_id(bucket: str, intent_ids: List[str]) -> str:
+    members = ",".join(sorted(intent_ids))
+    return hashlib.blake2b(f"{bucket}:{members}".encode(), digest_size=12).hexdigest()
+
+
+def recluster_bucket(db: Database, key: str, index: int) -> int:
+    """Recompute the suggestions of one (destination, window) bucket"""
+    bucket = bucket_id(key, index)
+    # Taken before reading, so a higher version has seen at least as many intents
+    version = db.group_suggestion_state.find_one_and_update(
+        {"_id": bucket}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )["version"]
+    window_start, window_end = window_bounds(index)
+    intents = list(
+        db.travel_intents.find({
+            "destination_key": key,
+            "start_date": {"$gte": window_start, "$lt": window_end},
+            "group_id": None,
+            "is_active": {"$ne": False},
+        }, INTENT_FIELDS)
+        .sort("start_date", 1)  # Index order of (destination_key, start_date)
+        .limit(GROUP_BUCKET_LIMIT)
+    )
+    now = utcnow()
+    suggestions = [
+        {
+            **group,
+            "_id": suggestion_id(bucket, group["intent_ids"]),
+            "bucket": bucket,
+            "destination": intents[0].get("destination", key),
+            "destination_key": key,
+            "window_start": window_start,
+            "window_end": window_end,
+            "version": version,
+            "updated_at": now,
+        }
+        for group in form_groups(intents)
+    ]
+
+    if suggestions:
+        try:
+            db.group_suggestions.bulk_write([
+                ReplaceOne({"_id": suggestion["_id"], "version": {"$not": {"$gt": version}}}, suggestion, upsert=True)
+                for suggestion in suggestions
+            ], ordered=False)
+        except BulkWriteError as e:
+            # A newer version already wrote that group
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    # Groups from older versions that no longer form (also matches suggestions without a version)
+    db.group_suggestions.delete_many({"bucket": bucket, "version": {"$not": {"$gte": version}}})
+    latest = db.group_suggestion_state.find_one({"_id": bucket}, {"version": 1})["version"]
+    if latest > version:
+        # A newer re-cluster started and may have cleaned up already; its groups replace these
+        db.group_suggestions.delete_many({"bucket": bucket, "version": version})
+        return 0
+    return len(suggestions)
+
+
+def recluster_buckets(db: Database, buckets: Iterable[Tuple[str, int]]) -> int:
+    return sum(recluster_bucket(db, key, index) for key, index in sorted(set(buckets)))
+
+
+def recluster_for_intent(db: Database, intent: Dict[str, Any]):
+    """Refresh the buckets of a created or deleted intent"""
+    try:
+        recluster_buckets(db, intent_buckets(intent))
+    except Exception as e:
+        logger.error(f"Failed to update group suggestions for intent {intent.get('_id')}: {e}")
+
+
+def sync_new_intents(db: Database) -> int:
+    """Re-cluster the buckets of intents created since the last run. Returns the number processed."""
+    state = db.group_suggestion_state.find_one({"_id": "watermark"}) or {}
+    query: Dict[str, Any] = {"created_at": {"$lt": utcnow() - timedelta(seconds=SYNC_OVERLAP_SECONDS)}}
+    if state.get("synced_at") is not None and state.get("last_id") is not None:
+        query = {"$and": [query, after_cursor(state["synced_at"], state["last_id"])]}
+    intents = list(
+        db.travel_intents.find(query, INTENT_FIELDS)
+        .sort([("created_at", 1), ("_id", 1)])
+        .limit(GROUP_SYNC_BATCH)
+    )
+    if not intents:
+        return 0
+
+    # Intents created before destination_key existed get it on first sight
+    backfill = []
+    for intent in intents:
+        if not intent.get("destination_key"):
+            intent["destination_key"] = normalize_destination(intent.get("destination", ""))
+            backfill.append(UpdateOne({"_id": intent["_id"]}, {"$set": {"destination_key": intent["destination_key"]}}))
+    if backfill:
+        db.travel_intents.bulk_write(backfill, ordered=False)
+
+    buckets: Set[Tuple[str, int]] = set()
+    for intent in intents:
+        buckets.update(intent_buckets(intent))
+    count = recluster_buckets(db, buckets)
+
+    last = intents[-1]
+    db.group_suggestion_state.update_one(
+        {"_id": "watermark"},
+        {"$set": {"synced_at": last["created_at"], "last_id": last["_id"], "updated_at": datetime.utcnow()}, "$unset": {"recent": ""}},
+        upsert=True
+    )
+    logger.info(f"Processed {len(intents)} new intents into {len(buckets)} buckets ({count} suggestions)")
+    return len(intents)
+
+
+async def run_group_suggestions(db: Database):
+    if not await asyncio.to_thread(
+        try_acquire_lease, db, LEASE_NAME, LEASE_OWNER, GROUP_SUGGESTIONS_INTERVAL_SECONDS * 2
+    ):
+        return
+    # Catch up in batches; each batch advances the watermark
+    while await asyncio.to_thread(sync_new_intents, db) == GROUP_SYNC_BATCH:
+        await asyncio.sleep(0)
+
+
+_task: Optional[PeriodicTask] = None
+
+
+async def start_group_suggestions(db: Database):
+    global _task
+    if not GROUP_SUGGESTIONS_ENABLED:
+        return
+    _task = PeriodicTask("group-suggestions", GROUP_SUGGESTIONS_INTERVAL_SECONDS, lambda: run_group_suggestions(db))
+    _task.start()
+
+
+async def stop_group_suggestions():
+    global _task
+    if _task is not None:
+        await _task.stop()
+        _task = None
+
+
+if __name__ == "__main__":
+    # Full rebuild: python -m app.services.group_suggestions
+    from app.database import init_db, close_db
+
+    logging.basicConfig(level=logging.INFO)
+    database = init_db()
+    database.group_suggestions.delete_many({})
+    database.group_suggestion_state.delete_one({"_id": "watermark"})
+    while sync_new_intents(database) == GROUP_SYNC_BATCH:
+        pass
+    close_db()
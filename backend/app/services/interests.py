@@ -0,0 +1,137 @@
+"""
+"Interested in this trip" tracking.
+
+Each interest is its own document in `intent_interests`, unique on
+(intent_id, user_id), and the intent carries an `interested_users_count`
+kept in step with `$inc`. Intent reads only ever touch the counter; who is
+interested is a separate, cursor-paginated query.
+
+Older intents embedded an `interested_users` array; run
+`python -m app.services.interests` once to move those into the collection.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger("backpacker-api.interests")
+
+# Keeps legacy embedded arrays out of intent reads
+INTENT_PROJECTION = {"interested_users": 0}
+
+
+class IntentNotFound(Exception):
+    pass
+
+
+def _update_count(db: Database, intent_id: ObjectId, delta: int) -> Optional[Dict[str, Any]]:
+    # The count is part of the intent's representation, so bump its version too
+    return db.travel_intents.find_one_and_update(
+        {"_id": intent_id},
+        {"$inc": {"interested_users_count": delta, "version": 1}},
+        projection={"interested_users_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def express_interest(db: Database, intent_id: str, user_id: str) -> Tuple[bool, int]:
+    """Record interest. Returns (newly recorded, current count)."""
+    intent_oid = ObjectId(intent_id)
+    intent = db.travel_intents.find_one({"_id": intent_oid}, {"interested_users_count": 1})
+    if intent is None:
+        raise IntentNotFound(intent_id)
+
+    try:
+        db.intent_interests.insert_one({
+            "intent_id": intent_oid,
+            "user_id": user_id,
+            "created_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return False, intent.get("interested_users_count", 0)
+
+    updated = _update_count(db, intent_oid, 1)
+    if updated is None:
+        # The intent was deleted in between; don't leave the interest behind
+        db.intent_interests.delete_one({"intent_id": intent_oid, "user_id": user_id})
+        raise IntentNotFound(intent_id)
+    return True, updated["interested_users_count"]
+
+
+def withdraw_interest(db: Database, intent_id: str, user_id: str) -> Tuple[bool, int]:
+    """Remove interest. Returns (was interested, current count)."""
+    intent_oid = ObjectId(intent_id)
+    result = db.intent_interests.delete_one({"intent_id": intent_oid, "user_id": user_id})
+    if result.deleted_count:
+        updated = _update_count(db, intent_oid, -1)
+    else:
+        updated = db.travel_intents.find_one({"_id": intent_oid}, {"interested_users_count": 1})
+    if updated is None:
+        raise IntentNotFound(intent_id)
+    return bool(result.deleted_count), updated.get("interested_users_count", 0)
+
+
+def get_interested_user_ids(
+    db: Database,
+    intent_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 20
+) -> Tuple[List[str], Optional[str]]:
+    """One page of interested user ids, most recent first. The cursor is the last interest's id."""
+    query: Dict[str, Any] = {"intent_id": ObjectId(intent_id)}
+    if cursor:
+        query["_id"] = {"$lt": ObjectId(cursor)}
+    interests = list(
+        db.intent_interests.find(query, {"user_id": 1})
+        .sort("_id", -1)
+        .limit(limit)
+    )
+    next_cursor = str(interests[-1]["_id"]) if len(interests) == limit else None
+    return [interest["user_id"] for interest in interests], next_cursor
+
+
+def get_interested_intent_ids(db: Database, user_id: str, limit: int = 200) -> List[ObjectId]:
+    """The intents a user most recently showed interest in"""
+    return [
+        interest["intent_id"]
+        for interest in db.intent_interests.find({"user_id": user_id}, {"intent_id": 1}).sort("_id", -1).limit(limit)
+    ]
+
+
+def remove_interests(db: Database, intent_id: str):
+    db.intent_interests.delete_many({"intent_id": ObjectId(intent_id)})
+
+
+def migrate_embedded_interests(db: Database) -> int:
+    """Move legacy `interested_users` arrays into intent_interests. Safe to re-run."""
+    migrated = 0
+    for intent in db.travel_intents.find({"interested_users": {"$exists": True}}, {"interested_users": 1}):
+        user_ids = [str(user_id) for user_id in intent.get("interested_users") or []]
+        if user_ids:
+            try:
+                db.intent_interests.insert_many(
+                    [{"intent_id": intent["_id"], "user_id": user_id, "created_at": datetime.utcnow()} for user_id in user_ids],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+        count = db.intent_interests.count_documents({"intent_id": intent["_id"]})
+        db.travel_intents.update_one(
+            {"_id": intent["_id"]},
+            {"$set": {"interested_users_count": count}, "$unset": {"interested_users": ""}, "$inc": {"version": 1}}
+        )
+        migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    from app.database import init_db, close_db
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Migrated embedded interests of {migrate_embedded_interests(init_db())} travel intents")
+    close_db()
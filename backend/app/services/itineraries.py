@@ -0,0 +1,128 @@
+"""
+Itinerary route optimization.
+
+Activity locations are resolved offline: either the location is already a
+"lat,lng" pair, or it is looked up by normalized name in the
+`geocode_cache` collection ({_id: normalized name, lat, lng}), which can be
+filled from any gazetteer. Nothing calls an external geocoder.
+
+Each day is then reordered by app.utils.routing. Large itineraries are
+split across the process pool so days are optimized in parallel.
+"""
+import os
+import re
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.database import Database
+
+from app.models.itinerary import ItineraryDay, ItineraryActivity
+from app.utils.process_pool import PROCESS_POOL_WORKERS, run_in_process
+from app.utils.routing import optimize_days
+from app.utils.text import normalize_key
+
+# Below this many stops, solving inline is faster than shipping days to other processes
+ITINERARY_PARALLEL_MIN_STOPS = int(os.environ.get("ITINERARY_PARALLEL_MIN_STOPS", "1000"))
+
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+Coordinates = Tuple[float, float]
+
+
+def parse_coordinates(location: str) -> Optional[Coordinates]:
+    match = _COORDINATES.match(location)
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if -90 <= lat <= 90 and -180 <= lng <= 180:
+        return lat, lng
+    return None
+
+
+def resolve_locations(db: Database, locations: Iterable[str]) -> Dict[str, Coordinates]:
+    """Map location strings to coordinates with at most one geocode_cache query"""
+    resolved: Dict[str, Coordinates] = {}
+    by_key: Dict[str, List[str]] = {}
+    for location in set(locations):
+        coordinates = parse_coordinates(location)
+        if coordinates is not None:
+            resolved[location] = coordinates
+        elif normalize_key(location):
+            by_key.setdefault(normalize_key(location), []).append(location)
+
+    if by_key:
+        for entry in db.geocode_cache.find({"_id": {"$in": list(by_key)}}, {"lat": 1, "lng": 1}):
+            for location in by_key[entry["_id"]]:
+                resolved[location] = (entry["lat"], entry["lng"])
+    return resolved
+
+
+def time_key(activity: ItineraryActivity) -> Optional[float]:
+    moment = activity.start_time or activity.end_time
+    return moment.timestamp() if moment is not None else None
+
+
+def reassemble_day(
+    day: ItineraryDay,
+    routed: List[int],
+    unresolved: List[int],
+    result: Tuple[List[int], float, float]
+) -> Dict[str, Any]:
+    """Put a day's activities in optimized order, merging back the unresolved ones"""
+    order, before, after = result
+    activities = day.activities
+    sequence = [routed[i] for i in order]
+
+    # Unresolved timed stops go before the first routed timed stop that is
+    # later; unresolved untimed stops go to the end
+    for index in unresolved:
+        key = time_key(activities[index])
+        position = len(sequence)
+        if key is not None:
+            for pos, other in enumerate(sequence):
+                other_key = time_key(activities[other])
+                if other_key is not None and other_key > key:
+                    position = pos
+                    break
+        sequence.insert(position, index)
+
+    return {
+        "date": day.date,
+        "notes": day.notes,
+        "activities": [activities[i] for i in sequence],
+        "original_distance_km": round(before, 3),
+        "optimized_distance_km": round(after, 3),
+        "unresolved_locations": [activities[i].location or "" for i in unresolved],
+    }
+
+
+async def optimize_itinerary(db: Database, days: List[ItineraryDay]) -> List[Dict[str, Any]]:
+    locations = [a.location for day in days for a in day.activities if a.location]
+    resolved = await asyncio.to_thread(resolve_locations, db, locations)
+
+    problems = []
+    splits = []
+    for day in days:
+        routed, unresolved = [], []
+        for index, activity in enumerate(day.activities):
+            (routed if activity.location in resolved else unresolved).append(index)
+        coords = [resolved[day.activities[i].location] for i in routed]
+        time_keys = [time_key(day.activities[i]) for i in routed]
+        problems.append((coords, time_keys))
+        splits.append((routed, unresolved))
+
+    total_stops = sum(len(coords) for coords, _ in problems)
+    if total_stops >= ITINERARY_PARALLEL_MIN_STOPS and len(problems) > 1:
+        # Interleave days over the pool's processes to balance long and short days
+        chunks = [problems[i::PROCESS_POOL_WORKERS] for i in range(min(PROCESS_POOL_WORKERS, len(problems)))]
+        solved = await asyncio.gather(*(run_in_process(optimize_days, chunk) for chunk in chunks))
+        results = [None] * len(problems)
+        for offset, chunk_results in enumerate(solved):
+            results[offset::PROCESS_POOL_WORKERS] = chunk_results
+    else:
+        results = await asyncio.to_thread(optimize_days, problems)
+
+    return [
+        reassemble_day(day, routed, unresolved, result)
+        for day, (routed, unresolved), result in zip(days, splits, results)
+    ]
@@ -0,0 +1,218 @@
+"""
+Streaming media uploads for chat attachments and profile images.
+
+Request bodies are hashed and written to the object store as they arrive,
+through a buffer of MEDIA_WRITE_BUFFER_BYTES, so an upload never holds the
+whole file in memory. Blobs are deduplicated by sha256 (`media_blobs`);
+each upload gets its own `media` record pointing at a blob. A blob's
+content type is sniffed from its first bytes, so it doesn't depend on what
+the first uploader declared. Thumbnails of images are generated once per
+blob in the process pool.
+
+Uploads are served from the API origin, so only raster images are shown
+inline; the other accepted types are always downloaded as attachments, and
+anything else is rejected (HTML or SVG inline would be stored XSS).
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from pymongo.database import Database
+
+from app.services.storage import ObjectStore, content_key
+from app.utils.images import make_thumbnails
+from app.utils.process_pool import run_in_process
+
+logger = logging.getLogger("backpacker-api.media")
+
+MEDIA_MAX_BYTES = int(os.environ.get("MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+MEDIA_WRITE_BUFFER_BYTES = int(os.environ.get("MEDIA_WRITE_BUFFER_BYTES", str(1024 * 1024)))
+MEDIA_READ_CHUNK_BYTES = int(os.environ.get("MEDIA_READ_CHUNK_BYTES", str(256 * 1024)))
+MEDIA_THUMBNAIL_SIZES = [
+    int(size) for size in os.environ.get("MEDIA_THUMBNAIL_SIZES", "128,512").split(",") if size.strip()
+]
+# Bytes kept from the start of each upload to sniff its type
+SNIFF_BYTES = 32
+
+
+# Served inline (profile images, chat photos)
+INLINE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/avif"}
+# Accepted, but always served with Content-Disposition: attachment
+ATTACHMENT_CONTENT_TYPES = {
+    "application/pdf", "text/plain", "audio/mpeg", "audio/mp4", "video/mp4", "video/quicktime",
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+async def store_stream(
+    store: ObjectStore, chunks: AsyncIterator[bytes], max_bytes: int = MEDIA_MAX_BYTES
+) -> Tuple[str, int, bytes]:
+    """Write a stream of chunks to the store. Returns (sha256 key, size, first SNIFF_BYTES bytes)."""
+    path = store.staging_path()
+    f = await asyncio.to_thread(open, path, "wb")
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    head = b""
+    size = 0
+
+    def flush(data: bytearray):
+        digest.update(data)
+        f.write(data)
+
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Uploads are limited to {max_bytes} bytes")
+            if len(head) < SNIFF_BYTES:
+                head += chunk[:SNIFF_BYTES - len(head)]
+            buffer += chunk
+            if len(buffer) >= MEDIA_WRITE_BUFFER_BYTES:
+                await asyncio.to_thread(flush, buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(flush, buffer)
+        await asyncio.to_thread(f.close)
+        key = digest.hexdigest()
+        await asyncio.to_thread(store.commit, path, key)
+        return key, size, head
+    except BaseException:
+        f.close()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Media type of an upload from its first bytes; application/octet-stream if unrecognised"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head[4:8] == b"ftyp":
+        # ISO base media file: the major brand tells the formats apart
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand == b"qt  ":
+            return "video/quicktime"
+        if brand in (b"M4A ", b"M4B "):
+            return "audio/mp4"
+        return "video/mp4"
+    if head.startswith(b"ID3") or len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "audio/mpeg"
+    if b"\x00" not in head:
+        try:
+            head.decode("utf-8")
+            return "text/plain"
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off by SNIFF_BYTES is still text
+            if e.reason == "unexpected end of data":
+                return "text/plain"
+    return "application/octet-stream"
+
+
+def record_blob(db: Database, key: str, size: int, content_type: str):
+    """Register a stored blob, once per content hash, with its sniffed content type"""
+    db.media_blobs.update_one(
+        {"_id": key},
+        {"$setOnInsert": {"size": size, "content_type": content_type, "thumbnails": {}, "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def is_allowed_content_type(content_type: str) -> bool:
+    return content_type in INLINE_CONTENT_TYPES or content_type in ATTACHMENT_CONTENT_TYPES
+
+
+def served_content_type(content_type: str) -> str:
+    """Content-Type to serve a stored upload with; records older than the allow-list become opaque bytes"""
+    return content_type if is_allowed_content_type(content_type) else "application/octet-stream"
+
+
+def wants_thumbnails(content_type: str) -> bool:
+    return bool(MEDIA_THUMBNAIL_SIZES) and content_type in INLINE_CONTENT_TYPES
+
+
+async def generate_thumbnails(db: Database, store: ObjectStore, key: str):
+    """Create the configured thumbnails for a blob that doesn't have them yet"""
+    try:
+        blob = await asyncio.to_thread(db.media_blobs.find_one, {"_id": key}, {"thumbnails": 1, "content_type": 1})
+        if blob is None or not wants_thumbnails(blob.get("content_type", "")):
+            return
+        existing = blob.get("thumbnails") or {}
+        missing = [size for size in MEDIA_THUMBNAIL_SIZES if str(size) not in existing]
+        if not missing:
+            return
+
+        path = await asyncio.to_thread(store.local_path, key)
+        thumbnails = await run_in_process(make_thumbnails, path, missing)
+
+        update = {}
+        for size, data in thumbnails.items():
+            thumbnail_key = content_key(data)
+            await asyncio.to_thread(store.put_bytes, thumbnail_key, data)
+            update[f"thumbnails.{size}"] = thumbnail_key
+        await asyncio.to_thread(db.media_blobs.update_one, {"_id": key}, {"$set": update})
+    except Exception as e:
+        # Not an image Pillow can read, or a transient failure; the original is still served
+        logger.warning(f"Could not generate thumbnails for blob {key}: {e}")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` Range header into inclusive (start, end).
+    Returns None when the whole body should be sent.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Unknown units and multipart ranges: serve the full body
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def iter_blob(store: ObjectStore, key: str, start: int, end: int) -> Iterator[bytes]:
+    """Read bytes start..end (inclusive) of a blob in bounded chunks"""
+    with store.open(key) as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(MEDIA_READ_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
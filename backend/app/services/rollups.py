@@ -0,0 +1,303 @@
+"""
+Destination/month rollups of travel intents.
+
+One document per (normalized destination, start month) in `intent_rollups`
+holds how many intents start there that month and how many travelers they
+add up to. Creating or deleting an intent adjusts its rollup with a single
+upserted `$inc`, so the stats endpoints read a handful of small documents
+whatever the number of intents.
+
+Archiving doesn't touch the rollups: archived intents still count toward
+the months they were for. Run the backfill once before relying on the
+numbers, and again to correct any drift:
+
+    python -m app.services.rollups
+
+The backfill is safe while the API keeps writing. It writes the counts it
+scanned only to rollups that no live update has touched since it started
+(`updated_at`), then recounts the touched ones, and any whose intents were
+archived meanwhile, one by one. Each recount is guarded on the `updated_at`
+it saw. An increment still in flight when a rollup was recounted changes
+`updated_at` again, so the rollup is recounted in the next round, once
+ROLLUP_SETTLE_SECONDS have passed. Rounds repeat until none is touched.
+"""
+import os
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo import DeleteOne, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.services.archival import ARCHIVE_COLLECTION
+from app.utils.mongo import utcnow
+from app.utils.text import normalize_destination
+
+logger = logging.getLogger("backpacker-api.rollups")
+
+ROLLUP_COLLECTION = "intent_rollups"
+
+# Longest expected delay between an intent write and its rollup update
+ROLLUP_SETTLE_SECONDS = float(os.environ.get("ROLLUP_SETTLE_SECONDS", "5"))
+ROLLUP_BACKFILL_MAX_ROUNDS = int(os.environ.get("ROLLUP_BACKFILL_MAX_ROUNDS", "20"))
+
+RollupKey = Tuple[str, str]
+
+ROLLUP_FIELDS = {"destination": 1, "destination_key": 1, "start_date": 1, "group_size": 1}
+
+
+def month_key(when: datetime) -> str:
+    return when.strftime("%Y-%m")
+
+
+def add_months(month: str, count: int) -> str:
+    year, mon = map(int, month.split("-"))
+    index = year * 12 + mon - 1 + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def month_range(first: str, count: int) -> List[str]:
+    return [add_months(first, i) for i in range(count)]
+
+
+def rollup_id(key: str, month: str) -> str:
+    return f"{key}|{month}"
+
+
+def parse_rollup_id(value: str) -> RollupKey:
+    key, _, month = value.rpartition("|")
+    return key, month
+
+
+def _rollup_key(intent: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    key = intent.get("destination_key") or normalize_destination(intent.get("destination", ""))
+    if not key or not isinstance(intent.get("start_date"), datetime):
+        return None
+    return key, month_key(intent["start_date"])
+
+
+def _travelers(intent: Dict[str, Any]) -> int:
+    return intent.get("group_size") or 1
+
+
+def update_rollups(db: Database, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """
+    Apply an intent change to the rollups: `before` is None for a created
+    intent, `after` is None for a deleted one. Both need ROLLUP_FIELDS.
+    """
+    changes: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    for intent, sign in ((before, -1), (after, 1)):
+        key = _rollup_key(intent) if intent else None
+        if key:
+            changes[key][0] += sign
+            changes[key][1] += sign * _travelers(intent)
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"_id": rollup_id(key, month)},
+            {
+                "$inc": {"intent_count": intents, "traveler_count": travelers},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {
+                    "destination_key": key,
+                    "destination": (after or before).get("destination", key),
+                    "month": month,
+                },
+            },
+            upsert=True,
+        )
+        for (key, month), (intents, travelers) in changes.items()
+        if intents or travelers
+    ]
+    try:
+        if operations:
+            db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to update rollups for intent {(after or before).get('_id')}: {e}")
+
+
+def scan_totals(db: Database) -> Dict[RollupKey, Dict[str, Any]]:
+    """Counts per rollup from one pass over the live and archived intents"""
+    totals: Dict[RollupKey, Dict[str, Any]] = {}
+    for collection in ("travel_intents", ARCHIVE_COLLECTION):
+        for intent in db[collection].find({}, ROLLUP_FIELDS):
+            key = _rollup_key(intent)
+            if key is None:
+                continue
+            rollup = totals.setdefault(key, {"destination": intent.get("destination", key[0]), "intents": 0, "travelers": 0})
+            rollup["intents"] += 1
+            rollup["travelers"] += _travelers(intent)
+    return totals
+
+
+def count_rollup(db: Database, key: str, month: str) -> Tuple[int, int]:
+    """(intents, travelers) for one rollup, counted from the intents"""
+    first = datetime.strptime(month, "%Y-%m")
+    pipeline = [
+        {"$match": {"destination_key": key, "start_date": {"$gte": first, "$lt": datetime.strptime(add_months(month, 1), "%Y-%m")}}},
+        {"$group": {
+            "_id": None,
+            "intents": {"$sum": 1},
+            # Same as _travelers: a missing or zero group_size counts as one
+            "travelers": {"$sum": {"$cond": [{"$gte": ["$group_size", 1]}, "$group_size", 1]}},
+        }},
+    ]
+    intents = travelers = 0
+    for collection in ("travel_intents", ARCHIVE_COLLECTION):
+        for row in db[collection].aggregate(pipeline):
+            intents += row["intents"]
+            travelers += row["travelers"]
+    return intents, travelers
+
+
+def _not_updated_since(when: datetime) -> Dict[str, Any]:
+    # Also matches rollups without updated_at
+    return {"updated_at": {"$not": {"$gte": when}}}
+
+
+def _write_untouched(db: Database, operations: List[Any]):
+    try:
+        db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # An upsert whose guard failed collides with the rollup a live update touched
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+def touched_since(db: Database, when: datetime) -> Set[RollupKey]:
+    """Rollups with live updates since `when`, and those of intents archived since then"""
+    touched = {
+        parse_rollup_id(rollup["_id"])
+        for rollup in db[ROLLUP_COLLECTION].find({"updated_at": {"$gte": when}}, {"_id": 1})
+    }
+    # archived_at is stamped just before the move, so look back a little
+    since = when - timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+    for intent in db[ARCHIVE_COLLECTION].find({"archived_at": {"$gte": since}}, ROLLUP_FIELDS):
+        key = _rollup_key(intent)
+        if key:
+            touched.add(key)
+    return touched
+
+
+def recount_rollup(db: Database, key: str, month: str):
+    """Replace one rollup with a fresh count, unless a live update lands meanwhile"""
+    current = db[ROLLUP_COLLECTION].find_one({"_id": rollup_id(key, month)}, {"updated_at": 1, "destination": 1}) or {}
+    intents, travelers = count_rollup(db, key, month)
+    try:
+        db[ROLLUP_COLLECTION].update_one(
+            {"_id": rollup_id(key, month), "updated_at": current.get("updated_at")},
+            {
+                "$set": {"intent_count": intents, "traveler_count": travelers, "counted_at": datetime.utcnow()},
+                "$setOnInsert": {"destination_key": key, "destination": current.get("destination", key), "month": month},
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Updated since it was read; touched_since picks it up again
+        pass
+
+
+def backfill_rollups(db: Database, settle_seconds: float = ROLLUP_SETTLE_SECONDS) -> int:
+    """
+    Recompute every rollup from the live and archived intents while the API
+    keeps running (see above). Returns the number of rollups scanned.
+    """
+    started = utcnow()
+    totals = scan_totals(db)
+
+    # Scanned counts go only to rollups that no live update touched since the scan started
+    operations: List[Any] = []
+    for (key, month), rollup in totals.items():
+        operations.append(UpdateOne(
+            {"_id": rollup_id(key, month), **_not_updated_since(started)},
+            {
+                "$set": {
+                    "intent_count": rollup["intents"],
+                    "traveler_count": rollup["travelers"],
+                    "counted_at": datetime.utcnow(),
+                },
+                "$setOnInsert": {"destination_key": key, "destination": rollup["destination"], "month": month},
+            },
+            upsert=True,
+        ))
+        if len(operations) >= 1000:
+            _write_untouched(db, operations)
+            operations = []
+    # Rollups left without intents
+    for rollup in db[ROLLUP_COLLECTION].find({}, {"_id": 1}):
+        if parse_rollup_id(rollup["_id"]) not in totals:
+            operations.append(DeleteOne({"_id": rollup["_id"], **_not_updated_since(started)}))
+            if len(operations) >= 1000:
+                _write_untouched(db, operations)
+                operations = []
+    if operations:
+        _write_untouched(db, operations)
+
+    since = started
+    for _ in range(ROLLUP_BACKFILL_MAX_ROUNDS):
+        # Let increments for intents written before this point land first
+        time.sleep(settle_seconds)
+        pending = touched_since(db, since)
+        if not pending:
+            return len(totals)
+        since = utcnow()
+        for key, month in pending:
+            recount_rollup(db, key, month)
+    logger.warning(
+        f"Rollups still being updated after {ROLLUP_BACKFILL_MAX_ROUNDS} rounds; "
+        f"run the backfill again to recount them: {sorted(touched_since(db, since))[:20]}"
+    )
+    return len(totals)
+
+
+def trending_destinations(db: Database, months: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Destinations with the most intents starting in the given months"""
+    pipeline = [
+        {"$match": {"month": {"$in": months}, "intent_count": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$destination_key",
+            "destination": {"$first": "$destination"},
+            "intent_count": {"$sum": "$intent_count"},
+            "traveler_count": {"$sum": "$traveler_count"},
+        }},
+        {"$sort": {"intent_count": -1, "traveler_count": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    return [
+        {
+            "destination": row["destination"],
+            "destination_key": row["_id"],
+            "intent_count": row["intent_count"],
+            "traveler_count": row["traveler_count"],
+        }
+        for row in db[ROLLUP_COLLECTION].aggregate(pipeline)
+    ]
+
+
+def destination_months(db: Database, key: str, months: List[str]) -> List[Dict[str, Any]]:
+    """Per-month counts for one destination, including empty months"""
+    found = {
+        rollup["month"]: rollup
+        for rollup in db[ROLLUP_COLLECTION].find({"_id": {"$in": [rollup_id(key, month) for month in months]}})
+    }
+    return [
+        {
+            "month": month,
+            "intent_count": found.get(month, {}).get("intent_count", 0),
+            "traveler_count": found.get(month, {}).get("traveler_count", 0),
+        }
+        for month in months
+    ]
+
+
+if __name__ == "__main__":
+    from app.database import init_db, close_db
+
+    logging.basicConfig(level=logging.INFO)
+    database = init_db()
+    logger.info(f"Backfilled {backfill_rollups(database)} rollups")
+    close_db()
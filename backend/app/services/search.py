@@ -0,0 +1,372 @@
+"""
+In-process full-text search over travel intents.
+
+Destination, activities and description are indexed into an inverted index
+whose posting lists are delta + varint encoded into bytearrays. Queries are
+ranked with BM25 (field weights applied to term frequency) and tolerate one
+typo per term through a symmetric-delete lookup over the vocabulary.
+
+The index is built from MongoDB when a worker starts, updated directly by the
+create/delete endpoints, and periodically catches up on intents inserted by
+other workers (by created_at, re-reading an overlap window in pages of
+(created_at, _id); intents already indexed are skipped). Deletes made by other workers are detected when hits
+are hydrated from MongoDB.
+
+Searches are scored in a worker thread while writes come from the event
+loop, so every read and write of an index holds its lock. Writes are a few
+appends, so the loop waits at most for one search to finish.
+
+Benchmark a synthetic index with `python -m app.services.search`.
+"""
+import os
+import math
+import heapq
+import asyncio
+import logging
+import threading
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from pymongo.database import Database
+
+from app.utils.mongo import SYNC_PAGE_SIZE, sync_page
+from app.utils.text import tokenize
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger("backpacker-api.search")
+
+SEARCH_SYNC_SECONDS = float(os.environ.get("SEARCH_SYNC_SECONDS", "10"))
+# Rebuild once this fraction of indexed documents has been deleted or replaced
+SEARCH_COMPACT_RATIO = float(os.environ.get("SEARCH_COMPACT_RATIO", "0.2"))
+
+# Term frequency multipliers per field
+FIELD_WEIGHTS = {"destination": 3, "activities": 2, "description": 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Score multiplier for terms matched through a typo correction
+TYPO_PENALTY = 0.6
+# Shortest query term eligible for typo correction
+MIN_TYPO_LENGTH = 4
+
+PROJECTION = {"destination": 1, "activities": 1, "description": 1, "created_at": 1}
+
+
+def _append_varint(buf: bytearray, value: int):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _iter_postings(buf: bytes) -> Iterator[Tuple[int, int]]:
+    """Decode (docno, term frequency) pairs from a posting list"""
+    docno = 0
+    i = 0
+    n = len(buf)
+    while i < n:
+        value = 0
+        shift = 0
+        while True:
+            byte = buf[i]
+            i += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        docno += value
+        tf = 0
+        shift = 0
+        while True:
+            byte = buf[i]
+            i += 1
+            tf |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        yield docno, tf
+
+
+def _deletes(term: str) -> Set[str]:
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (
+            len(diffs) == 2 and diffs[1] == diffs[0] + 1
+            and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+        )
+    if la > lb:
+        a, b = b, a
+    # b is one character longer than a
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            return a[i:] == b[i + 1:]
+    return True
+
+
+def document_terms(intent: Dict[str, Any]) -> Dict[str, int]:
+    """Weighted term frequencies for an intent"""
+    terms: Dict[str, int] = defaultdict(int)
+    for token in tokenize(intent.get("destination") or ""):
+        terms[token] += FIELD_WEIGHTS["destination"]
+    for activity in intent.get("activities") or []:
+        for token in tokenize(activity):
+            terms[token] += FIELD_WEIGHTS["activities"]
+    for token in tokenize(intent.get("description") or ""):
+        terms[token] += FIELD_WEIGHTS["description"]
+    return terms
+
+
+class SearchIndex:
+    """Append-only inverted index with tombstones for deleted documents"""
+
+    def __init__(self):
+        self.doc_ids: List[Optional[str]] = []
+        # Terms of each live document, so a removal can correct doc_freq
+        self.doc_terms: List[Optional[Tuple[str, ...]]] = []
+        self.doc_lengths = array("I")
+        self.docno_by_id: Dict[str, int] = {}
+        self.postings: Dict[str, bytearray] = {}
+        self.last_docno: Dict[str, int] = {}
+        self.doc_freq: Dict[str, int] = defaultdict(int)
+        self.typo_map: Dict[str, Set[str]] = defaultdict(set)
+        self.total_length = 0
+        self.live_docs = 0
+        self.tombstones = 0
+        # Newest created_at read from MongoDB by a build or sync pass
+        self.synced_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def add(self, intent: Dict[str, Any], replace: bool = True):
+        terms = document_terms(intent)
+        with self._lock:
+            self._add(str(intent["_id"]), terms, replace)
+
+    def _add(self, intent_id: str, terms: Dict[str, int], replace: bool):
+        if intent_id in self.docno_by_id:
+            if not replace:
+                return
+            self._remove(intent_id)
+
+        docno = len(self.doc_ids)
+        self.doc_ids.append(intent_id)
+        self.doc_terms.append(tuple(terms))
+        self.docno_by_id[intent_id] = docno
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        self.live_docs += 1
+
+        for term, tf in terms.items():
+            buf = self.postings.get(term)
+            if buf is None:
+                buf = self.postings[term] = bytearray()
+                for variant in _deletes(term):
+                    self.typo_map[variant].add(term)
+                _append_varint(buf, docno)
+            else:
+                _append_varint(buf, docno - self.last_docno[term])
+            _append_varint(buf, tf)
+            self.last_docno[term] = docno
+            self.doc_freq[term] += 1
+
+    def remove(self, intent_id: str):
+        with self._lock:
+            self._remove(intent_id)
+
+    def _remove(self, intent_id: str):
+        docno = self.docno_by_id.pop(intent_id, None)
+        if docno is None:
+            return
+        # Postings keep the docno; it is skipped at query time until compaction
+        self.doc_ids[docno] = None
+        for term in self.doc_terms[docno]:
+            self.doc_freq[term] -= 1
+        self.doc_terms[docno] = None
+        self.total_length -= self.doc_lengths[docno]
+        self.live_docs -= 1
+        self.tombstones += 1
+
+    def mark_synced(self, intent: Dict[str, Any]):
+        created_at = intent.get("created_at")
+        if isinstance(created_at, datetime) and (self.synced_at is None or created_at > self.synced_at):
+            self.synced_at = created_at
+
+    def needs_compaction(self) -> bool:
+        return self.tombstones > SEARCH_COMPACT_RATIO * max(self.live_docs, 1000)
+
+    def expand_term(self, term: str) -> List[Tuple[str, float]]:
+        """Vocabulary terms matching a query term, with their score multiplier"""
+        if term in self.postings:
+            return [(term, 1.0)]
+        if len(term) < MIN_TYPO_LENGTH:
+            return []
+        candidates: Set[str] = set(self.typo_map.get(term, ()))
+        for variant in _deletes(term):
+            if variant in self.postings:
+                candidates.add(variant)
+            candidates.update(self.typo_map.get(variant, ()))
+        return [(c, TYPO_PENALTY) for c in candidates if _within_one_edit(term, c)]
+
+    def search(self, query: str, limit: int = 20, skip: int = 0) -> List[Tuple[str, float]]:
+        """Return (intent_id, score) pairs, best first"""
+        tokens = set(tokenize(query))
+        with self._lock:
+            return self._search(tokens, limit, skip)
+
+    def _search(self, tokens: Set[str], limit: int, skip: int) -> List[Tuple[str, float]]:
+        if self.live_docs == 0:
+            return []
+        avg_length = self.total_length / self.live_docs
+        scores: Dict[int, float] = defaultdict(float)
+
+        for token in tokens:
+            for term, weight in self.expand_term(token):
+                # .get: indexing the defaultdict would insert the term
+                df = self.doc_freq.get(term, 0)
+                idf = math.log(1 + (self.live_docs - df + 0.5) / (df + 0.5))
+                for docno, tf in _iter_postings(self.postings[term]):
+                    if self.doc_ids[docno] is None:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docno] / avg_length)
+                    scores[docno] += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        # Ties go to the newest document
+        ranked = heapq.nlargest(skip + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(self.doc_ids[docno], score) for docno, score in ranked[skip:]]
+
+
+def build_index(db: Database) -> SearchIndex:
+    index = SearchIndex()
+    for intent in db.travel_intents.find({}, PROJECTION).sort("_id", 1):
+        index.add(intent, replace=False)
+        index.mark_synced(intent)
+    logger.info(f"Built search index with {index.live_docs} intents and {len(index.postings)} terms")
+    return index
+
+
+_index: Optional[SearchIndex] = None
+_sync_task: Optional[PeriodicTask] = None
+_rebuilding = False
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """The current worker's index, or None while it is still being built"""
+    return _index
+
+
+def index_intent(intent: Dict[str, Any]):
+    if _index is not None:
+        _index.add(intent)
+
+
+def unindex_intent(intent_id: str):
+    if _index is not None:
+        _index.remove(intent_id)
+
+
+async def rebuild_search_index(db: Database):
+    global _index, _rebuilding
+    if _rebuilding:
+        return
+    _rebuilding = True
+    try:
+        # Build off the event loop, then swap in one step
+        _index = await asyncio.to_thread(build_index, db)
+    finally:
+        _rebuilding = False
+
+
+async def sync_search_index(db: Database):
+    """Catch up on intents inserted by other workers and compact when needed"""
+    if _index is None or _rebuilding:
+        return
+    if _index.needs_compaction():
+        await rebuild_search_index(db)
+        return
+
+    index = _index
+    watermark = index.synced_at
+
+    def apply(intents: List[Dict[str, Any]]):
+        for intent in intents:
+            # Intents from the overlap window are usually indexed already
+            index.add(intent, replace=False)
+            index.mark_synced(intent)
+
+    last = None
+    while True:
+        intents = await asyncio.to_thread(sync_page, db.travel_intents, watermark, PROJECTION, last)
+        # Off the loop: add() may wait for a search holding the index lock
+        await asyncio.to_thread(apply, intents)
+        if len(intents) < SYNC_PAGE_SIZE:
+            break
+        last = intents[-1]
+
+
+async def start_search_index(db: Database):
+    global _sync_task
+    asyncio.create_task(rebuild_search_index(db))
+    _sync_task = PeriodicTask("search-index-sync", SEARCH_SYNC_SECONDS, lambda: sync_search_index(db))
+    _sync_task.start()
+
+
+async def stop_search_index():
+    global _sync_task
+    if _sync_task is not None:
+        await _sync_task.stop()
+        _sync_task = None
+
+
+def benchmark(intents: int = 100_000, queries: int = 200, seed: int = 0):
+    """Time building and querying a synthetic index: `python -m app.services.search`"""
+    import time
+    import random
+
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))) for _ in range(20000)]
+    destinations = words[:2000]
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    for i in range(intents):
+        index.add({
+            "_id": f"{i:024x}",
+            "destination": rng.choice(destinations),
+            "activities": rng.sample(words[2000:2500], 3),
+            "description": " ".join(rng.choices(words, k=20)),
+        }, replace=False)
+    built = time.perf_counter() - started
+
+    # Half of the queries carry a typo in their last term
+    samples = []
+    for i in range(queries):
+        terms = [rng.choice(destinations), rng.choice(words)]
+        if i % 2:
+            terms[-1] = terms[-1][:-1] + "x"
+        samples.append(" ".join(terms))
+    started = time.perf_counter()
+    for query in samples:
+        index.search(query)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{intents} intents, {len(index.postings)} terms: built in {built:.1f} s, "
+        f"{elapsed / queries * 1000:.2f} ms per query"
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark(intents=1_000_000)
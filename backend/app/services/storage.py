@@ -0,0 +1,126 @@
+"""
+Content-addressed blob storage for uploaded media.
+
+Blobs are keyed by the sha256 of their content, so storing the same bytes
+twice keeps a single copy. Uploads are written to a staging file first and
+committed under their key once the hash is known. `LocalObjectStore` keeps
+everything on the local filesystem; other backends (S3, GCS, ...) implement
+`ObjectStore` and are installed with `set_object_store`.
+"""
+import os
+import uuid
+import hashlib
+import logging
+from typing import BinaryIO, Optional
+
+logger = logging.getLogger("backpacker-api.storage")
+
+MEDIA_STORE = os.environ.get("MEDIA_STORE", "local").lower()
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", os.path.join(os.getcwd(), "media"))
+
+
+class ObjectStore:
+    """Interface for blob storage. All methods block; call them off the event loop."""
+
+    def staging_path(self) -> str:
+        """Path of a new, unique local file to write an upload into"""
+        raise NotImplementedError
+
+    def commit(self, staging_path: str, key: str) -> bool:
+        """
+        Store a staged file under `key`, consuming the staging file.
+        Returns False if the content was already stored.
+        """
+        raise NotImplementedError
+
+    def put_bytes(self, key: str, data: bytes) -> bool:
+        path = self.staging_path()
+        with open(path, "wb") as f:
+            f.write(data)
+        return self.commit(path, key)
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str:
+        """A local filesystem path for the blob (remote stores download to a cache)"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """Blobs under `root/ab/cd/<key>`, staging files under `root/tmp`"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp = os.path.join(root, "tmp")
+        os.makedirs(self.tmp, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Keys are hex digests; anything else must not reach the filesystem
+        if len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+            raise ValueError(f"Invalid object key: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def staging_path(self) -> str:
+        return os.path.join(self.tmp, uuid.uuid4().hex)
+
+    def commit(self, staging_path: str, key: str) -> bool:
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(staging_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same filesystem, so the rename is atomic; a concurrent commit of
+        # the same content just replaces identical bytes
+        os.replace(staging_path, path)
+        return True
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def local_path(self, key: str) -> str:
+        return self._path(key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+_store: Optional[ObjectStore] = None
+
+
+def get_object_store() -> ObjectStore:
+    global _store
+    if _store is None:
+        if MEDIA_STORE != "local":
+            raise RuntimeError(f"Unknown MEDIA_STORE {MEDIA_STORE!r}; install a backend with set_object_store()")
+        _store = LocalObjectStore(MEDIA_ROOT)
+        logger.info(f"Storing media under {MEDIA_ROOT}")
+    return _store
+
+
+def set_object_store(store: Optional[ObjectStore]):
+    """Install a different storage backend (or reset to the default with None)"""
+    global _store
+    _store = store
@@ -0,0 +1,38 @@
+from typing import Any, Dict, Iterable, List
+
+from bson import ObjectId
+from pymongo.database import Database
+
+# Fields needed to render an author card (plus its validators for ETags)
+USER_SUMMARY_PROJECTION = {"name": 1, "username": 1, "profile_image_url": 1, "version": 1, "updated_at": 1}
+
+
+def to_object_ids(ids: Iterable[str]) -> List[ObjectId]:
+    """Convert valid id strings to ObjectIds, dropping invalid ones and duplicates"""
+    seen = set()
+    object_ids = []
+    for value in ids:
+        value = str(value)
+        if value not in seen and ObjectId.is_valid(value):
+            seen.add(value)
+            object_ids.append(ObjectId(value))
+    return object_ids
+
+
+def fetch_user_summaries(db: Database, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Resolve many user ids to author summaries with a single $in query"""
+    object_ids = to_object_ids(user_ids)
+    if not object_ids:
+        return {}
+    summaries = {}
+    for user in db.users.find({"_id": {"$in": object_ids}}, USER_SUMMARY_PROJECTION):
+        user_id = str(user.pop("_id"))
+        summaries[user_id] = {"id": user_id, **user}
+    return summaries
+
+
+def attach_authors(db: Database, intents: List[Dict[str, Any]]):
+    """Embed an author summary under `user` in each intent, in place"""
+    summaries = fetch_user_summaries(db, (intent["user_id"] for intent in intents))
+    for intent in intents:
+        intent["user"] = summaries.get(str(intent["user_id"]))
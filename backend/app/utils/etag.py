@@ -0,0 +1,82 @@
+"""
+Conditional GET helpers.
+
+Documents carry a `version` counter that every write increments; documents
+written before versioning existed fall back to their `updated_at` /
+`created_at` timestamp. Single-document endpoints check `If-None-Match`
+against a version-only projection so a 304 never loads the full document.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Response, status
+
+# Fields needed to compute a document's validators
+VERSION_PROJECTION = {"version": 1, "updated_at": 1, "created_at": 1}
+
+
+def document_version(doc: Dict[str, Any]) -> str:
+    if doc.get("version") is not None:
+        return str(doc["version"])
+    timestamp = doc.get("updated_at") or doc.get("created_at")
+    if isinstance(timestamp, datetime):
+        return f"t{int(timestamp.timestamp() * 1000)}"
+    return "0"
+
+
+def document_etag(doc: Dict[str, Any]) -> str:
+    doc_id = doc.get("_id", doc.get("id"))
+    return f'W/"{doc_id}-{document_version(doc)}"'
+
+
+def collection_etag(docs: Iterable[Dict[str, Any]], seed: str = "") -> str:
+    """ETag for a list response, derived from each member's id and version"""
+    digest = hashlib.blake2b(seed.encode(), digest_size=12)
+    for doc in docs:
+        digest.update(f"{doc.get('_id', doc.get('id'))}-{document_version(doc)};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def last_modified(doc: Dict[str, Any]) -> Optional[datetime]:
+    timestamp = doc.get("updated_at") or doc.get("created_at")
+    if not isinstance(timestamp, datetime):
+        return None
+    # Stored as naive UTC; HTTP dates have second precision
+    return timestamp.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def validator_headers(etag: str, modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(
+    etag: str,
+    if_none_match: Optional[str],
+    modified: Optional[datetime] = None,
+    if_modified_since: Optional[str] = None
+) -> bool:
+    """Evaluate conditional request headers (If-None-Match takes precedence)"""
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison: ignore the W/ prefix on either side
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+    if if_modified_since and modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return modified <= since
+    return False
+
+
+def not_modified_response(etag: str, modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, modified))
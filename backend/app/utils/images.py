@@ -0,0 +1,32 @@
+"""
+Image resizing, run inside the process pool.
+
+Kept free of application imports so spawned pool processes load quickly.
+"""
+import io
+from typing import Dict, List
+
+from PIL import Image, ImageOps
+
+# Refuse to decode images larger than this (decompression bombs)
+MAX_IMAGE_PIXELS = 50_000_000
+THUMBNAIL_FORMAT = "JPEG"
+THUMBNAIL_CONTENT_TYPE = "image/jpeg"
+THUMBNAIL_QUALITY = 85
+
+
+def make_thumbnails(path: str, sizes: List[int]) -> Dict[int, bytes]:
+    """Encode a JPEG thumbnail fitting in size x size for each size"""
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    thumbnails = {}
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        # Largest first so each step shrinks the previous result
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size))
+            buf = io.BytesIO()
+            image.save(buf, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, optimize=True)
+            thumbnails[size] = buf.getvalue()
+    return thumbnails
@@ -0,0 +1,370 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+logger = logging.getLogger("backpacker-api.llm")
+
+# Provider selection: "gemini" (default) or "fake" for local testing
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Pool names
+CHAT_POOL = "chat"              # interactive chat, short deadlines
+BACKGROUND_POOL = "background"  # itinerary generation, conversation summaries
+
+# Per-pool defaults, overridable with LLM_<POOL>_<SETTING> environment variables
+POOL_DEFAULTS: Dict[str, Dict[str, float]] = {
+    CHAT_POOL: {
+        "max_concurrency": 16,
+        "queue_timeout": 2.0,
+        "call_timeout": 30.0,
+        "max_retries": 1,
+        "temperature": 0.7,
+        "max_output_tokens": 2048,
+    },
+    BACKGROUND_POOL: {
+        "max_concurrency": 4,
+        "queue_timeout": 30.0,
+        "call_timeout": 120.0,
+        "max_retries": 3,
+        "temperature": 0.7,
+        "max_output_tokens": 4096,
+    },
+}
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("LLM_BREAKER_RESET_TIMEOUT", "30"))
+BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+
+
+class LLMError(Exception):
+    """Base error raised by the LLM client"""
+
+
+class LLMQueueTimeout(LLMError):
+    """No concurrency slot became free within the queue timeout"""
+
+
+class LLMTimeout(LLMError):
+    """The provider did not answer before the call deadline"""
+
+
+class LLMCircuitOpen(LLMError):
+    """The provider is failing and calls are being shed"""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    Opens after `failure_threshold` consecutive failures, sheds calls for
+    `reset_timeout` seconds, then lets a single probe call through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def admit(self) -> Tuple[bool, bool]:
+        """
+        Whether a call may go ahead, and whether it took the half-open probe.
+        A call holding the probe must end in record_success, record_failure
+        or release_probe.
+        """
+        if self.state == self.CLOSED:
+            return True, False
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False, False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # Half-open: allow exactly one probe
+        if self._probe_in_flight:
+            return False, False
+        self._probe_in_flight = True
+        return True, True
+
+    def release_probe(self):
+        """Give back a half-open probe slot that was never used; only call as its holder"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"LLM circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class FakeChatModel:
+    """
+    Local stand-in for the Gemini chat model.
+    Simulates latency and failures so pools, deadlines and the breaker can be
+    exercised without network access.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        response: Optional[str] = None,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response = response
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        if self.response is not None:
+            return self.response
+        last = messages[-1].content if messages else ""
+        return f"[fake] {last}"
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        self.calls += 1
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self.error_rate:
+            raise RuntimeError("Simulated provider error")
+        return AIMessage(content=self._reply(messages))
+
+    async def astream(self, messages: List[BaseMessage], **kwargs) -> AsyncIterator[AIMessageChunk]:
+        """Yield the reply word by word, spreading the latency across the chunks"""
+        self.calls += 1
+        if self._random.random() < self.error_rate:
+            raise RuntimeError("Simulated provider error")
+        words = self._reply(messages).split(" ")
+        delay = (self.latency + self._random.uniform(0, self.jitter)) / len(words)
+        for i, word in enumerate(words):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield AIMessageChunk(content=word if i == 0 else f" {word}")
+
+
+def _pool_setting(pool: str, name: str) -> float:
+    default = POOL_DEFAULTS[pool][name]
+    return type(default)(os.environ.get(f"LLM_{pool.upper()}_{name.upper()}", default))
+
+
+def create_model(pool: str):
+    """Create the underlying chat model for a pool"""
+    if LLM_PROVIDER == "fake":
+        return FakeChatModel(
+            latency=float(os.environ.get("LLM_FAKE_LATENCY", "0.05")),
+            jitter=float(os.environ.get("LLM_FAKE_JITTER", "0")),
+            error_rate=float(os.environ.get("LLM_FAKE_ERROR_RATE", "0")),
+        )
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    if not GEMINI_API_KEY:
+        print("Warning: GEMINI_API_KEY not found in environment variables.")
+
+    # Retries and timeouts are handled by LLMClient
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        google_api_key=GEMINI_API_KEY,
+        temperature=_pool_setting(pool, "temperature"),
+        max_output_tokens=int(_pool_setting(pool, "max_output_tokens")),
+        max_retries=0,
+        timeout=_pool_setting(pool, "call_timeout"),
+    )
+
+
+class LLMClient:
+    """
+    Wraps a chat model with a concurrency cap, queue-time limit, per-call
+    deadline, jittered retries and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        max_concurrency: int = 16,
+        queue_timeout: float = 2.0,
+        call_timeout: float = 30.0,
+        max_retries: int = 1,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.name = name
+        self.model = model
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def ainvoke(self, messages: List[BaseMessage], deadline: Optional[float] = None):
+        """
+        Invoke the model. `deadline` is the total time budget in seconds
+        including queueing and retries; it defaults to the pool's call timeout.
+        """
+        budget = deadline if deadline is not None else self.call_timeout
+        started = time.monotonic()
+        probe = await self._acquire(budget)
+
+        try:
+            attempt = 0
+            while True:
+                remaining = budget - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise LLMTimeout(f"LLM call in pool '{self.name}' exceeded its deadline")
+                try:
+                    result = await asyncio.wait_for(self.model.ainvoke(messages), timeout=remaining)
+                    self.breaker.record_success()
+                    probe = False
+                    return result
+                except asyncio.TimeoutError:
+                    self.breaker.record_failure()
+                    probe = False
+                    raise LLMTimeout(f"LLM call in pool '{self.name}' exceeded its deadline")
+                except Exception as e:
+                    self.breaker.record_failure()
+                    probe = False
+                    allowed = False
+                    if attempt < self.max_retries:
+                        allowed, probe = self.breaker.admit()
+                    if not allowed:
+                        raise LLMError(f"LLM call in pool '{self.name}' failed: {str(e)}") from e
+
+                # Full jitter backoff, bounded by what's left of the deadline
+                attempt += 1
+                backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                remaining = budget - (time.monotonic() - started)
+                await asyncio.sleep(max(0.0, min(backoff, remaining)))
+        finally:
+            # Cancelled or out of budget without an outcome: let the next call probe
+            if probe:
+                self.breaker.release_probe()
+            self._semaphore.release()
+
+    async def _acquire(self, budget: float) -> bool:
+        """Pass the breaker and take a concurrency slot. Returns whether this call holds the probe."""
+        allowed, probe = self.breaker.admit()
+        if not allowed:
+            raise LLMCircuitOpen(f"LLM pool '{self.name}' is shedding load")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=min(self.queue_timeout, budget))
+        except asyncio.TimeoutError:
+            # Queueing is not a provider failure; don't count it against the breaker
+            if probe:
+                self.breaker.release_probe()
+            raise LLMQueueTimeout(f"LLM pool '{self.name}' is saturated")
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        return probe
+
+    async def astream(self, messages: List[BaseMessage], deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Stream the model's reply as text chunks, under the same concurrency
+        cap, deadline and breaker as `ainvoke`. Failures are only retried
+        before the first chunk; after that the error reaches the caller.
+        """
+        budget = deadline if deadline is not None else self.call_timeout
+        started = time.monotonic()
+        probe = await self._acquire(budget)
+
+        try:
+            attempt = 0
+            while True:
+                emitted = False
+                try:
+                    chunks = self.model.astream(messages).__aiter__()
+                    while True:
+                        remaining = budget - (time.monotonic() - started)
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                        except StopAsyncIteration:
+                            break
+                        content = chunk.content if isinstance(chunk.content, str) else ""
+                        if content:
+                            emitted = True
+                            yield content
+                    self.breaker.record_success()
+                    probe = False
+                    return
+                except asyncio.TimeoutError:
+                    self.breaker.record_failure()
+                    probe = False
+                    raise LLMTimeout(f"LLM call in pool '{self.name}' exceeded its deadline")
+                except Exception as e:
+                    self.breaker.record_failure()
+                    probe = False
+                    allowed = False
+                    if not emitted and attempt < self.max_retries:
+                        allowed, probe = self.breaker.admit()
+                    if not allowed:
+                        raise LLMError(f"LLM call in pool '{self.name}' failed: {str(e)}") from e
+
+                attempt += 1
+                backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                remaining = budget - (time.monotonic() - started)
+                await asyncio.sleep(max(0.0, min(backoff, remaining)))
+        finally:
+            # The consumer went away mid-stream; give the probe back only if this call held it
+            if probe:
+                self.breaker.release_probe()
+            self._semaphore.release()
+
+_clients: Dict[str, LLMClient] = {}
+
+
+def get_llm_client(pool: str = CHAT_POOL) -> LLMClient:
+    """Return the LLM client for a pool, creating it on first use"""
+    client = _clients.get(pool)
+    if client is None:
+        client = LLMClient(
+            name=pool,
+            model=create_model(pool),
+            max_concurrency=int(_pool_setting(pool, "max_concurrency")),
+            queue_timeout=_pool_setting(pool, "queue_timeout"),
+            call_timeout=_pool_setting(pool, "call_timeout"),
+            max_retries=int(_pool_setting(pool, "max_retries")),
+        )
+        _clients[pool] = client
+    return client
+
+
+def set_llm_client(pool: str, client: LLMClient):
+    """Replace the client for a pool (e.g. with one wrapping FakeChatModel in tests)"""
+    _clients[pool] = client
+
+
+def reset_llm_clients():
+    """Drop all clients; they are recreated on next use in this process"""
+    _clients.clear()
+
+
+# Clients hold connections and event-loop bound semaphores; never share them across fork
+os.register_at_fork(after_in_child=reset_llm_clients)
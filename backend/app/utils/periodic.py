@@ -0,0 +1,50 @@
+import asyncio
+import random
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("backpacker-api.periodic")
+
+
+class PeriodicTask:
+    """
+    Runs an async function every `interval` seconds on the event loop until
+    stopped. Blocking work inside `func` should go through asyncio.to_thread.
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[None]], jitter: float = 0.1):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.jitter = jitter
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self, run_once: bool = False):
+        """Cancel the loop; with `run_once`, run the function a final time (e.g. to flush)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if run_once:
+            await self._run_once()
+
+    async def _run(self):
+        while True:
+            # Jitter keeps workers started together from hitting MongoDB in lockstep
+            await asyncio.sleep(self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+            await self._run_once()
+
+    async def _run_once(self):
+        try:
+            await self.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Periodic task {self.name} failed: {e}")
@@ -0,0 +1,58 @@
+"""
+Per-worker process pool for CPU-bound work (image resizing, route
+optimization) that would otherwise block the event loop or hold the GIL.
+
+The pool is created lazily in the process that uses it, so each API worker
+owns its own pool and a forked child never inherits the parent's.
+"""
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("backpacker-api.process-pool")
+
+# Processes per API worker
+PROCESS_POOL_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        # Spawned children don't inherit the worker's MongoDB client or event loop
+        _pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _pool_pid = os.getpid()
+        logger.info(f"Started process pool with {PROCESS_POOL_WORKERS} processes (pid {os.getpid()})")
+    return _pool
+
+
+async def run_in_process(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a picklable, module-level function in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(func, *args, **kwargs))
+
+
+def shutdown_process_pool():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+    _pool_pid = None
+
+
+def _reset_after_fork():
+    global _pool, _pool_pid
+    _pool = None
+    _pool_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
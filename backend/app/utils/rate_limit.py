@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import jwt
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+
+logger = logging.getLogger("backpacker-api.rate_limit")
+
+# Rate limiting settings
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Token bucket sizes are in cost units; a plain request costs 1
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "120"))
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", "20"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "60"))
+RATE_LIMIT_USER_RATE = float(os.environ.get("RATE_LIMIT_USER_RATE", "10"))
+RATE_LIMIT_SHARDS = int(os.environ.get("RATE_LIMIT_SHARDS", "64"))
+RATE_LIMIT_MAX_KEYS_PER_SHARD = int(os.environ.get("RATE_LIMIT_MAX_KEYS_PER_SHARD", "4096"))
+# Use X-Forwarded-For for the client address (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+
+# Load shedding settings
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "256"))
+LATENCY_TARGET_MS = float(os.environ.get("LATENCY_TARGET_MS", "1000"))
+LATENCY_SAMPLE_TTL = 5.0
+
+JWT_SECRET = os.environ.get("JWT_SECRET", "your_secret_key_here")
+JWT_ALGORITHM = "HS256"
+
+# Request priorities; lower priorities are shed first
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3
+
+# Fraction of MAX_IN_FLIGHT at which each priority starts being shed
+SHED_THRESHOLDS = {
+    PRIORITY_CRITICAL: None,
+    PRIORITY_HIGH: 1.0,
+    PRIORITY_NORMAL: 0.85,
+    PRIORITY_LOW: 0.6,
+}
+
+# (method, path prefix, cost, priority); first match wins
+ROUTE_RULES: List[Tuple[str, str, float, int]] = [
+    ("GET", "/health", 0, PRIORITY_CRITICAL),
+    ("POST", "/api/auth/login", 10, PRIORITY_HIGH),
+    ("POST", "/api/auth/register", 10, PRIORITY_HIGH),
+    # Called on every keystroke of the signup form, and answered from memory
+    ("GET", "/api/auth/availability", 0.2, PRIORITY_NORMAL),
+    ("POST", "/api/chat", 5, PRIORITY_LOW),
+    ("POST", "/api/media", 5, PRIORITY_NORMAL),
+    ("GET", "/api/travel-intents", 2, PRIORITY_NORMAL),
+    ("GET", "/api/users", 2, PRIORITY_NORMAL),
+]
+DEFAULT_COST = 1
+DEFAULT_PRIORITY = PRIORITY_NORMAL
+
+
+def match_route(method: str, path: str) -> Tuple[float, int]:
+    """Return the (cost, priority) for a request"""
+    for rule_method, prefix, cost, priority in ROUTE_RULES:
+        if method == rule_method and path.startswith(prefix):
+            return cost, priority
+    return DEFAULT_COST, DEFAULT_PRIORITY
+
+
+class BucketStore:
+    """Interface for token bucket state"""
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        """
+        Try to take `cost` tokens from the bucket `key`.
+        Returns (allowed, seconds until enough tokens are available).
+        """
+        raise NotImplementedError
+
+
+class ShardedMemoryBucketStore(BucketStore):
+    """
+    In-process token buckets spread over sharded dicts.
+    A take never awaits, so it runs atomically on the event loop without
+    locks; sharding keeps each dict small so idle-bucket sweeps are cheap.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys_per_shard: int = RATE_LIMIT_MAX_KEYS_PER_SHARD):
+        self.shards: List[Dict[str, List[float]]] = [{} for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def take_nowait(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        shard = self.shards[hash(key) % len(self.shards)]
+        now = time.monotonic()
+        bucket = shard.get(key)
+
+        if bucket is None:
+            if len(shard) >= self.max_keys_per_shard:
+                self._sweep(shard, now, capacity, rate)
+            bucket = [capacity, now]
+            shard[key] = bucket
+
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return True, 0.0
+        bucket[0] = tokens
+        return False, (cost - tokens) / rate if rate > 0 else 60.0
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        return self.take_nowait(key, cost, capacity, rate)
+
+    def _sweep(self, shard: Dict[str, List[float]], now: float, capacity: float, rate: float):
+        """Drop buckets that have refilled completely; they carry no state"""
+        idle = [k for k, (tokens, ts) in shard.items() if tokens + (now - ts) * rate >= capacity]
+        for k in idle:
+            del shard[k]
+        if len(shard) >= self.max_keys_per_shard:
+            # Still full: evict the least recently touched half
+            oldest = sorted(shard.items(), key=lambda item: item[1][1])[: len(shard) // 2]
+            for k, _ in oldest:
+                del shard[k]
+
+
+class MongoBucketStore(BucketStore):
+    """
+    Token buckets shared by all workers through a MongoDB collection.
+    Each take is a single atomic pipeline update; stale buckets expire via a
+    TTL index on `expires_at`. The collection is resolved on first use so the
+    store can be configured before worker processes connect to MongoDB.
+    """
+
+    def __init__(self, get_collection: Callable[[], Collection]):
+        self.get_collection = get_collection
+        self._indexed = False
+
+    @property
+    def collection(self) -> Collection:
+        collection = self.get_collection()
+        if not self._indexed:
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def _take_sync(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.time()
+        expires_at = datetime.utcnow() + timedelta(seconds=capacity / rate if rate > 0 else 3600)
+        refilled = {
+            "$min": [
+                capacity,
+                {"$add": [
+                    {"$ifNull": ["$tokens", capacity]},
+                    {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, rate]},
+                ]},
+            ]
+        }
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "ts": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "expires_at": expires_at,
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (cost - doc["tokens"]) / rate if rate > 0 else 60.0
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        return await asyncio.to_thread(self._take_sync, key, cost, capacity, rate)
+
+
+def get_client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def get_user_id(scope) -> Optional[str]:
+    """Extract the user id from a valid bearer token, if any"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            except jwt.PyJWTError:
+                return None
+            return payload.get("user_id")
+    return None
+
+
+class InFlightLoad:
+    """
+    Requests in flight in this worker, counted by RateLimitMiddleware.
+    Published on app.state so background jobs can back off while
+    foreground traffic is heavy.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+
+    def fraction(self) -> float:
+        """Fraction of MAX_IN_FLIGHT currently in use"""
+        return self.in_flight / MAX_IN_FLIGHT
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying per-IP and per-user token buckets weighted by
+    route cost, plus priority-based load shedding on in-flight requests and
+    observed latency.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: Optional[BucketStore] = None,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        load: Optional[InFlightLoad] = None
+    ):
+        self.app = app
+        self.store = store or ShardedMemoryBucketStore()
+        self.enabled = enabled
+        self.load = load or InFlightLoad()
+        self.latency_ewma_ms = 0.0
+        self.latency_sampled_at = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        cost, priority = match_route(scope["method"], scope["path"])
+
+        # Shed before doing any work for the request
+        if self._should_shed(priority):
+            await self._reject(send, 503, "Server is busy, please try again shortly", 1.0)
+            return
+
+        if cost > 0:
+            allowed, retry_after = await self.store.take(
+                f"ip:{get_client_ip(scope)}", cost, RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_RATE
+            )
+            user_id = get_user_id(scope) if allowed else None
+            if allowed and user_id:
+                allowed, retry_after = await self.store.take(
+                    f"user:{user_id}", cost, RATE_LIMIT_USER_BURST, RATE_LIMIT_USER_RATE
+                )
+            if not allowed:
+                await self._reject(send, 429, "Too many requests", retry_after)
+                return
+
+        self.load.in_flight += 1
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.load.in_flight -= 1
+            # Slow-by-design endpoints (LLM calls) would mask the signal
+            if priority < PRIORITY_LOW:
+                self.latency_sampled_at = time.monotonic()
+                elapsed_ms = (self.latency_sampled_at - started) * 1000
+                self.latency_ewma_ms += 0.1 * (elapsed_ms - self.latency_ewma_ms)
+
+    def _should_shed(self, priority: int) -> bool:
+        threshold = SHED_THRESHOLDS.get(priority)
+        if threshold is None:
+            return False
+        if self.load.in_flight >= MAX_IN_FLIGHT * threshold:
+            return True
+        # Latency of regular endpoints is climbing: drop low priority work
+        # before queues build up. Ignore stale samples so shedding can't latch.
+        return (
+            priority >= PRIORITY_LOW
+            and self.latency_ewma_ms > LATENCY_TARGET_MS
+            and time.monotonic() - self.latency_sampled_at < LATENCY_SAMPLE_TTL
+        )
+
+    async def _reject(self, send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
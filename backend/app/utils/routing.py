@@ -0,0 +1,155 @@
+"""
+Stop ordering for itinerary days: a path through a day's activities that
+keeps timed activities in chronological order.
+
+Distances are great-circle kilometres from a vectorized haversine matrix.
+Tours start with a constrained nearest-neighbour pass and are improved with
+2-opt, whose candidate moves for each position are evaluated as one numpy
+expression. A segment reversal is only allowed when it contains at most one
+timed activity, so the relative order of timed activities never changes.
+
+Kept free of application imports so it can run in spawned pool processes.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+MAX_TWO_OPT_PASSES = 50
+# Ignore improvements smaller than this many km (floating point noise)
+MIN_IMPROVEMENT_KM = 1e-9
+
+
+def haversine_matrix(coords: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km for an (n, 2) array of (lat, lng) degrees"""
+    radians = np.radians(coords)
+    lat = radians[:, 0:1]
+    lng = radians[:, 1:2]
+    a = np.sin((lat - lat.T) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lng - lng.T) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(dist: np.ndarray, order: Sequence[int]) -> float:
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbour(dist: np.ndarray, start: int, anchors: List[int]) -> List[int]:
+    """
+    Greedy path from `start`. Untimed stops can be visited at any point;
+    timed stops (`anchors`, in required order) only once the previous one
+    has been visited.
+    """
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    free = np.ones(n, dtype=bool)
+    free[anchors] = False
+
+    order = [start]
+    visited[start] = True
+    next_anchor = 1 if anchors and anchors[0] == start else 0
+    while len(order) < n:
+        candidates = free & ~visited
+        if next_anchor < len(anchors):
+            candidates[anchors[next_anchor]] = True
+        stop = int(np.argmin(np.where(candidates, dist[order[-1]], np.inf)))
+        if next_anchor < len(anchors) and stop == anchors[next_anchor]:
+            next_anchor += 1
+        order.append(stop)
+        visited[stop] = True
+    return order
+
+
+def two_opt(dist: np.ndarray, order: List[int], is_anchor: np.ndarray) -> List[int]:
+    """Improve an open path with 2-opt, keeping the first stop and the order of anchors"""
+    n = len(order)
+    if n < 4:
+        return order
+    # A dummy end node at distance 0 from every stop turns the open path
+    # into a cycle, so the last stop is free to change like any other
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = dist
+    tour = np.array(order + [n])
+    anchor_flags = np.append(is_anchor, False)
+
+    for _ in range(MAX_TWO_OPT_PASSES):
+        improved = False
+        for i in range(1, n - 1):
+            # Candidate moves reverse tour[i..j] for every j in i+1..n-1
+            prefix = np.concatenate(([0], np.cumsum(anchor_flags[tour])))
+            js = np.arange(i + 1, n)
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[js], tour[js + 1]
+            delta = padded[a, c] + padded[b, d] - padded[a, b] - padded[c, d]
+            # Reversing two or more anchors would swap their order
+            delta[prefix[js + 1] - prefix[i] > 1] = np.inf
+            best = int(np.argmin(delta))
+            if delta[best] < -MIN_IMPROVEMENT_KM:
+                j = js[best]
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return [int(stop) for stop in tour[:-1]]
+
+
+def solve_day(coords: Sequence[Tuple[float, float]], time_keys: Sequence[Optional[float]]) -> Tuple[List[int], float, float]:
+    """
+    Order one day's stops. `time_keys` holds each stop's start (or end)
+    timestamp, None for untimed stops. Returns (order, km before, km after).
+    """
+    n = len(coords)
+    if n == 0:
+        return [], 0.0, 0.0
+    dist = haversine_matrix(np.asarray(coords, dtype=float))
+    original = list(range(n))
+    before = path_length(dist, original)
+
+    anchors = sorted((i for i in range(n) if time_keys[i] is not None), key=lambda i: (time_keys[i], i))
+    is_anchor = np.zeros(n, dtype=bool)
+    is_anchor[anchors] = True
+
+    # Keep the user's first stop (often their accommodation) unless it is a
+    # timed stop that has to come after another one
+    start = 0 if not is_anchor[0] or anchors[0] == 0 else anchors[0]
+    order = two_opt(dist, nearest_neighbour(dist, start, anchors), is_anchor)
+    after = path_length(dist, order)
+
+    original_valid = [i for i in original if is_anchor[i]] == anchors
+    if original_valid and before <= after:
+        return original, before, before
+    return order, before, after
+
+
+def optimize_days(days: List[Tuple[List[Tuple[float, float]], List[Optional[float]]]]) -> List[Tuple[List[int], float, float]]:
+    """Solve many days; the unit of work sent to the process pool"""
+    return [solve_day(coords, time_keys) for coords, time_keys in days]
+
+
+def benchmark(days: int = 30, stops_per_day: int = 10, timed_fraction: float = 0.3, seed: int = 0):
+    """Time optimize_days on a synthetic itinerary: `python -m app.utils.routing`"""
+    import time
+    import random
+
+    rng = random.Random(seed)
+    itinerary = []
+    for _ in range(days):
+        coords = [(38.7 + rng.uniform(-0.1, 0.1), -9.14 + rng.uniform(-0.1, 0.1)) for _ in range(stops_per_day)]
+        time_keys = [float(i) if rng.random() < timed_fraction else None for i in range(stops_per_day)]
+        itinerary.append((coords, time_keys))
+
+    started = time.perf_counter()
+    results = optimize_days(itinerary)
+    elapsed = time.perf_counter() - started
+    before = sum(result[1] for result in results)
+    after = sum(result[2] for result in results)
+    print(
+        f"{days} days x {stops_per_day} stops: {elapsed * 1000:.1f} ms, "
+        f"{before:.1f} km -> {after:.1f} km ({(1 - after / before) * 100 if before else 0:.0f}% shorter)"
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark(days=30, stops_per_day=40)
+    benchmark(days=1, stops_per_day=300)
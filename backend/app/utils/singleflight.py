@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger("backpacker-api.singleflight")
+
+
+class StreamFlight:
+    """
+    One upstream text stream shared by any number of subscribers. The stream
+    is consumed by its own task, so it keeps going when a subscriber leaves;
+    every subscriber gets every chunk from the start, including late joiners.
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self, stream: AsyncIterator[str]):
+        try:
+            async for chunk in stream:
+                async with self._changed:
+                    self.chunks.append(chunk)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield the stream's chunks, re-raising its error if it failed"""
+        self.subscribers += 1
+        seen = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or len(self.chunks) > seen)
+                new, finished = self.chunks[seen:], self.done
+            seen += len(new)
+            for chunk in new:
+                yield chunk
+            if finished and seen == len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def result(self) -> str:
+        return "".join([chunk async for chunk in self.subscribe()])
+
+
+class FlightGroup:
+    """
+    Single-flight registry: concurrent callers with the same key share one
+    in-flight stream. A key is free again as soon as its stream finishes,
+    so nothing is cached beyond the flight itself.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, StreamFlight] = {}
+
+    def join(self, key: str, start: Callable[[], AsyncIterator[str]]) -> StreamFlight:
+        """Return the in-flight stream for `key`, starting it with `start()` if there is none"""
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            return flight
+
+        flight = StreamFlight()
+        self._flights[key] = flight
+
+        async def run():
+            try:
+                await flight._run(start())
+            finally:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.subscribers > 1:
+                    logger.info(f"{self.name}: {flight.subscribers} requests shared one upstream call")
+
+        # Held on the flight (which the registry holds) so the task isn't garbage collected
+        flight._task = asyncio.create_task(run(), name=f"{self.name}-flight")
+        return flight
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
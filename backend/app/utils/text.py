@@ -0,0 +1,50 @@
+import re
+import unicodedata
+from typing import Iterable, List
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents ("São Paulo" -> "sao paulo")"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def normalize_key(text: str) -> str:
+    """Normalize free text such as a destination or activity into a comparison key"""
+    if not text:
+        return ""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", fold(text))).strip()
+
+
+def normalize_destination(destination: str) -> str:
+    return normalize_key(destination)
+
+
+def normalize_keys(values: Iterable[str]) -> List[str]:
+    """Normalize a list of values, dropping empties and duplicates while keeping order"""
+    seen = set()
+    keys = []
+    for value in values or []:
+        key = normalize_key(value)
+        if key and key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
+
+
+_TOKEN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have i in is it its me my of on or our so
+that the their then there this to trip travel want we will with you
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Split free text into normalized search tokens"""
+    if not text:
+        return []
+    return [t for t in _TOKEN.findall(fold(text)) if len(t) > 1 and t not in STOPWORDS]
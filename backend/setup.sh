@@ -78,4 +78,5 @@ echo -e "1. Make sure your MongoDB Atlas cluster is accessible"
 echo -e "2. Update the .env file with your JWT secret and Gemini API key"
 echo -e "3. Activate the virtual environment: ${BOLD}source venv/bin/activate${NC}"
 echo -e "4. Run the server: ${BOLD}uvicorn app.main:app --reload${NC}"
+echo -e "   For production (one worker per core): ${BOLD}python -m app.server${NC}"
 echo -e "\nFor API documentation, visit: ${BOLD}http://localhost:8000/docs${NC}" 
\ No newline at end of file
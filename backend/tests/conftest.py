@@ -0,0 +1,96 @@
+"""
+Test fixtures.
+
+Tests run against mongomock by default; set TEST_MONGODB_URI to run them
+against a real server instead. Either way the app's database is wrapped in
+a proxy that records every collection operation, so tests can assert how
+many round trips an endpoint makes.
+"""
+import os
+
+# Configure the app before it is imported
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("GROUP_SUGGESTIONS_ENABLED", "false")
+os.environ.setdefault("JWT_SECRET", "test-secret-with-at-least-thirty-two-bytes")
+
+from typing import List, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.database import Database
+
+from app.database import ensure_collections, get_db
+from app.main import create_app
+
+# Collection methods that each send one command to the server
+OPERATIONS = {
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "find_one_and_update",
+    "find_one_and_replace", "find_one_and_delete", "bulk_write", "aggregate",
+    "count_documents", "estimated_document_count", "distinct",
+}
+
+
+class RecordingCollection:
+    def __init__(self, collection, log: List[Tuple[str, str]]):
+        self._collection = collection
+        self._log = log
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in OPERATIONS:
+            return attr
+
+        def operation(*args, **kwargs):
+            self._log.append((self._collection.name, name))
+            return attr(*args, **kwargs)
+        return operation
+
+
+class RecordingDatabase:
+    """Stands in for a pymongo Database and logs (collection, operation) pairs"""
+
+    def __init__(self, database: Database):
+        self._database = database
+        self.operations: List[Tuple[str, str]] = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if name.startswith("_") or callable(attr) and not hasattr(attr, "find_one"):
+            return attr
+        return RecordingCollection(attr, self.operations)
+
+    def __getitem__(self, name):
+        return RecordingCollection(self._database[name], self.operations)
+
+    def on(self, collection: str) -> List[str]:
+        """Operations recorded on one collection, in order"""
+        return [operation for name, operation in self.operations if name == collection]
+
+    def reset(self):
+        self.operations.clear()
+
+
+@pytest.fixture
+def database():
+    uri = os.environ.get("TEST_MONGODB_URI")
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+    database = client["backpacker_connect_test"]
+    ensure_collections(database)
+    yield RecordingDatabase(database)
+    client.drop_database("backpacker_connect_test")
+    client.close()
+
+
+@pytest.fixture
+def client(database):
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: database
+    # Not used as a context manager, so the lifespan's background jobs don't start
+    return TestClient(app)
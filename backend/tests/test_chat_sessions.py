@@ -0,0 +1,20 @@
+"""Anonymous chat sessions can't be found from another session's id"""
+from datetime import datetime
+
+from bson import ObjectId
+
+
+def test_anonymous_sessions_get_a_random_token(client):
+    session_id = client.post("/api/chat/sessions").json()["session_id"]
+
+    assert not ObjectId.is_valid(session_id)
+    assert client.get(f"/api/chat/sessions/{session_id}/turns").status_code == 200
+
+
+def test_anonymous_sessions_with_an_object_id_are_hidden(client, database):
+    session_id = database.chat_sessions.insert_one({
+        "user_id": None, "turn_count": 0, "summary": "", "summary_turns": 0,
+        "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+    }).inserted_id
+
+    assert client.get(f"/api/chat/sessions/{session_id}/turns").status_code == 404
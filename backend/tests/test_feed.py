@@ -0,0 +1,25 @@
+"""Feeds are private to their user and stay bounded as intents fan out"""
+from datetime import datetime
+
+from app.services import feed
+
+
+def test_feed_requires_a_bearer_token(client):
+    response = client.get("/api/travel-intents/feed", params={"user_id": "someone-else"})
+
+    assert response.status_code == 401
+
+
+def test_fan_out_trims_feeds(database, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_MAX_SIZE", 3)
+    database.feed_profiles.insert_one({
+        "_id": "reader", "destinations": ["lisbon"], "activities": [], "travel_styles": [], "built_at": datetime.utcnow(),
+    })
+
+    for day in range(1, 6):
+        feed.add_intent_to_feeds(database, {
+            "_id": f"intent-{day}", "user_id": "author", "destination": "Lisbon", "created_at": datetime(2026, 1, day),
+        })
+
+    remaining = [entry["intent_id"] for entry in database.intent_feeds.find({"user_id": "reader"})]
+    assert sorted(remaining) == ["intent-3", "intent-4", "intent-5"]
@@ -0,0 +1,58 @@
+"""Group suggestion re-clustering"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services import group_suggestions
+from app.services.group_suggestions import intent_buckets, recluster_bucket, sync_new_intents
+
+START = datetime(2030, 5, 13)
+
+
+def insert_intent(database, created_at=None):
+    intent = {
+        "user_id": ObjectId(),
+        "destination": "Lisbon",
+        "destination_key": "lisbon",
+        "start_date": START,
+        "end_date": START + timedelta(days=5),
+        "group_size": 4,
+        "created_at": created_at or datetime.utcnow() - timedelta(hours=1),
+    }
+    database.travel_intents.insert_one(intent)
+    return intent
+
+
+def suggested_members(database):
+    return sorted(sorted(suggestion["intent_ids"]) for suggestion in database.group_suggestions.find())
+
+
+def test_an_overlapping_recluster_leaves_only_the_newest_groups(database, monkeypatch):
+    first, second = insert_intent(database), insert_intent(database)
+    key, index = intent_buckets(first)[0]
+    form_groups = group_suggestions.form_groups
+    calls = []
+
+    def form_groups_racing(intents):
+        calls.append(len(intents))
+        if len(calls) == 1:
+            # A newer re-cluster reads the bucket after `second` leaves and a third intent arrives
+            database.travel_intents.delete_one({"_id": second["_id"]})
+            insert_intent(database)
+            recluster_bucket(database, key, index)
+        return form_groups(intents)
+    monkeypatch.setattr(group_suggestions, "form_groups", form_groups_racing)
+
+    recluster_bucket(database, key, index)
+
+    assert len(suggested_members(database)) == 1
+    assert str(second["_id"]) not in suggested_members(database)[0]
+
+
+def test_sync_leaves_intents_that_may_still_be_committing(database):
+    insert_intent(database)
+    insert_intent(database)
+    insert_intent(database, created_at=datetime.utcnow())
+
+    assert sync_new_intents(database) == 2
+    assert sync_new_intents(database) == 0
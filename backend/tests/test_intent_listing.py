@@ -0,0 +1,50 @@
+"""Destination filtering on GET /api/travel-intents"""
+from datetime import datetime
+
+from app.database import ensure_collections
+
+
+def insert_intent(collection, destination):
+    now = datetime.utcnow()
+    collection.insert_one({
+        "user_id": "u1",
+        "destination": destination,
+        "start_date": now,
+        "end_date": now,
+        "budget_range": "low",
+        "travel_style": "backpacking",
+        "group_size": 2,
+        "created_at": now,
+    })
+
+
+def test_destination_matches_substrings_ignoring_case_and_accents(client, database):
+    insert_intent(database.travel_intents, "São Paulo")
+    insert_intent(database.travel_intents, "Lisbon")
+    # Written before destination_key existed; filled in at startup
+    ensure_collections(database)
+
+    for query in ("paulo", "SAO", "São Pau"):
+        response = client.get("/api/travel-intents", params={"destination": query})
+        assert [intent["destination"] for intent in response.json()] == ["São Paulo"]
+
+
+def test_startup_backfills_archived_intents(database):
+    insert_intent(database.travel_intents_archive, "Kraków")
+
+    ensure_collections(database)
+
+    assert database.travel_intents_archive.find_one()["destination_key"] == "krakow"
+
+
+def test_backfill_is_left_to_the_worker_holding_the_lease(database):
+    insert_intent(database.travel_intents, "Kraków")
+    database.job_leases.update_one(
+        {"_id": "backfill-destination-keys"},
+        {"$set": {"owner": "other-host:1", "expires_at": datetime(2100, 1, 1)}},
+        upsert=True
+    )
+
+    ensure_collections(database)
+
+    assert "destination_key" not in database.travel_intents.find_one()
@@ -0,0 +1,59 @@
+"""Uploads can't be turned into pages served from the API origin"""
+import pytest
+
+from app.services.storage import LocalObjectStore, set_object_store
+
+
+@pytest.fixture
+def auth(client, tmp_path):
+    set_object_store(LocalObjectStore(str(tmp_path)))
+    token = client.post("/api/auth/register", json={
+        "name": "Alice",
+        "username": "alice",
+        "email": "alice@example.com",
+        "password": "correct-horse",
+    }).json()["token"]
+    yield {"Authorization": f"Bearer {token}"}
+    set_object_store(None)
+
+
+def upload(client, auth, content_type, body=b"data", filename=None):
+    params = {"filename": filename} if filename else None
+    return client.post("/api/media", content=body, params=params, headers={**auth, "Content-Type": content_type})
+
+
+@pytest.mark.parametrize("content_type", ["text/html", "image/svg+xml", "application/javascript"])
+def test_active_content_is_rejected(client, auth, content_type):
+    response = upload(client, auth, content_type, b"<script>alert(1)</script>")
+
+    assert response.status_code == 415
+
+
+def test_images_are_served_inline(client, auth):
+    media_id = upload(client, auth, "image/png", b"\x89PNG\r\n\x1a\n").json()["id"]
+
+    response = client.get(f"/api/media/{media_id}")
+
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["content-disposition"] == "inline"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+
+def test_other_types_are_served_as_attachments(client, auth):
+    media_id = upload(client, auth, "text/plain", b"packing list", filename="list.txt").json()["id"]
+
+    response = client.get(f"/api/media/{media_id}")
+
+    assert response.headers["content-disposition"] == "attachment; filename*=UTF-8''list.txt"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+
+def test_blob_type_comes_from_the_content(client, auth, database):
+    upload(client, auth, "text/plain", b"\x89PNG\r\n\x1a\n")
+    media_id = upload(client, auth, "image/png", b"\x89PNG\r\n\x1a\n").json()["id"]
+
+    blob = database.media_blobs.find_one()
+
+    assert database.media_blobs.count_documents({}) == 1
+    assert blob["content_type"] == "image/png"
+    assert client.get(f"/api/media/{media_id}").headers["content-type"] == "image/png"
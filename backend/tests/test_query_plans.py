@@ -0,0 +1,369 @@
+"""
+Query-plan regression checks.
+
+Seeds a scratch database with synthetic data, creates the API's indexes
+with `ensure_collections`, and runs `explain` on each query shape the
+routers and background jobs issue. A shape fails when its winning plan
+contains a COLLSCAN or an in-memory SORT, or when it examines more than
+`max_ratio` documents per document returned.
+
+Needs a real MongoDB (mongomock has no `explain`), so it only runs when
+TEST_MONGODB_URI is set. QUERY_PLAN_INTENTS sets the number of synthetic
+intents (default 100000). When adding a query to a router or job, add its
+shape to SHAPES; a shape with a known problem is marked xfail with the
+reason rather than left out.
+"""
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import pytest
+from bson import ObjectId
+
+from app.database import ensure_collections
+from app.services.archival import ARCHIVE_COLLECTION, expired_filter
+from app.services.rollups import ROLLUP_COLLECTION, month_key, month_range, rollup_id
+from app.utils.mongo import SYNC_PAGE_SIZE, after_cursor, since_watermark
+from app.utils.text import normalize_destination
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_MONGODB_URI"), reason="query plans need a real MongoDB (TEST_MONGODB_URI)"
+)
+
+INTENTS = int(os.environ.get("QUERY_PLAN_INTENTS", "100000"))
+SEED_BATCH = 10000
+DEFAULT_MAX_RATIO = 2.0
+
+CITIES = [
+    "Lisbon", "Porto", "Madrid", "Barcelona", "Seville", "Paris", "Lyon", "Rome", "Florence", "Naples",
+    "Berlin", "Munich", "Prague", "Vienna", "Budapest", "Krakow", "Athens", "Istanbul", "Cairo", "Marrakech",
+    "Bangkok", "Chiang Mai", "Hanoi", "Ho Chi Minh City", "Bali", "Tokyo", "Kyoto", "Seoul", "Sydney", "Auckland",
+    "Lima", "Cusco", "La Paz", "Buenos Aires", "Rio de Janeiro", "Mexico City", "Oaxaca", "Havana", "New York", "Vancouver",
+]
+ACTIVITIES = ["hiking", "surfing", "food", "museums", "nightlife", "diving", "photography", "climbing", "yoga", "markets"]
+STYLES = ["budget", "backpacking", "comfort", "luxury", "adventure"]
+
+# Values the shapes query for; the seed makes sure they exist
+NOW = datetime.utcnow()
+USER_ID = ObjectId()
+INTENT_IDS = [ObjectId() for _ in range(20)]
+INTENT_ID = INTENT_IDS[0]
+SESSION_ID = "anonymous-session-token"
+BLOB_KEY = "0" * 64
+MEDIA_ID = ObjectId()
+CURSOR_CREATED = NOW - timedelta(days=182)
+CURSOR_ID = ObjectId("f" * 24)
+MONTHS = month_range(month_key(NOW), 3)
+NEWEST = {"created_at": -1, "_id": -1}
+SYNC_ORDER = {"created_at": 1, "_id": 1}
+RECOUNT = {"destination_key": "lisbon", "start_date": {"$gte": datetime(NOW.year, NOW.month, 1), "$lt": datetime(NOW.year, NOW.month, 1) + timedelta(days=31)}}
+
+
+@dataclass
+class QueryShape:
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Dict[str, int]] = None
+    limit: int = 0
+    projection: Optional[Dict[str, Any]] = None
+    max_ratio: float = DEFAULT_MAX_RATIO
+    # Aggregation shapes set a pipeline instead of filter/sort/limit
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+
+def listing_with_archive(filter_query: Dict[str, Any], limit: int = 20) -> List[Dict[str, Any]]:
+    """The include_archived listing pipeline from the travel_intents router"""
+    window = [{"$match": filter_query}, {"$sort": NEWEST}, {"$limit": limit}]
+    return window + [
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": window}},
+        {"$sort": NEWEST},
+        {"$limit": limit},
+    ]
+
+
+def known_problem(shape: QueryShape, reason: str):
+    return pytest.param(shape, id=shape.name, marks=pytest.mark.xfail(reason=reason, strict=True))
+
+
+def shape_param(shape: QueryShape):
+    return pytest.param(shape, id=shape.name)
+
+
+SHAPES = [shape_param(shape) for shape in [
+    # travel_intents router
+    QueryShape("intents: newest", "travel_intents", {}, NEWEST, 20),
+    QueryShape("intents: by author", "travel_intents", {"user_id": USER_ID}, NEWEST, 20),
+    QueryShape("intents: next page by cursor", "travel_intents", {"$or": [
+        {"created_at": {"$lt": CURSOR_CREATED}},
+        {"created_at": CURSOR_CREATED, "_id": {"$lt": CURSOR_ID}},
+    ]}, NEWEST, 20),
+    # About half of all intents start after now, so a few extra fetches are expected
+    QueryShape("intents: starting after", "travel_intents", {"start_date": {"$gte": NOW}}, NEWEST, 20, max_ratio=4),
+    QueryShape("intents: by id", "travel_intents", {"_id": INTENT_ID}, limit=1),
+    QueryShape("intents: search hydration", "travel_intents", {"_id": {"$in": INTENT_IDS}}),
+    # Each collection contributes up to `limit` documents to the merge
+    QueryShape("intents: newest with archive", "travel_intents", {}, pipeline=listing_with_archive({})),
+    QueryShape("intents: by author with archive", "travel_intents", {}, pipeline=listing_with_archive({"user_id": USER_ID})),
+    QueryShape("interests: users for an intent", "intent_interests", {"intent_id": INTENT_ID}, {"_id": -1}, 20),
+    QueryShape("interests: intents for a user", "intent_interests", {"user_id": str(USER_ID)}, {"_id": -1}, 200),
+    QueryShape("interests: one", "intent_interests", {"intent_id": INTENT_ID, "user_id": str(USER_ID)}, limit=1),
+    QueryShape("feed: page", "intent_feeds", {"user_id": str(USER_ID)}, {"score": -1, "intent_id": -1}, 20),
+    # users and auth routers
+    QueryShape("users: by email", "users", {"email": "user1@example.com"}, limit=1),
+    QueryShape("users: by username", "users", {"username": "user1"}, limit=1),
+    QueryShape("users: batch", "users", {"_id": {"$in": [USER_ID]}}),
+    # stats router; trending reads every destination's rollups for the months to rank them
+    QueryShape("rollups: trending", ROLLUP_COLLECTION, {}, max_ratio=len(CITIES), pipeline=[
+        {"$match": {"month": {"$in": MONTHS}, "intent_count": {"$gt": 0}}},
+        {"$group": {"_id": "$destination_key", "intent_count": {"$sum": "$intent_count"}}},
+        {"$sort": {"intent_count": -1, "_id": 1}},
+        {"$limit": 10},
+    ]),
+    QueryShape("rollups: destination months", ROLLUP_COLLECTION, {"_id": {"$in": [rollup_id("lisbon", month) for month in MONTHS]}}),
+    # chat router
+    QueryShape("chat: session", "chat_sessions", {"_id": SESSION_ID}, limit=1),
+    QueryShape("chat: session window", "chat_turns", {"session_id": SESSION_ID, "seq": {"$lt": 100}}, {"seq": -1}, 50),
+    QueryShape("chat: turns page", "chat_turns", {"session_id": SESSION_ID, "seq": {"$gte": 60, "$lt": 80}}, {"seq": 1}),
+    # media router
+    QueryShape("media: by id", "media", {"_id": MEDIA_ID}, limit=1),
+    QueryShape("media: blob", "media_blobs", {"_id": BLOB_KEY}, limit=1),
+    # group suggestions
+    QueryShape("groups: by intent", "group_suggestions", {"intent_ids": str(INTENT_ID)}, {"score": -1}, 20),
+    QueryShape("groups: by destination", "group_suggestions", {"destination_key": "lisbon"}, {"score": -1}, 20),
+    QueryShape("groups: bucket", "travel_intents", {
+        "destination_key": "lisbon",
+        "start_date": {"$gte": NOW, "$lt": NOW + timedelta(days=14)},
+        "group_id": None,
+        "is_active": {"$ne": False},
+    }, {"start_date": 1}, 500),
+    # itineraries
+    QueryShape("geocode: lookup", "geocode_cache", {"_id": {"$in": ["lisbon", "porto"]}}),
+    # Background jobs
+    QueryShape("archival: expired batch", "travel_intents", expired_filter(NOW), limit=500),
+    QueryShape("feed: fan-out profiles", "feed_profiles", {"$or": [
+        {"destinations": "lisbon"}, {"activities": {"$in": ["surfing", "food"]}}, {"travel_styles": "budget"},
+    ]}),
+    QueryShape("search: intents since watermark", "travel_intents", since_watermark(NOW - timedelta(minutes=5)), SYNC_ORDER, SYNC_PAGE_SIZE),
+    QueryShape("search: next page since watermark", "travel_intents", {"$and": [
+        since_watermark(NOW - timedelta(minutes=5)), after_cursor(NOW - timedelta(minutes=4), CURSOR_ID),
+    ]}, SYNC_ORDER, SYNC_PAGE_SIZE),
+    QueryShape("groups: intents after cursor", "travel_intents", {"$and": [
+        {"created_at": {"$lt": NOW - timedelta(minutes=2)}}, after_cursor(NOW - timedelta(minutes=5), CURSOR_ID),
+    ]}, SYNC_ORDER, 1000),
+    QueryShape("availability: users since watermark", "users", since_watermark(NOW - timedelta(minutes=5)), SYNC_ORDER, SYNC_PAGE_SIZE),
+    QueryShape("availability: next page since watermark", "users", {"$and": [
+        since_watermark(NOW - timedelta(minutes=5)), after_cursor(NOW - timedelta(minutes=4), CURSOR_ID),
+    ]}, SYNC_ORDER, SYNC_PAGE_SIZE),
+    QueryShape("rollups: updated during backfill", ROLLUP_COLLECTION, {"updated_at": {"$gte": NOW}}, projection={"_id": 1}),
+    QueryShape("rollups: archived during backfill", ARCHIVE_COLLECTION, {"archived_at": {"$gte": NOW}}),
+    # The recount's $match, on both collections
+    QueryShape("rollups: recount", "travel_intents", RECOUNT),
+    QueryShape("rollups: recount archived", ARCHIVE_COLLECTION, RECOUNT),
+]] + [
+    known_problem(
+        QueryShape("intents: destination substring", "travel_intents", {"destination_key": {"$regex": "isbo"}}, NEWEST, 20),
+        "an unanchored regex can't use index bounds: every destination_key is scanned, then sorted in memory",
+    ),
+]
+
+
+def _batches(docs: Iterator[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == SEED_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(db, intents: int, rng: random.Random):
+    """Fill the collections the shapes read with synthetic data"""
+    user_ids = [USER_ID] + [ObjectId() for _ in range(max(intents // 10, 10))]
+    intent_ids = INTENT_IDS + [ObjectId() for _ in range(2000 - len(INTENT_IDS))]
+
+    def users():
+        for i, user_id in enumerate(user_ids):
+            yield {
+                "_id": user_id, "name": f"User {i}", "username": f"user{i}", "email": f"user{i}@example.com",
+                "created_at": NOW - timedelta(seconds=rng.randint(0, 365 * 86400)), "version": 1,
+            }
+
+    def travel_intents():
+        """(collection, intent) pairs; every tenth intent is archived"""
+        for i in range(intents):
+            destination = rng.choice(CITIES)
+            start = NOW + timedelta(days=rng.randint(-60, 365))
+            intent = {
+                "user_id": rng.choice(user_ids),
+                "destination": destination,
+                "destination_key": normalize_destination(destination),
+                "start_date": start,
+                "end_date": start + timedelta(days=rng.randint(1, 21)),
+                "budget_range": rng.choice(["low", "medium", "high"]),
+                "travel_style": rng.choice(STYLES),
+                "group_size": rng.randint(2, 6),
+                "activities": rng.sample(ACTIVITIES, 3),
+                "created_at": NOW - timedelta(seconds=rng.randint(0, 365 * 86400)),
+                "version": 1,
+                "interested_users_count": 0,
+            }
+            if i < len(intent_ids):
+                intent["_id"] = intent_ids[i]
+                yield "travel_intents", intent
+            else:
+                yield ARCHIVE_COLLECTION if i % 10 == 0 else "travel_intents", intent
+
+    def interests():
+        for intent_id in intent_ids:
+            for user_id in [USER_ID] + rng.sample(user_ids[1:], 4):
+                yield {"intent_id": intent_id, "user_id": str(user_id), "created_at": NOW}
+
+    def feed_entries():
+        for user_id in user_ids[:100]:
+            for intent_id in rng.sample(intent_ids, 500):
+                yield {"user_id": str(user_id), "intent_id": str(intent_id), "score": rng.random() * 1000, "intent": {}}
+
+    def feed_profiles():
+        for user_id in user_ids:
+            yield {
+                "_id": str(user_id),
+                "destinations": [normalize_destination(city) for city in rng.sample(CITIES, 3)],
+                "activities": rng.sample(ACTIVITIES, 3),
+                "travel_styles": [rng.choice(STYLES)],
+                "built_at": NOW,
+            }
+
+    session_ids = [SESSION_ID] + [f"session-{i}" for i in range(199)]
+
+    def chat_sessions():
+        for session_id in session_ids:
+            yield {"_id": session_id, "user_id": None, "turn_count": 100, "created_at": NOW, "updated_at": NOW}
+        for user_id in user_ids[:200]:
+            yield {"user_id": str(user_id), "turn_count": 0, "created_at": NOW, "updated_at": NOW}
+
+    def chat_turns():
+        for session_id in session_ids:
+            for seq in range(100):
+                yield {"session_id": session_id, "seq": seq, "user": "question", "assistant": "answer", "created_at": NOW}
+
+    def suggestions():
+        for i in range(0, len(intent_ids) - 1, 2):
+            yield {
+                "bucket": f"{normalize_destination(rng.choice(CITIES))}|{i % 50}",
+                "destination_key": normalize_destination(rng.choice(CITIES)),
+                "intent_ids": [str(intent_ids[i]), str(intent_ids[i + 1])],
+                "user_ids": [str(user_id) for user_id in rng.sample(user_ids, 2)],
+                "score": rng.random() * 3,
+            }
+
+    def rollups():
+        for city in CITIES:
+            key = normalize_destination(city)
+            for month in month_range(month_key(NOW - timedelta(days=365)), 36):
+                yield {
+                    "_id": rollup_id(key, month), "destination_key": key, "destination": city, "month": month,
+                    "intent_count": rng.randint(0, 500), "traveler_count": rng.randint(0, 2000),
+                }
+
+    def blobs():
+        yield {"_id": BLOB_KEY, "size": 1, "content_type": "image/png", "thumbnails": {}, "created_at": NOW}
+        for i in range(1, 1000):
+            yield {"_id": f"{i:064x}", "size": 1, "content_type": "image/png", "thumbnails": {}, "created_at": NOW}
+
+    def media():
+        yield {"_id": MEDIA_ID, "owner_id": str(USER_ID), "sha256": BLOB_KEY, "content_type": "image/png", "created_at": NOW}
+        for i in range(1, 1000):
+            yield {"owner_id": str(rng.choice(user_ids)), "sha256": f"{i:064x}", "content_type": "image/png", "created_at": NOW}
+
+    for batch in _batches(users()):
+        db.users.insert_many(batch)
+    for batch in _batches(travel_intents()):
+        for collection in ("travel_intents", ARCHIVE_COLLECTION):
+            docs = [intent for name, intent in batch if name == collection]
+            if docs:
+                db[collection].insert_many(docs)
+
+    for collection, docs in [
+        ("intent_interests", interests()),
+        ("intent_feeds", feed_entries()),
+        ("feed_profiles", feed_profiles()),
+        ("chat_sessions", chat_sessions()),
+        ("chat_turns", chat_turns()),
+        ("group_suggestions", suggestions()),
+        (ROLLUP_COLLECTION, rollups()),
+        ("media_blobs", blobs()),
+        ("media", media()),
+    ]:
+        for batch in _batches(docs):
+            db[collection].insert_many(batch, ordered=False)
+    db.geocode_cache.insert_many([{"_id": normalize_destination(city), "lat": 0.0, "lng": 0.0} for city in CITIES])
+
+
+@pytest.fixture(scope="module")
+def plan_db():
+    from pymongo import MongoClient
+
+    client = MongoClient(os.environ["TEST_MONGODB_URI"], serverSelectionTimeoutMS=5000)
+    name = "backpacker_connect_query_plans"
+    client.drop_database(name)
+    db = client[name]
+    ensure_collections(db)
+    seed(db, INTENTS, random.Random(0))
+    yield db
+    client.drop_database(name)
+    client.close()
+
+
+# Plans the planner tried and rejected don't describe what runs
+SKIPPED_KEYS = {"rejectedPlans", "allPlansExecution"}
+
+
+def _walk(explained: Any, key: str) -> Iterator[Any]:
+    if isinstance(explained, dict):
+        if key in explained:
+            yield explained[key]
+        for name, value in explained.items():
+            if name not in SKIPPED_KEYS:
+                yield from _walk(value, key)
+    elif isinstance(explained, list):
+        for value in explained:
+            yield from _walk(value, key)
+
+
+def explain(db, shape: QueryShape) -> Dict[str, Any]:
+    if shape.pipeline is not None:
+        command: Dict[str, Any] = {"aggregate": shape.collection, "pipeline": shape.pipeline, "cursor": {}}
+        returned = len(list(db[shape.collection].aggregate(shape.pipeline)))
+    else:
+        command = {"find": shape.collection, "filter": shape.filter}
+        if shape.sort:
+            command["sort"] = shape.sort
+        if shape.limit:
+            command["limit"] = shape.limit
+        if shape.projection:
+            command["projection"] = shape.projection
+        returned = None
+    explained = db.command({"explain": command, "verbosity": "executionStats"})
+    if returned is None:
+        returned = explained["executionStats"]["nReturned"]
+    return {
+        "stages": set(_walk(explained, "stage")),
+        "returned": returned,
+        # A $unionWith explains each collection's cursor separately
+        "docs_examined": sum(_walk(explained, "totalDocsExamined")),
+    }
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_query_uses_an_index(plan_db, shape):
+    result = explain(plan_db, shape)
+
+    assert "COLLSCAN" not in result["stages"], "collection scan"
+    assert "SORT" not in result["stages"], "in-memory sort"
+    ratio = result["docs_examined"] / max(result["returned"], 1)
+    assert ratio <= shape.max_ratio, f"examined {ratio:.1f} docs per returned doc (max {shape.max_ratio})"
@@ -0,0 +1,48 @@
+"""Rebuilding the destination rollups while intents keep being written"""
+from datetime import datetime
+
+from app.services import rollups
+from app.services.rollups import ROLLUP_COLLECTION, backfill_rollups, rollup_id, update_rollups
+
+
+def insert_intent(database, group_size=2):
+    intent = {
+        "user_id": "u1",
+        "destination": "Lisbon",
+        "destination_key": "lisbon",
+        "start_date": datetime(2030, 5, 10),
+        "end_date": datetime(2030, 5, 15),
+        "budget_range": "low",
+        "travel_style": "backpacking",
+        "group_size": group_size,
+        "created_at": datetime.utcnow(),
+    }
+    database.travel_intents.insert_one(intent)
+    update_rollups(database, None, intent)
+    return intent
+
+
+def test_backfill_keeps_intents_written_during_the_scan(database, monkeypatch):
+    insert_intent(database)
+    database[ROLLUP_COLLECTION].update_one({"_id": rollup_id("lisbon", "2030-05")}, {"$set": {"intent_count": 40}})
+    scan = rollups.scan_totals
+
+    def scan_then_write(db):
+        totals = scan(db)
+        insert_intent(database, group_size=3)
+        return totals
+    monkeypatch.setattr(rollups, "scan_totals", scan_then_write)
+
+    backfill_rollups(database, settle_seconds=0)
+
+    rollup = database[ROLLUP_COLLECTION].find_one({"_id": rollup_id("lisbon", "2030-05")})
+    assert (rollup["intent_count"], rollup["traveler_count"]) == (2, 5)
+
+
+def test_backfill_removes_rollups_without_intents(database):
+    insert_intent(database)
+    database[ROLLUP_COLLECTION].insert_one({"_id": rollup_id("porto", "2030-05"), "intent_count": 1, "traveler_count": 1})
+
+    backfill_rollups(database, settle_seconds=0)
+
+    assert [rollup["_id"] for rollup in database[ROLLUP_COLLECTION].find()] == [rollup_id("lisbon", "2030-05")]
@@ -0,0 +1,20 @@
+"""Search index catch-up"""
+import asyncio
+from datetime import datetime
+
+from app.services import search
+from app.utils import mongo
+
+
+def test_sync_pages_past_a_full_overlap_window(database, monkeypatch):
+    now = datetime(2030, 1, 1)
+    database.travel_intents.insert_many([{"destination": f"city{i}", "created_at": now} for i in range(25)])
+    index = search.SearchIndex()
+    index.synced_at = now
+    monkeypatch.setattr(search, "_index", index)
+    monkeypatch.setattr(search, "SYNC_PAGE_SIZE", 10)
+    monkeypatch.setattr(search, "sync_page", lambda *args: mongo.sync_page(*args, limit=10))
+
+    asyncio.run(search.sync_search_index(database))
+
+    assert all(index.search(f"city{i}") for i in range(25))
@@ -0,0 +1,73 @@
+"""Write endpoints answer from the document they wrote, in one round trip"""
+import os
+from datetime import datetime, timedelta
+
+
+def register(client, username="alice", email="alice@example.com"):
+    return client.post("/api/auth/register", json={
+        "name": "Alice",
+        "username": username,
+        "email": email,
+        "password": "correct-horse",
+    })
+
+
+def test_register_is_one_insert(client, database):
+    response = register(client)
+
+    assert response.status_code == 200
+    assert response.json()["user"]["username"] == "alice"
+    assert "password" not in response.json()["user"]
+    assert database.on("users") == ["insert_one"]
+
+
+def test_register_duplicates_come_from_unique_indexes(client, database):
+    register(client)
+    database.reset()
+
+    taken_username = register(client, email="other@example.com")
+    taken_email = register(client, username="other")
+
+    assert taken_username.status_code == 400
+    assert taken_email.status_code == 400
+    assert database.on("users") == ["insert_one", "insert_one"]
+    if os.environ.get("TEST_MONGODB_URI"):
+        # mongomock's duplicate key errors don't say which index was violated
+        assert taken_username.json()["detail"] == "Username already taken"
+        assert taken_email.json()["detail"] == "Email already registered"
+
+
+def test_create_intent_is_one_insert(client, database):
+    start = datetime.utcnow() + timedelta(days=30)
+    response = client.post("/api/travel-intents", json={
+        "user_id": "5f0000000000000000000001",
+        "destination": "Lisbon",
+        "start_date": start.isoformat(),
+        "end_date": (start + timedelta(days=5)).isoformat(),
+        "budget_range": "medium",
+        "travel_style": "backpacking",
+        "group_size": 3,
+    })
+
+    assert response.status_code == 200
+    assert response.json()["destination"] == "Lisbon"
+    assert response.json()["id"]
+    assert database.on("travel_intents") == ["insert_one"]
+
+
+def test_update_profile_is_one_find_one_and_update(client, database):
+    user_id = register(client).json()["user"]["id"]
+    database.reset()
+
+    response = client.put(f"/api/users/{user_id}/profile", json={"bio": "Surfing my way south"})
+
+    assert response.status_code == 200
+    assert response.json()["bio"] == "Surfing my way south"
+    assert database.on("users") == ["find_one_and_update"]
+
+
+def test_update_unknown_profile_is_404(client, database):
+    response = client.put("/api/users/5f0000000000000000000099/profile", json={"bio": "x"})
+
+    assert response.status_code == 404
+    assert database.on("users") == ["find_one_and_update"]